@@ -1,11 +1,11 @@
 from flask import Flask, request, abort
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
-from linebot.models import MessageEvent, TextMessage, TextSendMessage, ImageSendMessage
+from linebot.models import MessageEvent, TextMessage, TextSendMessage
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
 import pytz
-from line_bot_oil.line_bot_oil_v1 import get_oil_price, get_trend_image, send_push_notification
+from line_bot_oil.line_bot_oil_v1 import oil_price_reply, add_subscriber, remove_subscriber, send_push_notification, run_if_leader, scheduler_elector
 import os
 import logging
 
@@ -21,13 +21,16 @@ handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET'))
 
 # 設定排程器
 def init_scheduler():
+    # 多個 worker 都會啟動排程器，只有取得 leader 租約的程序會執行推播
+    scheduler_elector.start()
+
     logger.info("開始設定排程器...")
     scheduler = BackgroundScheduler(timezone='Asia/Singapore')
     logger.info("排程器時區設定為：Asia/Singapore")
 
     # 測試用：每分鐘執行一次
     scheduler.add_job(
-        send_push_notification,
+        run_if_leader(send_push_notification),
         'interval',
         minutes=1,
         id='oil_price_notification',
@@ -49,7 +52,7 @@ init_scheduler()
 def callback():
     signature = request.headers['X-Line-Signature']
     body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+    logger.debug("Request body: " + body)
     try:
         handler.handle(body, signature)
     except InvalidSignatureError:
@@ -59,40 +62,23 @@ def callback():
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
     if event.message.text == "油價":
-        oil_price = get_oil_price()
-        trend_image_url = get_trend_image()
-        line_bot_api.reply_message(
-            event.reply_token,
-            [
-                TextSendMessage(text=oil_price),
-                ImageSendMessage(
-                    original_content_url=trend_image_url,
-                    preview_image_url=trend_image_url
-                )
-            ]
-        )
+        # 本週油價與趨勢圖同時取得，回覆延遲為較慢的一項而不是兩者相加
+        line_bot_api.reply_message(event.reply_token, oil_price_reply())
     elif event.message.text == "訂閱":
-        user_id = event.source.user_id
-        with open('subscribed_users.txt', 'a') as f:
-            f.write(f"{user_id}\n")
+        # 與主程式共用 SQLite 訂閱資料庫（舊的 subscribed_users.txt 已匯入後停用）
+        add_subscriber(event.source.user_id)
         line_bot_api.reply_message(
             event.reply_token,
             TextSendMessage(text="您已成功訂閱油價推播！")
         )
     elif event.message.text == "取消訂閱":
-        user_id = event.source.user_id
-        with open('subscribed_users.txt', 'r') as f:
-            users = f.readlines()
-        with open('subscribed_users.txt', 'w') as f:
-            for user in users:
-                if user.strip() != user_id:
-                    f.write(user)
+        remove_subscriber(event.source.user_id)
         line_bot_api.reply_message(
             event.reply_token,
             TextSendMessage(text="您已取消訂閱油價推播。")
         )
     elif event.message.text == "測試推播":
-        send_push_notification()
+        send_push_notification(force=True)
         line_bot_api.reply_message(
             event.reply_token,
             TextSendMessage(text="已發送測試推播！")
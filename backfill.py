@@ -0,0 +1,262 @@
+"""
+批次匯入歷史油價：將封存的中油歷史油價頁面（.html / .aspx）與 JSON 資料
+（{民國日期: {油品: 價格}} 或 pieSeries 陣列）匯入本地油價資料庫。
+
+檔案以程序池平行解析，依民國日期與油品去除重複，最後在一次寫入中合併到資料庫。
+ARCHIVE 可以是檔案、目錄（遞迴搜尋）或 tar 壓縮檔（.tar / .tar.gz / .tgz）。
+
+用法：python backfill.py ARCHIVE [ARCHIVE ...] [--store price_history.npy] [--workers N]
+"""
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+
+logger = logging.getLogger(__name__)
+
+PAGE_SUFFIXES = ('.html', '.htm', '.aspx')
+JSON_SUFFIXES = ('.json',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+
+
+def is_archive_entry(name):
+    return name.lower().endswith(PAGE_SUFFIXES + JSON_SUFFIXES)
+
+
+def iter_sources(paths):
+    """
+    逐一產生 (名稱, 路徑或內容)：一般檔案只傳路徑，由子程序自行讀取；
+    tar 壓縮檔則在主程序依序讀出內容（壓縮檔無法有效率地隨機存取）。
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                for name in sorted(files):
+                    if is_archive_entry(name):
+                        full_path = os.path.join(directory, name)
+                        yield full_path, full_path
+        elif path.lower().endswith(TAR_SUFFIXES):
+            with tarfile.open(path) as tar:
+                for member in tar:
+                    if member.isfile() and is_archive_entry(member.name):
+                        yield f"{path}:{member.name}", tar.extractfile(member).read()
+        else:
+            yield path, path
+
+
+def count_sources(paths):
+    """計算要解析的檔案數（用於顯示進度）。"""
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            total += sum(1 for _, _, files in os.walk(path) for name in files if is_archive_entry(name))
+        elif path.lower().endswith(TAR_SUFFIXES):
+            with tarfile.open(path) as tar:
+                total += sum(1 for member in tar if member.isfile() and is_archive_entry(member.name))
+        else:
+            total += 1
+    return total
+
+
+# ---- 以下在解析子程序中執行 ----
+
+def normalize_dated_prices(data):
+    """
+    檢查 {民國日期: {油品: 價格}} 的格式：日期必須是民國日期、價格轉為 float，
+    只保留資料庫支援的油品（FUEL_TYPES）。格式或數值錯誤時拋出 ValueError，該檔案記為失敗。
+    """
+    from price_store import FUEL_TYPES, roc_to_ordinal
+
+    if not isinstance(data, dict):
+        raise ValueError("資料格式應為 {民國日期: {油品: 價格}} 或 pieSeries 陣列")
+    normalized = {}
+    for roc_date, prices in data.items():
+        try:
+            roc_to_ordinal(roc_date)
+        except (AttributeError, TypeError, ValueError):
+            raise ValueError(f"無效的民國日期：{roc_date!r}")
+        if not isinstance(prices, dict):
+            raise ValueError(f"{roc_date} 的價格應為 {{油品: 價格}}")
+        row = {}
+        for fuel, price in prices.items():
+            if fuel not in FUEL_TYPES or price is None:
+                continue
+            try:
+                value = float(price)
+            except (TypeError, ValueError):
+                raise ValueError(f"{roc_date} {fuel} 的價格不是數字：{price!r}")
+            if not math.isfinite(value):
+                raise ValueError(f"{roc_date} {fuel} 的價格不是有效數字：{price!r}")
+            row[fuel] = value
+        if row:
+            normalized[roc_date] = row
+    return normalized
+
+
+def parse_source(source):
+    """解析單一檔案，回傳 (名稱, {民國日期: {油品: 價格}} 或 None, 位元組數, 錯誤訊息)。"""
+    from cpc_extract import extract_pie_series, pie_series_to_dated_prices
+
+    name, content = source
+    try:
+        if isinstance(content, str):
+            with open(content, 'rb') as f:
+                content = f.read()
+        if name.lower().endswith(JSON_SUFFIXES):
+            data = json.loads(content)
+            dated_oil_prices = pie_series_to_dated_prices(data) if isinstance(data, list) else data
+        else:
+            series = extract_pie_series(content)
+            if series is None:
+                return name, None, len(content), "找不到 pieSeries"
+            dated_oil_prices = pie_series_to_dated_prices(series)
+        return name, normalize_dated_prices(dated_oil_prices), len(content), None
+    except Exception as e:
+        return name, None, 0, str(e)
+
+
+# ---- 以下在主程序中執行 ----
+
+class PriceMerger:
+    """依 (民國日期, 油品) 去除重複；同一格有不同價格時以較晚處理的檔案為準並記錄衝突。"""
+
+    def __init__(self):
+        self.prices = {}
+        self.values = 0
+        self.duplicates = 0
+        self.conflicts = 0
+
+    def add(self, dated_oil_prices):
+        for roc_date, prices in dated_oil_prices.items():
+            merged = self.prices.setdefault(roc_date, {})
+            for fuel, price in prices.items():
+                if price is None:
+                    continue
+                self.values += 1
+                current = merged.get(fuel)
+                if current is None:
+                    merged[fuel] = float(price)
+                elif current == float(price):
+                    self.duplicates += 1
+                else:
+                    self.conflicts += 1
+                    merged[fuel] = float(price)
+
+
+def backfill(paths, store, workers=None, chunk_size=8, progress=None):
+    """
+    解析 paths 中所有封存檔並一次寫入 store（PriceStore），回傳統計報告。
+    workers 預設為 CPU 數，0 或 1 時在目前程序中解析；progress(報告) 會在解析過程中定期呼叫。
+    """
+    started = time.perf_counter()
+    total = count_sources(paths)
+    merger = PriceMerger()
+    report = {"files": total, "parsed": 0, "failed": 0, "bytes": 0, "errors": []}
+
+    def collect(results):
+        last_progress = time.perf_counter()
+        # 依檔案順序合併，讓「較晚的檔案為準」與平行解析的完成順序無關
+        pending, next_index = {}, 0
+        for index, result in results:
+            pending[index] = result
+            while next_index in pending:
+                name, dated_oil_prices, size, error = pending.pop(next_index)
+                next_index += 1
+                report["bytes"] += size
+                if error is not None or not dated_oil_prices:
+                    report["failed"] += 1
+                    report["errors"].append(f"{name}: {error or '沒有油價資料'}")
+                    continue
+                report["parsed"] += 1
+                merger.add(dated_oil_prices)
+            if progress is not None and time.perf_counter() - last_progress >= 1:
+                last_progress = time.perf_counter()
+                progress(_progress_report(report, merger, started))
+
+    sources = enumerate(iter_sources(paths))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        collect((index, parse_source(source)) for index, source in sources)
+    else:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers) as pool:
+            collect(pool.imap_unordered(_parse_indexed, sources, chunksize=chunk_size))
+
+    parsed_at = time.perf_counter()
+    report.update(_progress_report(report, merger, started))
+    report["parse_seconds"] = parsed_at - started
+    report["written"] = store.ingest(merger.prices) if merger.prices else 0
+    report["write_seconds"] = time.perf_counter() - parsed_at
+    report["seconds"] = time.perf_counter() - started
+    report["files_per_second"] = report["files"] / report["seconds"] if report["seconds"] else 0.0
+    return report
+
+
+def _parse_indexed(item):
+    index, source = item
+    return index, parse_source(source)
+
+
+def _progress_report(report, merger, started):
+    elapsed = time.perf_counter() - started
+    done = report["parsed"] + report["failed"]
+    return {
+        "done": done,
+        "files": report["files"],
+        "dates": len(merger.prices),
+        "values": merger.values,
+        "duplicates": merger.duplicates,
+        "conflicts": merger.conflicts,
+        "elapsed": elapsed,
+        "rate": done / elapsed if elapsed else 0.0,
+    }
+
+
+def print_progress(progress):
+    print(
+        f"已解析 {progress['done']}/{progress['files']} 個檔案（{progress['rate']:.0f} 檔/秒），"
+        f"{progress['dates']} 個日期",
+        flush=True
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archives', nargs='+', metavar='ARCHIVE')
+    parser.add_argument('--store', default=os.getenv('PRICE_STORE_PATH', 'price_history.npy'))
+    parser.add_argument('--workers', type=int, default=None, help='解析程序數（預設為 CPU 數，0 或 1 表示不使用程序池）')
+    parser.add_argument('--chunk-size', type=int, default=8, help='每次交給解析程序的檔案數')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from price_store import PriceStore
+
+    missing = [path for path in args.archives if not os.path.exists(path)]
+    if missing:
+        parser.error(f"找不到檔案：{', '.join(missing)}")
+
+    store = PriceStore(args.store)
+    report = backfill(args.archives, store, workers=args.workers, chunk_size=args.chunk_size, progress=print_progress)
+
+    for error in report["errors"][:20]:
+        logger.warning(f"無法解析 {error}")
+    print(
+        f"完成：{report['parsed']}/{report['files']} 個檔案（失敗 {report['failed']}），"
+        f"{report['dates']} 個日期、{report['values']} 筆價格（重複 {report['duplicates']}、衝突 {report['conflicts']}），"
+        f"資料庫更新 {report['written']} 筆"
+    )
+    print(
+        f"耗時 {report['seconds']:.2f} 秒（解析 {report['parse_seconds']:.2f} 秒、寫入 {report['write_seconds']:.2f} 秒），"
+        f"{report['files_per_second']:.0f} 檔/秒、{report['bytes'] / 1e6 / max(report['seconds'], 1e-9):.1f} MB/秒"
+    )
+    return 0 if report["parsed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,446 @@
+"""
+離線效能量測：以本地替身伺服器重播 fixtures/ 中的中油頁面，並以假的 LINE API 取代真實呼叫，
+量測 handle_message 每個指令各階段（fetch / parse / render / flex / reply / push）的耗時，
+以及 send_push_notification 在不同訂閱人數下的耗時、油價提醒的比對耗時，並比較同步輸出與佇列日誌管線的日誌成本。
+結果以 JSON 輸出，方便逐次比較。
+
+用法：python bench_commands.py [--output bench_results.json] [--push-sizes 1000,10000,100000] [--log-messages 2000]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(ROOT, 'fixtures')
+
+COMMANDS = ["訂閱油價", "訂閱人數", "油價", "查油價", "油價趨勢", "油價趨勢 全部 1年", "油價比較", "油價預測", "測試推播", "說明", "其他訊息", "取消訂閱"]
+
+
+class CpcStandIn(BaseHTTPRequestHandler):
+    """以 fixtures 模擬中油首頁與歷史油價頁面。"""
+
+    latency = 0.0
+    pages = {}
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        path = self.path.split('?')[0]
+        body = self.pages.get(path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_cpc_stand_in(latency, port=0):
+    with open(os.path.join(FIXTURES, 'cpc_home.html'), 'rb') as f:
+        CpcStandIn.pages['/'] = f.read()
+    with open(os.path.join(FIXTURES, 'cpc_history.html'), 'rb') as f:
+        CpcStandIn.pages['/historyprice.aspx'] = f.read()
+    CpcStandIn.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), CpcStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class StageRecorder:
+    """累計每個階段的耗時（秒）。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+
+    def reset(self):
+        with self.lock:
+            self.totals = defaultdict(float)
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.totals[stage] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def snapshot_ms(self):
+        with self.lock:
+            return {stage: round(seconds * 1000, 3) for stage, seconds in self.totals.items()}
+
+
+class StubLineApi:
+    """假的 LINE API：只記錄呼叫並模擬網路延遲。"""
+
+    def __init__(self, recorder, latency):
+        self.recorder = recorder
+        self.latency = latency
+        self.calls = 0
+        self.recipients = 0
+
+    def reply_message(self, reply_token, messages):
+        with self.recorder.stage('reply'):
+            time.sleep(self.latency)
+            self.calls += 1
+
+    def push_message(self, to, messages):
+        with self.recorder.stage('push'):
+            time.sleep(self.latency)
+            self.calls += 1
+            self.recipients += 1
+
+    def multicast(self, to, messages, retry_key=None):
+        with self.recorder.stage('push'):
+            time.sleep(self.latency)
+            self.calls += 1
+            self.recipients += len(to)
+
+
+def make_event(text, user_id='Ubench'):
+    from linebot.models import MessageEvent
+    return MessageEvent.new_from_json_dict({
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "webhookEventId": f"bench-{time.perf_counter_ns()}",
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": "bench-reply-token",
+        "source": {"type": "user", "userId": user_id},
+        "message": {"type": "text", "id": "1", "text": text},
+    })
+
+
+def import_bot(base_url, workdir):
+    """在設定好環境變數後匯入機器人模組，讓所有對外連線都指向本地替身。"""
+    os.environ.setdefault('LINE_CHANNEL_ACCESS_TOKEN', 'bench-token')
+    os.environ.setdefault('LINE_CHANNEL_SECRET', 'bench-secret')
+    os.environ.setdefault('IMAGEKIT_PUBLIC_KEY', 'bench')
+    os.environ.setdefault('IMAGEKIT_PRIVATE_KEY', 'bench')
+    os.environ.setdefault('IMAGEKIT_URL_ENDPOINT', 'https://ik.example.invalid')
+    os.environ['CPC_HOME_URL'] = base_url + '/'
+    os.environ['CPC_HISTORY_URL'] = base_url + '/historyprice.aspx?n=2890'
+    os.environ['SUBSCRIBERS_DB'] = os.path.join(workdir, 'subscribers.db')
+    os.environ['PRICE_STORE_PATH'] = os.path.join(workdir, 'price_history.npy')
+    os.environ['PRICE_SNAPSHOT_PATH'] = os.path.join(workdir, 'last_price_snapshot.json')
+    os.environ['REPLY_VIEWS_PATH'] = os.path.join(workdir, 'reply_views.json')
+    # 匯入時同步完成預熱，避免第一個指令的量測混入繪圖程序啟動等載入時間
+    os.environ['LAZY_STARTUP'] = '0'
+    sys.path.insert(0, ROOT)
+    import line_bot_oil_v1
+    return line_bot_oil_v1
+
+
+def instrument(bot, recorder, api):
+    """以計時包裝各階段函式，並換上假的 LINE API。"""
+    bot.cpc_client.get = recorder.wrap('fetch', bot.cpc_client.get)
+    bot.find_price_sentence = recorder.wrap('parse', bot.find_price_sentence)
+    bot.history_cache.parse = recorder.wrap('parse', bot.history_cache.parse)
+    bot._render_trend_chart = recorder.wrap('render', bot._render_trend_chart)
+    # 不真的上傳到 ImageKit，只模擬回傳圖片網址
+    bot.upload_trend_image = recorder.wrap(
+        'upload', lambda image, extension='png': f"https://ik.example.invalid/{len(image)}.{extension}")
+    bot.get_weekly_oil_comparison = recorder.wrap('flex', bot.get_weekly_oil_comparison)
+    bot.line_bot_api = api
+    bot.push_fanout.api = api
+    bot.push_fanout.bucket.rate = float('inf')
+
+
+def reset_caches(bot):
+    bot.history_cache.invalidate()
+    bot.chart_cache = type(bot.chart_cache)(max_entries=bot.chart_cache.max_entries)
+    bot.reply_views = type(bot.reply_views)(bot.reply_views.builders)
+
+
+def materialize(bot):
+    """清除快取後重新產生回覆內容（不計時），讓指令量測只反映查表回覆的成本。"""
+    reset_caches(bot)
+    bot.reply_views.refresh()
+    # 抓到新的歷史頁面時會在背景再更新一次，等它結束以免干擾量測
+    bot.reply_views.join()
+
+
+def run_once(recorder, func):
+    recorder.reset()
+    started = time.perf_counter()
+    func()
+    result = recorder.snapshot_ms()
+    result['total'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def bench_commands(bot, recorder, repeat):
+    results = {}
+    for text in COMMANDS:
+        runs = {"cold": [], "warm": []}
+        for _ in range(repeat):
+            materialize(bot)
+            runs["cold"].append(run_once(recorder, lambda: bot.handle_message(make_event(text))))
+            runs["warm"].append(run_once(recorder, lambda: bot.handle_message(make_event(text))))
+        results[text] = {mode: _median_by_stage(samples) for mode, samples in runs.items()}
+
+    runs = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        reset_caches(bot)
+        runs["cold"].append(run_once(recorder, bot.get_weekly_oil_comparison))
+        runs["warm"].append(run_once(recorder, bot.get_weekly_oil_comparison))
+    results["週比較 (Flex)"] = {mode: _median_by_stage(samples) for mode, samples in runs.items()}
+
+    # 預先產生所有回覆內容：cold 為新油價進來後的完整重建，warm 為資料未變時的定期更新
+    runs = {"cold": [], "warm": []}
+    for _ in range(repeat):
+        reset_caches(bot)
+        runs["cold"].append(run_once(recorder, bot.reply_views.refresh))
+        bot.reply_views.join()
+        runs["warm"].append(run_once(recorder, bot.reply_views.refresh))
+    results["預先產生回覆"] = {mode: _median_by_stage(samples) for mode, samples in runs.items()}
+    return results
+
+
+def bench_gather(bot, recorder, repeat):
+    """「油價」在回覆內容尚未產生時：依序取得本週油價與趨勢圖 vs 同時取得（首頁與歷史頁面並行抓取）。"""
+    def sequential():
+        bot.build_current_price_view()
+        bot.build_trend_view(bot.DEFAULT_TREND_FUEL, bot.DEFAULT_TREND_RANGE)
+
+    runs = {"sequential": [], "concurrent": []}
+    for _ in range(repeat):
+        for mode, func in (("sequential", sequential), ("concurrent", bot.oil_price_reply)):
+            # 抓到新的歷史頁面會觸發背景更新，等它結束再量測下一輪，避免搶用繪圖程序
+            bot.reply_views.join()
+            reset_caches(bot)
+            runs[mode].append(run_once(recorder, func))
+    bot.reply_views.join()
+    return {mode: _median_by_stage(samples) for mode, samples in runs.items()}
+
+
+def bench_push(bot, recorder, api, sizes):
+    results = {}
+    store = bot.subscriber_store
+    for size in sizes:
+        store.add_many(f"U{i:032d}" for i in range(size))
+        api.calls = api.recipients = 0
+        # 強制推播：價格不變時排程推播會直接略過，這裡要量測完整的發送成本
+        result = run_once(recorder, lambda: bot.send_push_notification(force=True))
+        result['subscribers'] = store.count()
+        result['api_calls'] = api.calls
+        result['recipients'] = api.recipients
+        results[str(size)] = result
+    return results
+
+
+class SlowStream:
+    """寫入時等待 latency 秒的檔案串流，模擬 stderr 經由管線送往日誌收集器時的寫入延遲。"""
+
+    def __init__(self, f, latency):
+        self.f = f
+        self.latency = latency
+
+    def write(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.f.write(text)
+
+    def flush(self):
+        self.f.flush()
+
+
+def bench_logging(bot, workdir, messages, sink_latency):
+    """
+    開啟 INFO 日誌，比較不同日誌管線下處理 messages 則訊息與一次推播的耗時：
+    off 為關閉 INFO 日誌的基準，sync 為在呼叫端直接格式化並寫出（原本 basicConfig 的做法），
+    queue 只在呼叫端放入佇列、由背景執行緒輸出，queue+limits 另外套用預設的每秒筆數上限。
+    事件在計時前先建立好；overhead 為與 off 相比每則訊息多花的時間。
+    """
+    from log_pipeline import parse_rates, setup_logging
+
+    root = logging.getLogger()
+    original_handlers, original_level = list(root.handlers), root.level
+    modes = (
+        ("off", None, {}),
+        ("sync", False, {}),
+        ("queue", True, {}),
+        ("queue+limits", True, parse_rates('webhook.message=50,push.batch=20')),
+    )
+    results = {}
+    try:
+        for mode, asynchronous, rate_limits in modes:
+            events = [make_event("其他訊息", user_id=f"U{i:032d}") for i in range(messages)]
+            path = os.path.join(workdir, f'log-{mode}.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                pipeline = None
+                if asynchronous is None:
+                    root.setLevel(logging.WARNING)
+                else:
+                    pipeline = setup_logging(
+                        stream=SlowStream(f, sink_latency), asynchronous=asynchronous, rate_limits=rate_limits
+                    )
+                try:
+                    started = time.perf_counter()
+                    for event in events:
+                        bot.handle_message(event)
+                    handled = time.perf_counter() - started
+                    started = time.perf_counter()
+                    bot.send_push_notification(force=True)
+                    pushed = time.perf_counter() - started
+                finally:
+                    if pipeline is not None:
+                        pipeline.stop()
+                        root.removeHandler(pipeline.handler)
+            with open(path, encoding='utf-8') as f:
+                records = sum(1 for _ in f)
+            results[mode] = {
+                "messages": round(handled * 1000, 3),
+                "per_message": round(handled * 1000 / max(1, messages), 4),
+                "push": round(pushed * 1000, 3),
+                "records": records,
+            }
+        for result in results.values():
+            result["overhead"] = round(result["per_message"] - results["off"]["per_message"], 4)
+    finally:
+        root.handlers[:] = original_handlers
+        root.setLevel(original_level)
+    return results
+
+
+def bench_alerts(workdir, rules):
+    """量測油價提醒規則的索引建立與一次油價變動的比對耗時。"""
+    import random
+    from price_alerts import PriceAlertEngine
+
+    engine = PriceAlertEngine(os.path.join(workdir, 'alerts.db'))
+    rng = random.Random(1)
+    fuels = ["92無鉛", "95無鉛", "98無鉛", "超級柴油"]
+    engine.set_rules(
+        (f"U{i}", fuels[i % 4], rng.choice(["abs", "pct"]), rng.uniform(0.1, 3.0), rng.choice(["up", "down", "both"]))
+        for i in range(rules)
+    )
+    change = {"95無鉛": {"previous": 30.0, "current": 30.3, "delta": 0.3}}
+    started = time.perf_counter()
+    engine.evaluate(change)
+    built = time.perf_counter()
+    triggered = engine.evaluate(change)
+    finished = time.perf_counter()
+    return {
+        "rules": rules,
+        "triggered": len(triggered),
+        "first_ms": round((built - started) * 1000, 3),
+        "evaluate_ms": round((finished - built) * 1000, 3),
+    }
+
+
+def bench_trend_sizes(bot):
+    """每種趨勢圖原圖與縮圖的大小（bytes），縮圖是聊天室列表實際下載的內容。"""
+    sizes = {}
+    for fuel, range_key in bot.trend_variants():
+        renditions = bot.get_trend_renditions(fuel, range_key)
+        sizes[f"{fuel} {range_key}"] = {name: len(data) for name, data in renditions.items()}
+    return sizes
+
+
+def _median_by_stage(samples):
+    stages = sorted({stage for sample in samples for stage in sample})
+    median = {}
+    for stage in stages:
+        values = sorted(sample.get(stage, 0.0) for sample in samples)
+        median[stage] = values[len(values) // 2]
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--push-sizes', default='1000,10000,100000')
+    parser.add_argument('--cpc-latency', type=float, default=0.0, help='替身中油伺服器每次回應延遲（秒）')
+    parser.add_argument('--line-latency', type=float, default=0.0, help='假 LINE API 每次呼叫延遲（秒）')
+    parser.add_argument('--alert-rules', type=int, default=100000, help='油價提醒比對量測的規則數')
+    parser.add_argument('--log-messages', type=int, default=2000, help='日誌成本量測時處理的訊息數')
+    parser.add_argument('--log-sink-latency', type=float, default=0.0002,
+                        help='日誌成本量測時每次寫出的延遲（秒），模擬 stderr 送往日誌收集器')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='oil-bench-')
+    server, base_url = start_cpc_stand_in(args.cpc_latency)
+    try:
+        bot = import_bot(base_url, workdir)
+        # 關閉 INFO 日誌，避免終端輸出影響量測
+        logging.getLogger().setLevel(logging.WARNING)
+        recorder = StageRecorder()
+        api = StubLineApi(recorder, args.line_latency)
+        instrument(bot, recorder, api)
+
+        report = {
+            "meta": {
+                "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "cpc_latency": args.cpc_latency,
+                "line_latency": args.line_latency,
+                "unit": "ms",
+            },
+            "commands": bench_commands(bot, recorder, args.repeat),
+            "gather": bench_gather(bot, recorder, args.repeat),
+            "trend_bytes": bench_trend_sizes(bot),
+            "push": bench_push(bot, recorder, api, [int(s) for s in args.push_sizes.split(',') if s]),
+            "alerts": bench_alerts(workdir, args.alert_rules),
+            "logging": bench_logging(bot, workdir, args.log_messages, args.log_sink_latency),
+        }
+    finally:
+        server.shutdown()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, modes in report["commands"].items():
+        print(f"{name:<12} cold {modes['cold']['total']:>9.3f} ms   warm {modes['warm']['total']:>9.3f} ms")
+    gather = report["gather"]
+    print(
+        f"油價 (未預先產生)  依序 {gather['sequential']['total']:>9.3f} ms   "
+        f"同時 {gather['concurrent']['total']:>9.3f} ms"
+    )
+    for variant, sizes in report["trend_bytes"].items():
+        print(f"趨勢圖 {variant:<10} 原圖 {sizes['png']:>7} bytes  縮圖 {sizes['preview.jpg']:>6} bytes")
+    for size, result in report["push"].items():
+        print(f"push {size:>7} 人  {result['total']:>10.3f} ms  ({result['api_calls']} 次 API 呼叫)")
+    alerts = report["alerts"]
+    print(
+        f"提醒 {alerts['rules']} 條規則  建立索引並比對 {alerts['first_ms']:.3f} ms  "
+        f"之後每次比對 {alerts['evaluate_ms']:.3f} ms（觸發 {alerts['triggered']} 人）"
+    )
+    for mode, result in report["logging"].items():
+        print(
+            f"日誌 {mode:<13} {args.log_messages} 則訊息 {result['messages']:>9.3f} ms "
+            f"（每則 {result['per_message']:.4f} ms，日誌 {result['overhead']:+.4f} ms）  "
+            f"推播 {result['push']:>8.3f} ms  輸出 {result['records']} 筆"
+        )
+    print(f"結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+比較 CPC 頁面快速解析與原本 BeautifulSoup / 正則表達式解析的耗時與記憶體峰值。
+
+用法：python bench_extract.py [--repeat N] [--json 輸出檔]
+"""
+import argparse
+import json
+import os
+import re
+import timeit
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from cpc_extract import extract_pie_series, find_price_sentence
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def soup_price_sentence(raw):
+    soup = BeautifulSoup(raw.decode('utf-8'), 'html.parser')
+    for text in soup.find_all(string=re.compile(r'92無鉛汽油每公升|95無鉛汽油每公升|98無鉛汽油每公升|超級柴油每公升')):
+        if '每公升' in text:
+            return str(text)
+    return None
+
+
+def regex_pie_series(raw):
+    match = re.search(r'var\s+pieSeries\s*=\s*(\[.*?\]);', raw.decode('utf-8'), re.DOTALL)
+    return json.loads(match.group(1).replace("'", '"').replace("undefined", "null"))
+
+
+def measure(func, raw, repeat):
+    seconds = min(timeit.repeat(lambda: func(raw), number=1, repeat=repeat))
+    tracemalloc.start()
+    func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"best_ms": seconds * 1000, "peak_kib": peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    home = read_fixture('cpc_home.html')
+    history = read_fixture('cpc_history.html')
+    cases = {
+        "home/beautifulsoup": measure(soup_price_sentence, home, args.repeat),
+        "home/fast": measure(find_price_sentence, home, args.repeat),
+        "history/regex": measure(regex_pie_series, history, args.repeat),
+        "history/fast": measure(extract_pie_series, history, args.repeat),
+    }
+
+    for name, result in cases.items():
+        print(f"{name:<20} {result['best_ms']:>9.3f} ms  peak {result['peak_kib']:>9.1f} KiB")
+    print(f"首頁解析加速 {cases['home/beautifulsoup']['best_ms'] / cases['home/fast']['best_ms']:.0f} 倍，"
+          f"記憶體峰值減少 {cases['home/beautifulsoup']['peak_kib'] / max(cases['home/fast']['peak_kib'], 0.1):.0f} 倍")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(cases, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
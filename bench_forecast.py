@@ -0,0 +1,71 @@
+"""
+量測油價預測模型在歷史資料逐年增長時的成本：完整建模 (fit)、每週增量更新 (update)
+與取得預測 (forecast)。歷史資料為隨機產生的每週價格。
+
+用法：python bench_forecast.py [--years 1,5,10,20,50] [--repeat N] [--json 輸出檔]
+"""
+import argparse
+import json
+import time
+import timeit
+from datetime import date
+
+import numpy as np
+
+from price_forecast import PriceForecaster
+
+UPDATE_WEEKS = 52
+
+
+def weekly_history(weeks, seed=0):
+    dates = date(1975, 1, 6).toordinal() + 7 * np.arange(weeks)
+    steps = np.round(np.random.default_rng(seed).normal(0, 0.3, size=(weeks, 4)), 1)
+    return dates, 29.0 + np.cumsum(steps, axis=0)
+
+
+def measure(weeks, repeat):
+    dates, prices = weekly_history(weeks + UPDATE_WEEKS)
+    fit_seconds = min(timeit.repeat(lambda: PriceForecaster().fit(dates[:weeks], prices[:weeks]),
+                                    number=1, repeat=repeat))
+
+    forecaster = PriceForecaster().fit(dates[:weeks], prices[:weeks])
+    started = time.perf_counter()
+    for day, row in zip(dates[weeks:], prices[weeks:]):
+        forecaster.update(int(day), row)
+    update_seconds = (time.perf_counter() - started) / UPDATE_WEEKS
+
+    sync_seconds = min(timeit.repeat(lambda: forecaster.sync(dates, prices), number=1, repeat=repeat))
+    forecast_seconds = min(timeit.repeat(forecaster.forecast, number=100, repeat=repeat)) / 100
+    return {
+        "weeks": weeks,
+        "fit_ms": fit_seconds * 1000,
+        "update_ms": update_seconds * 1000,
+        "sync_unchanged_ms": sync_seconds * 1000,
+        "forecast_ms": forecast_seconds * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', default='1,5,10,20,50')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    results = {}
+    for years in [int(y) for y in args.years.split(',') if y]:
+        result = measure(years * 52, args.repeat)
+        results[f"{years}y"] = result
+        print(
+            f"{years:>3} 年 ({result['weeks']:>5} 週)  fit {result['fit_ms']:>8.3f} ms  "
+            f"update {result['update_ms']:>7.4f} ms/週  sync(無變動) {result['sync_unchanged_ms']:>7.3f} ms  "
+            f"forecast {result['forecast_ms']:>7.4f} ms"
+        )
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
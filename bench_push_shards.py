@@ -0,0 +1,105 @@
+"""
+量測分片推播的擴展性：以多個本機程序模擬多台主機，共用同一個 SQLite outbox 與分片協調資料庫，
+比較不同節點數時整次推播的耗時。LINE API 以固定延遲的假 multicast 模擬。
+
+用法：python bench_push_shards.py [--users 50000] [--nodes 1,2,4] [--shards 64] [--line-latency 0.1]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from push_fanout import PushFanout
+from push_outbox import PushOutbox
+from push_shards import ShardCoordinator
+from reply_views import PreparedMessage
+
+
+class SlowApi:
+    def __init__(self, latency):
+        self.latency = latency
+        self.sent = 0
+
+    def multicast(self, to, messages, retry_key=None):
+        time.sleep(self.latency)
+        self.sent += len(to)
+
+
+def run_node(path, node_id, shards, args, barrier, results):
+    coordinator = ShardCoordinator(path, shards, node_id=node_id, ttl=30)
+    outbox = PushOutbox(path)
+    api = SlowApi(args["line_latency"])
+    fanout = PushFanout(api, max_workers=args["workers"], rate_per_sec=args["rate"])
+    coordinator.heartbeat()
+    barrier.wait()
+    started = time.time()
+    while outbox.pending_jobs():
+        outbox.drain(fanout, shards=coordinator.rebalance())
+        time.sleep(0.01)
+    finished = time.time()
+    coordinator.leave()
+    results.put({"node": node_id, "started": started, "finished": finished, "sent": api.sent})
+
+
+def measure(nodes, users, shards, args):
+    workdir = tempfile.mkdtemp(prefix='oil-shards-')
+    path = os.path.join(workdir, 'outbox.db')
+    PushOutbox(path).enqueue(
+        "broadcast", (f"U{i:032x}" for i in range(users)), [PreparedMessage({"type": "text", "text": "本週油價"})],
+        shards=shards
+    )
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(nodes)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_node, args=(path, f"node{i}", shards, args, barrier, results))
+        for i in range(nodes)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get(timeout=600) for _ in processes]
+    for process in processes:
+        process.join()
+    report = PushOutbox(path).report(1)
+    return {
+        "nodes": nodes,
+        "seconds": max(r["finished"] for r in reports) - min(r["started"] for r in reports),
+        "sent": report["sent"],
+        "per_node": sorted(r["sent"] for r in reports),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--nodes', default='1,2,4')
+    parser.add_argument('--shards', type=int, default=64)
+    parser.add_argument('--line-latency', type=float, default=0.1, help='假 LINE API 每次 multicast 的延遲（秒）')
+    parser.add_argument('--workers', type=int, default=4, help='每個節點同時發送的批次數')
+    parser.add_argument('--rate', type=float, default=100, help='每個節點每秒最多呼叫 LINE API 的次數')
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    options = {"line_latency": args.line_latency, "workers": args.workers, "rate": args.rate}
+    results = {}
+    baseline = None
+    for nodes in [int(n) for n in args.nodes.split(',') if n]:
+        result = measure(nodes, args.users, args.shards, options)
+        # 以第一組結果推算單一節點的耗時
+        baseline = baseline or result["seconds"] * nodes
+        results[f"{nodes}"] = result
+        print(
+            f"{nodes:>2} 個節點  {args.users} 人  {result['seconds']:>7.2f} 秒  "
+            f"（相對單一節點加速 {baseline / result['seconds']:.2f}x）  "
+            f"各節點發送 {result['per_node']}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
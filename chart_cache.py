@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def chart_fingerprint(series, **params):
+    """以資料序列與繪圖參數計算穩定的雜湊值，作為圖表快取的 key。"""
+    payload = json.dumps({"series": series, "params": params}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ChartCache:
+    """
+    In-memory LRU cache of encoded chart images, with an optional on-disk tier.
+
+    Values are the encoded image bytes, so a hit never touches matplotlib.
+    Several renditions of one chart (e.g. full size and preview) are cached as
+    separate entries named "<key>.<rendition>".
+    """
+
+    def __init__(self, max_entries=32, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._render_locks = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key):
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return png
+
+        png = self._read_disk(key)
+        if png is not None:
+            self.disk_hits += 1
+            self._put_memory(key, png)
+        return png
+
+    def put(self, key, png):
+        self._put_memory(key, png)
+        self._write_disk(key, png)
+
+    def get_or_render(self, key, render):
+        """快取命中時直接回傳 PNG；否則呼叫 render() 產生並存入快取。同一 key 只會繪製一次。"""
+        return self._render_once(key, lambda: self.get(key), render, lambda png: self.put(key, png))
+
+    def get_renditions(self, key, names):
+        """回傳 {rendition: bytes}；任一版本不在快取中時回傳 None。"""
+        renditions = {}
+        for name in names:
+            data = self.get(f"{key}.{name}")
+            if data is None:
+                return None
+            renditions[name] = data
+        return renditions
+
+    def get_or_render_renditions(self, key, names, render):
+        """
+        同一張圖的多個版本在同一次繪圖中產生：render() 回傳 {rendition: bytes}。
+        所有版本都命中時不會呼叫 render()；同一 key 只會繪製一次。
+        """
+        def store(renditions):
+            for name, data in renditions.items():
+                self.put(f"{key}.{name}", data)
+        return self._render_once(key, lambda: self.get_renditions(key, names), render, store)
+
+    def _render_once(self, key, lookup, render, store):
+        value = lookup()
+        if value is not None:
+            return value
+
+        with self._lock:
+            render_lock = self._render_locks.setdefault(key, threading.Lock())
+        with render_lock:
+            value = lookup()
+            if value is not None:
+                return value
+            self.misses += 1
+            value = render()
+            if value is not None:
+                store(value)
+        with self._lock:
+            self._render_locks.pop(key, None)
+        return value
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses, "entries": size}
+
+    def _put_memory(self, key, png):
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        # 一律加上固定的 .bin 後綴：不同的 key 不會對應到同一個檔案（例如單一圖片 "k" 與 rendition "k.png"）
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"讀取圖表磁碟快取時發生錯誤: {str(e)}")
+            return None
+
+    def _write_disk(self, key, png):
+        if not self.disk_dir:
+            return
+        try:
+            # 先寫入暫存檔再換名，避免其他 worker 讀到寫一半的檔案
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(png)
+            os.replace(tmp_path, self._disk_path(key))
+        except Exception as e:
+            logger.warning(f"寫入圖表磁碟快取時發生錯誤: {str(e)}")
@@ -0,0 +1,164 @@
+import logging
+import multiprocessing
+import threading
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+
+class ChartRenderBusy(Exception):
+    """繪圖佇列已滿。"""
+
+
+class ChartRenderTimeout(Exception):
+    """單次繪圖超過時間限制。"""
+
+
+# ---- 以下在繪圖子程序中執行 ----
+
+def init_worker(rc_params=None):
+    """子程序啟動時載入 matplotlib（Agg）、套用 rcParams，並先繪製一張小圖讓字型快取就緒。"""
+    import matplotlib
+    matplotlib.use('Agg')
+    matplotlib.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'sans-serif']
+    matplotlib.rcParams['axes.unicode_minus'] = False
+    matplotlib.rcParams.update(rc_params or {})
+    # 避免找不到 Arial 等字型時每張圖都輸出警告
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+    render_trend_chart(["2025-01-01", "2025-01-08"], {"warm-up": [1.0, 2.0]}, {"renditions": {"png": {"dpi": 10}}})
+
+
+def render_trend_chart(date_labels, series, options):
+    """
+    以物件導向的 Figure / Agg API 繪製趨勢圖（不使用 pyplot 的全域狀態）。
+
+    series 為 {圖例標籤: 價格list}；options 包含 figsize、tick_positions、legend，
+    以及 renditions: {名稱: {format, dpi, pil_kwargs}}。同一張圖依序輸出每個版本，
+    回傳 {名稱: bytes}。
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=options.get("figsize", (8, 4)))
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    x_indices = range(len(date_labels))
+    for label, prices in series.items():
+        axes.plot(x_indices, prices, marker='o', label=label)
+    ticks = options.get("tick_positions", list(x_indices))
+    axes.set_xticks(ticks)
+    axes.set_xticklabels([date_labels[i] for i in ticks], rotation=45, ha='right', fontsize=10)
+    if options.get("legend") and len(series) > 1:
+        axes.legend(loc='best', fontsize=9)
+    figure.tight_layout()
+
+    renditions = {}
+    for name, spec in options["renditions"].items():
+        buffer = BytesIO()
+        figure.savefig(
+            buffer, format=spec.get("format", "png"), dpi=spec["dpi"], bbox_inches='tight', facecolor='white',
+            pil_kwargs=spec.get("pil_kwargs")
+        )
+        renditions[name] = buffer.getvalue()
+    return renditions
+
+
+# ---- 以下在主程序中執行 ----
+
+class ChartRenderPool:
+    """
+    Renders charts in a dedicated process pool, off the webhook threads and the GIL.
+
+    - Workers are started with the "spawn" method and pre-load matplotlib and fonts.
+    - At most `max_pending` renders may be queued or running; beyond that render()
+      waits up to `queue_timeout` seconds and then raises ChartRenderBusy.
+    - A render that takes longer than `timeout` raises ChartRenderTimeout, and the
+      pool is torn down and rebuilt so a stuck worker cannot hold a slot forever.
+    - With processes=0 charts are rendered in the calling thread (one at a time).
+    """
+
+    def __init__(self, processes=2, max_pending=None, timeout=30, queue_timeout=5, rc_params=None):
+        self.processes = processes
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.rc_params = dict(rc_params or {})
+        self._slots = threading.BoundedSemaphore(max_pending or max(1, processes) * 2)
+        self._lock = threading.Lock()
+        self._inline_lock = threading.Lock()
+        self._inline_ready = False
+        self._pool = None
+
+        self.rendered = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def start(self):
+        """建立繪圖程序（預熱時呼叫，避免第一次繪圖等待程序啟動）。"""
+        if self.processes <= 0:
+            with self._inline_lock:
+                self._ensure_inline()
+            return None
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context('spawn')
+                self._pool = context.Pool(self.processes, initializer=init_worker, initargs=(self.rc_params,))
+                logger.info(f"已啟動 {self.processes} 個繪圖程序")
+            return self._pool
+
+    def render(self, date_labels, series, options):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.rejected += 1
+            raise ChartRenderBusy("繪圖佇列已滿，請稍後再試")
+        try:
+            if self.processes <= 0:
+                return self._render_inline(date_labels, series, options)
+            pool = self.start()
+            result = pool.apply_async(render_trend_chart, (date_labels, series, options))
+            try:
+                renditions = result.get(self.timeout)
+            except multiprocessing.TimeoutError:
+                self.timeouts += 1
+                logger.error(f"繪圖超過 {self.timeout} 秒，重新啟動繪圖程序")
+                self._restart(pool)
+                raise ChartRenderTimeout(f"繪圖超過 {self.timeout} 秒")
+            self.rendered += 1
+            return renditions
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "rendered": self.rendered,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def _restart(self, stuck_pool):
+        with self._lock:
+            if self._pool is not stuck_pool:
+                return
+            self._pool = None
+            self.restarts += 1
+        stuck_pool.terminate()
+
+    def _ensure_inline(self):
+        if not self._inline_ready:
+            init_worker(self.rc_params)
+            self._inline_ready = True
+
+    def _render_inline(self, date_labels, series, options):
+        with self._inline_lock:
+            self._ensure_inline()
+            renditions = render_trend_chart(date_labels, series, options)
+        self.rendered += 1
+        return renditions
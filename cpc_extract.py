@@ -0,0 +1,121 @@
+"""
+Single-pass extractors for CPC pages that work directly on the raw response bytes.
+
+Instead of building a full BeautifulSoup tree (home page) or running a DOTALL regex
+over the whole document (history page), each extractor jumps to its marker with
+bytes.find() and only decodes the small slice around it. Callers keep the
+original BeautifulSoup / regex parsing as a fallback when these return None.
+"""
+import html
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# 首頁油價句子中可能出現的關鍵字（任一出現即為該句）
+PRICE_SENTENCE_MARKERS = tuple(
+    name.encode('utf-8') for name in ('92無鉛汽油每公升', '95無鉛汽油每公升', '98無鉛汽油每公升', '超級柴油每公升')
+)
+PRICE_PATTERN = re.compile(r'(92無鉛汽油|95無鉛汽油|98無鉛汽油|超級柴油)每公升(\d+\.\d+)元')
+
+# 定義油品名稱的映射關係，將原始數據中的名稱標準化
+OIL_NAME_MAPPING = {
+    "92 無鉛汽油": "92無鉛汽油",
+    "95 無鉛汽油": "95無鉛汽油",
+    "98 無鉛汽油": "98無鉛汽油",
+    "超級/高級柴油": "超級/高級柴油"
+}
+
+_PIE_SERIES_DECL = re.compile(rb'var\s+pieSeries\s*=\s*\[')
+_JS_LITERAL = re.compile(r"""'((?:[^'\\]|\\.)*)'|"(?:[^"\\]|\\.)*"|\bundefined\b""", re.DOTALL)
+
+
+def _as_bytes(raw):
+    return raw.encode('utf-8') if isinstance(raw, str) else raw
+
+
+def find_price_sentence(raw):
+    """在原始 HTML 中找出第一個包含「每公升」油價的文字節點，找不到時回傳 None。"""
+    raw = _as_bytes(raw)
+    positions = [pos for pos in (raw.find(marker) for marker in PRICE_SENTENCE_MARKERS) if pos != -1]
+    if not positions:
+        return None
+    pos = min(positions)
+    start = raw.rfind(b'>', 0, pos) + 1
+    end = raw.find(b'<', pos)
+    if end == -1:
+        end = len(raw)
+    return html.unescape(raw[start:end].decode('utf-8', errors='replace'))
+
+
+def parse_price_sentence(text):
+    """從油價句子取出 [(油品, 價格字串), ...]。"""
+    return PRICE_PATTERN.findall(text)
+
+
+def _js_literal_to_json(match):
+    inner = match.group(1)
+    if inner is None:
+        token = match.group(0)
+        return 'null' if token == 'undefined' else token
+    if '\\' not in inner and '"' not in inner:
+        return '"' + inner + '"'
+    return json.dumps(inner.replace("\\'", "'"), ensure_ascii=False)
+
+
+def extract_pie_series(raw):
+    """
+    取出 `var pieSeries = [...]` 並轉成 Python list。
+
+    A single regex pass re-emits single-quoted JS strings as JSON strings and turns
+    bare `undefined` into `null`, so apostrophes inside values cannot corrupt the
+    result the way a blanket quote replacement would.
+    """
+    raw = _as_bytes(raw)
+    match = _PIE_SERIES_DECL.search(raw)
+    if not match:
+        return None
+    # 陣列只有幾 KB，只解碼宣告到第一個 `];` 之間的片段；若片段不完整，json.loads 會失敗並回傳 None
+    start = match.end() - 1
+    end = raw.find(b'];', start)
+    if end == -1:
+        return None
+    segment = raw[start:end + 1].decode('utf-8', errors='replace')
+
+    if '\\' not in segment and '"' not in segment:
+        # 沒有跳脫字元時，單引號只可能是字串邊界，可直接整段替換
+        converted = segment.replace("'", '"').replace('undefined', 'null')
+    else:
+        converted = _JS_LITERAL.sub(_js_literal_to_json, segment)
+    try:
+        return json.loads(converted)
+    except json.JSONDecodeError as e:
+        logger.warning(f"快速解析 pieSeries 失敗: {e}")
+        return None
+
+
+def pie_series_to_dated_prices(price_data):
+    """將 pieSeries 陣列整理為 {民國日期: {標準化油品名稱: 價格}}。"""
+    dated_oil_prices = {}
+    for entry in price_data:
+        if isinstance(entry, dict) and 'name' in entry and 'data' in entry and entry['data']:
+            roc_date = entry['name']
+            oil_data_point = entry['data'][0]
+
+            if isinstance(oil_data_point, dict) and 'name' in oil_data_point and 'y' in oil_data_point:
+                raw_oil_name = oil_data_point['name']
+                price = oil_data_point['y']
+
+                standardized_oil_name = OIL_NAME_MAPPING.get(raw_oil_name)
+
+                if standardized_oil_name:
+                    if roc_date not in dated_oil_prices:
+                        dated_oil_prices[roc_date] = {}
+
+                    try:
+                        dated_oil_prices[roc_date][standardized_oil_name] = float(price)
+                    except (ValueError, TypeError):
+                        logger.warning(f"無法將價格轉換為浮點數: {price} for {raw_oil_name} on {roc_date}")
+                        dated_oil_prices[roc_date][standardized_oil_name] = None
+    return dated_oil_prices
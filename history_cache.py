@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryPageCache:
+    """
+    Fetch-and-parse cache for a slowly changing upstream page (e.g. the CPC history price page).
+
+    - Within `ttl` seconds the parsed result is served straight from memory.
+    - Between `ttl` and `ttl + stale_ttl` the stale result is served immediately while a
+      single background thread revalidates it (stale-while-revalidate).
+    - Beyond that, the caller waits for a synchronous refresh; concurrent callers share it.
+    - Revalidation sends If-None-Match / If-Modified-Since so an unchanged page costs a 304.
+    - `parse(raw_bytes)` receives the undecoded body; `on_update(data)` is called
+      whenever a newly downloaded page has been parsed.
+    """
+
+    def __init__(self, url, parse, ttl=600, stale_ttl=3600, headers=None, timeout=10, session=None,
+                 on_update=None):
+        self.url = url
+        self.parse = parse
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.session = session or requests
+        self.on_update = on_update
+
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._data = None
+        self._fetched_at = None
+        self._etag = None
+        self._last_modified = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.upstream_requests = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    def get(self):
+        """回傳解析後的資料；必要時向上游重新驗證。"""
+        with self._lock:
+            data = self._data
+            age = None if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+        if data is not None and age < self.ttl:
+            self.hits += 1
+            return data
+
+        if data is not None and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            self._refresh_in_background()
+            return data
+
+        self.misses += 1
+        return self._refresh_sync()
+
+    def invalidate(self):
+        """清除快取，讓下一次 get() 重新向上游完整抓取。"""
+        with self._lock:
+            self._fetched_at = None
+            self._data = None
+            self._etag = None
+            self._last_modified = None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "upstream_requests": self.upstream_requests,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+        }
+
+    def _refresh_sync(self):
+        # 只讓一個執行緒向上游抓取，其他執行緒等待並共用結果
+        started = time.monotonic()
+        with self._refresh_lock:
+            with self._lock:
+                if self._fetched_at is not None and self._fetched_at >= started:
+                    return self._data
+            return self._refresh()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                with self._refresh_lock:
+                    self._refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="history-cache-refresh", daemon=True).start()
+
+    def _refresh(self):
+        headers = dict(self.headers)
+        with self._lock:
+            if self._etag:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified:
+                headers['If-Modified-Since'] = self._last_modified
+            cached = self._data
+
+        try:
+            self.upstream_requests += 1
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and cached is not None:
+                self.not_modified += 1
+                logger.info(f"上游資料未變更 (304)，沿用快取：{self.url}")
+                with self._lock:
+                    self._fetched_at = time.monotonic()
+                return cached
+
+            response.raise_for_status()
+            data = self.parse(response.content)
+            if data is None:
+                self.errors += 1
+                logger.error(f"解析上游資料失敗，沿用舊快取：{self.url}")
+                return cached
+
+            with self._lock:
+                self._data = data
+                self._fetched_at = time.monotonic()
+                self._etag = response.headers.get('ETag')
+                self._last_modified = response.headers.get('Last-Modified')
+            if self.on_update is not None:
+                try:
+                    self.on_update(data)
+                except Exception as e:
+                    logger.error(f"執行快取更新回呼時發生錯誤: {str(e)}")
+            return data
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"更新快取時發生錯誤: {str(e)}")
+            return cached
@@ -0,0 +1,44 @@
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class UploadRegistry:
+    """
+    Content hash -> public URL of images already uploaded to ImageKit, stored in
+    the shared SQLite database so every worker and instance reuses one upload.
+
+    Lookups are answered from an in-memory dict first; a miss falls through to
+    the table, so an image uploaded by another worker is found without a new upload.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._urls = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS uploaded_images (digest TEXT PRIMARY KEY, url TEXT NOT NULL)"
+        )
+
+    def get(self, digest):
+        """回傳已上傳圖片的網址；尚未上傳時回傳 None。"""
+        url = self._urls.get(digest)
+        if url is not None:
+            return url
+        with self._lock:
+            row = self._conn.execute("SELECT url FROM uploaded_images WHERE digest = ?", (digest,)).fetchone()
+        if row is not None:
+            self._urls[digest] = row[0]
+            return row[0]
+        return None
+
+    def put(self, digest, url):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO uploaded_images (digest, url) VALUES (?, ?)", (digest, url)
+            )
+        self._urls[digest] = url
@@ -0,0 +1,44 @@
+import threading
+
+
+class LazyObject:
+    """
+    Proxy that builds the wrapped object with `factory()` on first attribute access.
+
+    Lets module-level clients (LINE API, ImageKit, stores) keep their names while
+    deferring heavy imports and connections until they are actually needed.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_lock', threading.Lock())
+        object.__setattr__(self, '_instance', None)
+
+    def _get(self):
+        instance = object.__getattribute__(self, '_instance')
+        if instance is None:
+            with object.__getattribute__(self, '_lock'):
+                instance = object.__getattribute__(self, '_instance')
+                if instance is None:
+                    instance = object.__getattribute__(self, '_factory')()
+                    object.__setattr__(self, '_instance', instance)
+        return instance
+
+    @property
+    def loaded(self):
+        return object.__getattribute__(self, '_instance') is not None
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get(), name, value)
+
+    def __len__(self):
+        return len(self._get())
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __contains__(self, item):
+        return item in self._get()
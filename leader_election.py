@@ -0,0 +1,126 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def default_holder_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseElector:
+    """
+    Leader election through a time-limited lease row in a shared SQLite database.
+
+    Every process runs the same elector; whoever holds an unexpired lease is the
+    leader and keeps renewing it every `renew_interval` seconds. If the leader dies
+    its lease simply expires after `ttl` seconds and the next process to try takes over.
+    `on_acquire()`, if set, is called whenever this process takes over a lease that
+    was free, expired or held by another process (not on renewals), so the new
+    leader can catch up on work that fell into the gap.
+    """
+
+    def __init__(self, db_path, name, holder_id=None, ttl=30, renew_interval=10, on_acquire=None):
+        self.db_path = db_path
+        self.name = name
+        self.holder_id = holder_id or default_holder_id()
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.on_acquire = on_acquire
+        self._expires_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "name TEXT PRIMARY KEY, holder TEXT NOT NULL, acquired_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """取得或續約租約，成功（本程序為 leader）時回傳 True。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT holder, acquired_at, expires_at FROM leases WHERE name = ?", (self.name,)
+                ).fetchone()
+                acquired = row is None or row[0] == self.holder_id or row[2] <= now
+                # 租約原本空著、已到期或由其他程序持有：這次是接手，而不是續約
+                took_over = row is None or row[0] != self.holder_id or row[2] <= now
+                if acquired:
+                    acquired_at = now if took_over else row[1]
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO leases (name, holder, acquired_at, expires_at) VALUES (?, ?, ?, ?)",
+                        (self.name, self.holder_id, acquired_at, now + self.ttl)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if acquired:
+                was_leader = self.is_leader()
+                self._expires_at = now + self.ttl
+                if not was_leader:
+                    logger.info(f"{self.holder_id} 取得 {self.name} 的 leader 租約")
+        if acquired:
+            if took_over and self.on_acquire is not None:
+                try:
+                    self.on_acquire()
+                except Exception as e:
+                    logger.error(f"取得 {self.name} 租約後執行接手工作時發生錯誤: {str(e)}")
+            return True
+        if self._expires_at:
+            logger.info(f"{self.holder_id} 失去 {self.name} 的 leader 租約，目前由 {row[0]} 持有")
+        self._expires_at = 0.0
+        return False
+
+    def is_leader(self):
+        # 預留一個續約週期的安全邊界，避免租約即將到期時仍以 leader 身分執行工作
+        return time.time() < self._expires_at - min(self.renew_interval, self.ttl / 2)
+
+    def current_leader(self):
+        """回傳目前持有租約的程序資訊；無人持有時回傳 None。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT holder, acquired_at, expires_at FROM leases WHERE name = ?", (self.name,)
+            ).fetchone()
+        if row is None or row[2] <= time.time():
+            return None
+        return {"holder": row[0], "acquired_at": row[1], "expires_at": row[2]}
+
+    def start(self):
+        """啟動背景執行緒，定期嘗試取得或續約租約。"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, release=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.renew_interval + 1)
+            self._thread = None
+        if release:
+            self.release()
+
+    def release(self):
+        """主動釋放租約，讓其他程序不必等待到期即可接手。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder_id))
+        self._expires_at = 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.error(f"續約 {self.name} 租約時發生錯誤: {str(e)}")
+                self._expires_at = 0.0
+            self._stop.wait(self.renew_interval)
@@ -1,37 +1,99 @@
-import matplotlib
-matplotlib.use('Agg')
 import os
+import atexit
+import functools
 import logging
-from flask import Flask, request, abort
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, abort, jsonify, Response
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage, ImageSendMessage, FlexSendMessage
 import requests
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import re
 import json
-import matplotlib.pyplot as plt
-import numpy as np
-from io import BytesIO
-from imagekitio import ImageKit
 import base64
-import tempfile
-from apscheduler.schedulers.background import BackgroundScheduler
+import hashlib
+from io import BytesIO
+from history_cache import HistoryPageCache
+from chart_cache import ChartCache, chart_fingerprint
+from push_fanout import PushFanout
+from webhook_queue import EventDispatcher
+from webhook_dedup import EventDeduplicator, CoalescedEvents, coalesce
+from log_pipeline import setup_logging, parse_rates
+from cpc_extract import find_price_sentence, parse_price_sentence, extract_pie_series, pie_series_to_dated_prices
+from lazy import LazyObject
+from leader_election import LeaseElector
+from price_change import PriceChangeDetector
+from price_alerts import parse_alert_command, describe_rule
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from upstream import UpstreamClient, CircuitBreaker
+from reply_views import ReplyViews
+from chart_render import ChartRenderPool
+from trend_charts import (
+    TREND_FUELS, TREND_RANGES, TREND_RENDITIONS, LEGEND_LABELS, DEFAULT_TREND_FUEL, DEFAULT_TREND_RANGE,
+    parse_trend_command, trend_view_name, trend_variants, tick_positions
+)
 
-# 設定 logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# numpy、BeautifulSoup、ImageKit、APScheduler 都在第一次使用時才載入，
+# 或於 worker 開始接受請求後由背景執行緒預熱（見 warm_up），以縮短 worker 啟動時間。
+# matplotlib 只在獨立的繪圖程序中載入（見 chart_render）。
 
-# 設定字體
-plt.rcParams['font.family'] = ['DejaVu Sans', 'Arial', 'sans-serif']
-plt.rcParams['axes.unicode_minus'] = False
+# 設定 logging：日誌紀錄只在呼叫端放入佇列，由背景執行緒格式化（預設 JSON）並輸出；
+# 高頻率的訊息類型（extra 的 event 欄位）可抽樣（LOG_SAMPLE_RATES）或限制每秒筆數（LOG_RATE_LIMITS）
+log_pipeline = setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    json_format=os.getenv('LOG_FORMAT', 'json') == 'json',
+    asynchronous=os.getenv('LOG_ASYNC', '1') == '1',
+    queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+    sample_rates=parse_rates(os.getenv('LOG_SAMPLE_RATES', '')),
+    rate_limits=parse_rates(os.getenv('LOG_RATE_LIMITS', 'webhook.message=50,push.batch=20'))
+)
+atexit.register(log_pipeline.stop)
+logger = logging.getLogger(__name__)
 
 # 初始化 Flask 應用程式
 app = Flask(__name__)
 
+# 效能指標：各階段延遲、快取命中與上游錯誤，由 /metrics 以 Prometheus 文字格式輸出
+metrics_registry = Registry()
+STAGE_LATENCY = metrics_registry.histogram(
+    'oil_bot_stage_seconds', '抓取、解析、繪圖等各階段的耗時（秒）', ['stage'])
+COMMAND_LATENCY = metrics_registry.histogram(
+    'oil_bot_command_seconds', '每個指令從開始處理到回覆完成的耗時（秒）', ['command'])
+LINE_API_LATENCY = metrics_registry.histogram(
+    'oil_bot_line_api_seconds', 'LINE API 呼叫耗時（秒）', ['method'])
+PUSH_BATCH_LATENCY = metrics_registry.histogram(
+    'oil_bot_push_batch_seconds', '每批 multicast 推播耗時（含重試，秒）', ['result'])
+UPSTREAM_ERRORS = metrics_registry.counter(
+    'oil_bot_upstream_errors_total', '呼叫中油網站或 LINE API 失敗的次數', ['upstream'],
+    func=lambda: {'cpc_history': history_cache.errors})
+
+def _instrument_line_call(method, call):
+    """包裝 LINE API 方法，記錄耗時與失敗次數。"""
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        with LINE_API_LATENCY.time(method=method):
+            try:
+                return call(*args, **kwargs)
+            except Exception:
+                UPSTREAM_ERRORS.inc(upstream='line')
+                raise
+    return wrapper
+
+def _create_line_bot_api():
+    # LINE_API_ENDPOINT 可指向本地替身伺服器（例如 loadtest.py）
+    api = LineBotApi(
+        os.getenv('LINE_CHANNEL_ACCESS_TOKEN'),
+        endpoint=os.getenv('LINE_API_ENDPOINT', LineBotApi.DEFAULT_API_ENDPOINT)
+    )
+    for method in ('reply_message', 'push_message', 'multicast'):
+        setattr(api, method, _instrument_line_call(method, getattr(api, method)))
+    return api
+
 # 設定 LINE Channel Access Token 和 Channel Secret
-line_bot_api = LineBotApi(os.getenv('LINE_CHANNEL_ACCESS_TOKEN'))
+line_bot_api = LazyObject(_create_line_bot_api)
 handler = WebhookHandler(os.getenv('LINE_CHANNEL_SECRET'))
 
 # 檢查環境變數
@@ -52,47 +114,35 @@ IMAGEKIT_PUBLIC_KEY = os.getenv('IMAGEKIT_PUBLIC_KEY')
 IMAGEKIT_PRIVATE_KEY = os.getenv('IMAGEKIT_PRIVATE_KEY')
 IMAGEKIT_URL_ENDPOINT = os.getenv('IMAGEKIT_URL_ENDPOINT')
 
-# 初始化 ImageKit
-imagekit = ImageKit(
-    private_key=os.getenv('IMAGEKIT_PRIVATE_KEY'),
-    public_key=os.getenv('IMAGEKIT_PUBLIC_KEY'),
-    url_endpoint=os.getenv('IMAGEKIT_URL_ENDPOINT')
-)
+# 初始化 ImageKit（第一次使用時才建立）
+def _create_imagekit():
+    from imagekitio import ImageKit
+    return ImageKit(
+        private_key=os.getenv('IMAGEKIT_PRIVATE_KEY'),
+        public_key=os.getenv('IMAGEKIT_PUBLIC_KEY'),
+        url_endpoint=os.getenv('IMAGEKIT_URL_ENDPOINT')
+    )
 
-# 訂閱用戶檔案路徑
+imagekit = LazyObject(_create_imagekit)
+
+# 訂閱用戶資料庫（SQLite WAL），舊的文字檔會在首次啟動時自動匯入
 SUBSCRIBERS_FILE = 'subscribed_users.txt'
+SUBSCRIBERS_DB = os.getenv('SUBSCRIBERS_DB', 'subscribers.db')
 
-def load_subscribers():
-    """從檔案載入訂閱用戶 ID 列表。"""
+def _open_subscriber_store():
+    from subscriber_store import SubscriberStore
+    store = SubscriberStore(SUBSCRIBERS_DB)
     try:
-        if os.path.exists(SUBSCRIBERS_FILE):
-            with open(SUBSCRIBERS_FILE, 'r') as f:
-                # 讀取每一行並去除空白字元，如果行不為空則加入集合
-                subscribers = {line.strip() for line in f if line.strip()}
-            logger.info(f"成功載入 {len(subscribers)} 個訂閱用戶 ID。")
-            return subscribers
-        logger.info(f"訂閱用戶檔案 {SUBSCRIBERS_FILE} 不存在，返回空集合。")
-        return set()
+        store.migrate_from_text_file(SUBSCRIBERS_FILE)
     except Exception as e:
-        logger.error(f"載入訂閱用戶檔案時發生錯誤: {str(e)}")
-        return set()
+        logger.error(f"匯入舊訂閱用戶檔案時發生錯誤: {str(e)}")
+    return store
 
-def save_subscribers(subscribers):
-    """將訂閱用戶 ID 列表儲存到檔案。"""
-    try:
-        with open(SUBSCRIBERS_FILE, 'w') as f:
-            for user_id in sorted(subscribers):
-                f.write(user_id + '\n')
-        logger.info(f"成功儲存 {len(subscribers)} 個訂閱用戶 ID。")
-    except Exception as e:
-        logger.error(f"儲存訂閱用戶檔案時發生錯誤: {str(e)}")
+subscriber_store = LazyObject(_open_subscriber_store)
 
 def add_subscriber(user_id):
     """新增一個訂閱用戶 ID。"""
-    subscribers = load_subscribers()
-    if user_id not in subscribers:
-        subscribers.add(user_id)
-        save_subscribers(subscribers)
+    if subscriber_store.add(user_id):
         logger.info(f"用戶 {user_id} 已新增至訂閱列表。")
         return True
     logger.info(f"用戶 {user_id} 已存在於訂閱列表中。")
@@ -100,10 +150,7 @@ def add_subscriber(user_id):
 
 def remove_subscriber(user_id):
     """移除一個訂閱用戶 ID。"""
-    subscribers = load_subscribers()
-    if user_id in subscribers:
-        subscribers.remove(user_id)
-        save_subscribers(subscribers)
+    if subscriber_store.remove(user_id):
         logger.info(f"用戶 {user_id} 已從訂閱列表中移除。")
         return True
     logger.info(f"用戶 {user_id} 不存在於訂閱列表中。")
@@ -121,35 +168,72 @@ def tw_date_to_ad_date(tw_date_str):
         logger.error(f"Error converting ROC date {tw_date_str} to AD date: {str(e)}")
         return tw_date_str # Return original string if conversion fails
 
+# 中油網址（可用環境變數指向本地替身伺服器進行測試或效能量測）
+CPC_HOME_URL = os.getenv('CPC_HOME_URL', 'https://www.cpc.com.tw/')
+
+# 所有對中油網站的請求共用同一個連線池；設定逾時、有限次數重試，並在中油持續失敗時熔斷
+cpc_client = UpstreamClient(
+    timeout=(float(os.getenv('CPC_CONNECT_TIMEOUT', '3.05')), float(os.getenv('CPC_READ_TIMEOUT', '10'))),
+    retries=int(os.getenv('CPC_RETRIES', '2')),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('CPC_BREAKER_THRESHOLD', '5')),
+        reset_timeout=float(os.getenv('CPC_BREAKER_RESET', '30'))
+    ),
+    headers={
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+)
+
+def _find_price_sentence_with_soup(html_text):
+    """以 BeautifulSoup 尋找油價句子（快速解析失敗時的備援）。"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_text, 'html.parser')
+    for text in soup.find_all(string=re.compile(r'92無鉛汽油每公升|95無鉛汽油每公升|98無鉛汽油每公升|超級柴油每公升')):
+        if '每公升' in text:
+            return str(text)
+    return None
+
+# 上次成功抓到的本週油價：中油無法連線或熔斷時沿用
+_last_good_current_price = None
+
+@STAGE_LATENCY.timed(stage='current_price')
 def get_current_oil_price():
+    """抓取本週油價；中油無法連線（或熔斷中）時回傳上次成功抓取的資料。"""
+    global _last_good_current_price
+    oil_price_data = _fetch_current_oil_price()
+    if oil_price_data is not None:
+        _last_good_current_price = oil_price_data
+        return oil_price_data
+    if _last_good_current_price is not None:
+        logger.warning("無法取得最新油價，改用上次成功抓取的資料")
+    return _last_good_current_price
+
+def _fetch_current_oil_price():
     try:
-        url = 'https://www.cpc.com.tw/'
+        url = CPC_HOME_URL
         logger.info(f"開始抓取當前油價，URL: {url}")
-        
-        # 設定 headers 模擬瀏覽器
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 尋找包含油價資訊的文字
-        price_text = None
-        for text in soup.find_all(string=re.compile(r'92無鉛汽油每公升|95無鉛汽油每公升|98無鉛汽油每公升|超級柴油每公升')):
-            if '每公升' in text:
-                price_text = text
-                break
-        
-        if not price_text:
-            logger.error("找不到油價資訊")
-            return None
-            
-        # 使用正則表達式提取油價資訊
-        price_pattern = r'(92無鉛汽油|95無鉛汽油|98無鉛汽油|超級柴油)每公升(\d+\.\d+)元'
-        matches = re.findall(price_pattern, price_text)
-        
+
+        try:
+            with STAGE_LATENCY.time(stage='fetch_current_page'):
+                response = cpc_client.get(url)
+                response.raise_for_status()
+        except requests.RequestException:
+            UPSTREAM_ERRORS.inc(upstream='cpc_home')
+            raise
+
+        # 先以快速路徑直接在原始 bytes 中尋找油價句子，找不到或解析不出價格
+        # （例如誤中屬性或 script 中的文字）時才建立 BeautifulSoup 樹
+        price_text = find_price_sentence(response.content)
+        matches = parse_price_sentence(price_text) if price_text else None
+        if not matches:
+            logger.warning("快速解析找不到可用的油價資訊，改用 BeautifulSoup 解析")
+            price_text = _find_price_sentence_with_soup(response.text)
+            if not price_text:
+                logger.error("找不到油價資訊")
+                return None
+            # 使用正則表達式提取油價資訊
+            matches = parse_price_sentence(price_text)
+
         if not matches:
             logger.error("無法解析油價資訊")
             return None
@@ -175,130 +259,191 @@ def get_current_oil_price():
         logger.error(f"抓取當前油價時發生錯誤: {str(e)}")
         return None
 
+@STAGE_LATENCY.timed(stage='parse_history')
 def _parse_historical_oil_data(html_content):
     """
-    Parses the historical oil price data from the given HTML content.
+    Parses the historical oil price data from the given HTML content (str or raw bytes).
     Extracts the 'pieSeries' JavaScript variable, parses it, and organizes the data
     into a dictionary where keys are ROC dates and values are dictionaries
     containing oil prices for various types.
     """
     try:
-        # 精確匹配 var pieSeries = [...]
-        match = re.search(r'var\s+pieSeries\s*=\s*(\[.*?\]);', html_content, re.DOTALL)
-        if not match:
-            logger.error("找不到 pieSeries 油價資料")
-            return None
-
-        price_data_str = match.group(1)
-        # logger.info(f"找到的資料字串 (pieSeries): {price_data_str[:100]}...") # Removed debugging log
-        # logger.info(f"完整 pieSeries 資料字串: {price_data_str}") # Removed debugging log
-
-        try:
-            # 將單引號替換為雙引號，並處理 JavaScript 的 undefined
-            price_data_str = price_data_str.replace("\'", '"').replace("undefined", "null")
-            price_data = json.loads(price_data_str)
-        except json.JSONDecodeError as e:
-            logger.error(f"解析 pieSeries 油價資料時發生錯誤: {e}")
-            return None
+        # 快速路徑：直接在原始內容中定位並轉換 pieSeries
+        price_data = extract_pie_series(html_content)
+        if price_data is None:
+            logger.warning("快速解析 pieSeries 失敗，改用正則表達式解析")
+            price_data = _extract_pie_series_with_regex(html_content)
+            if price_data is None:
+                return None
 
         if not price_data:
             logger.error("pieSeries 油價資料為空")
             return None
 
-        dated_oil_prices = {}
+        return pie_series_to_dated_prices(price_data)
+    except Exception as e:
+        logger.error(f"解析歷史油價數據時發生錯誤: {str(e)}")
+        return None
 
-        # 定義油品名稱的映射關係，將原始數據中的名稱標準化
-        oil_name_mapping = {
-            "92 無鉛汽油": "92無鉛汽油",
-            "95 無鉛汽油": "95無鉛汽油",
-            "98 無鉛汽油": "98無鉛汽油",
-            "超級/高級柴油": "超級/高級柴油"
-        }
+def _extract_pie_series_with_regex(html_content):
+    """以正則表達式取出 pieSeries（快速解析失敗時的備援）。"""
+    if isinstance(html_content, bytes):
+        html_content = html_content.decode('utf-8', errors='replace')
 
-        for entry in price_data:
-            if isinstance(entry, dict) and 'name' in entry and 'data' in entry and entry['data']:
-                roc_date = entry['name']
-                oil_data_point = entry['data'][0]
+    # 精確匹配 var pieSeries = [...]
+    match = re.search(r'var\s+pieSeries\s*=\s*(\[.*?\]);', html_content, re.DOTALL)
+    if not match:
+        logger.error("找不到 pieSeries 油價資料")
+        return None
 
-                if isinstance(oil_data_point, dict) and 'name' in oil_data_point and 'y' in oil_data_point:
-                    raw_oil_name = oil_data_point['name']
-                    price = oil_data_point['y']
+    price_data_str = match.group(1)
+    try:
+        # 將單引號替換為雙引號，並處理 JavaScript 的 undefined
+        price_data_str = price_data_str.replace("\'", '"').replace("undefined", "null")
+        return json.loads(price_data_str)
+    except json.JSONDecodeError as e:
+        logger.error(f"解析 pieSeries 油價資料時發生錯誤: {e}")
+        return None
 
-                    standardized_oil_name = oil_name_mapping.get(raw_oil_name)
+# 本地油價歷史資料庫：每次抓到新的歷史頁面就增量合併，累積超過官網 7 週的資料
+PRICE_STORE_PATH = os.getenv('PRICE_STORE_PATH', 'price_history.npy')
 
-                    if standardized_oil_name:
-                        if roc_date not in dated_oil_prices:
-                            dated_oil_prices[roc_date] = {}
+def _open_price_store():
+    from price_store import PriceStore
+    return PriceStore(PRICE_STORE_PATH)
 
-                        try:
-                            dated_oil_prices[roc_date][standardized_oil_name] = float(price)
-                        except (ValueError, TypeError):
-                            logger.warning(f"無法將價格轉換為浮點數: {price} for {raw_oil_name} on {roc_date}")
-                            dated_oil_prices[roc_date][standardized_oil_name] = None
-        return dated_oil_prices
-    except Exception as e:
-        logger.error(f"解析歷史油價數據時發生錯誤: {str(e)}")
-        return None
+price_store = LazyObject(_open_price_store)
 
-def get_oil_price_trend():
-    try:
-        url = 'https://www.cpc.com.tw/historyprice.aspx?n=2890'
-        logger.info(f"開始抓取油價趨勢資料，URL: {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        html = response.text
+# 歷史油價頁面每週才更新一次，所有指令共用同一份抓取與解析結果
+CPC_HISTORY_URL = os.getenv('CPC_HISTORY_URL', 'https://www.cpc.com.tw/historyprice.aspx?n=2890')
+history_cache = HistoryPageCache(
+    CPC_HISTORY_URL,
+    _parse_historical_oil_data,
+    ttl=int(os.getenv('HISTORY_CACHE_TTL', '600')),
+    stale_ttl=int(os.getenv('HISTORY_CACHE_STALE_TTL', '3600')),
+    timeout=cpc_client.timeout,
+    session=cpc_client,
+    on_update=lambda data: _on_history_update(data)
+)
+
+def _on_history_update(data):
+    """官網歷史頁面有新資料：寫入本地資料庫，並在背景重新產生回覆內容。"""
+    price_store.ingest(data)
+    reply_views.refresh_in_background()
+
+# 趨勢圖與週比較預設使用的資料區間（約等於官網頁面的 7 週）
+HISTORY_WINDOW_DAYS = 49
+
+@STAGE_LATENCY.timed(stage='history')
+def get_historical_oil_data(since_days=HISTORY_WINDOW_DAYS):
+    """
+    取得歷史油價數據。經由快取確認官網資料是否更新（新資料會寫入本地資料庫），
+    再從本地資料庫讀取最近 since_days 天的資料；資料庫無資料時直接使用頁面解析結果。
+    """
+    page_data = history_cache.get()
+    stored = price_store.to_dated_dict(since_days=since_days)
+    return stored or page_data
+
+# 趨勢圖快取（可透過 CHART_CACHE_DIR 啟用磁碟層，讓多個 worker 共用）
+TREND_CHART_FIGSIZE = (8, 4)
+TREND_CHART_DPI = 100
+# 縮圖：約 240px 寬的高壓縮 JPEG，讓聊天室預覽不必下載原圖
+TREND_PREVIEW_DPI = 30
+TREND_PREVIEW_QUALITY = 45
+chart_cache = ChartCache(
+    max_entries=int(os.getenv('CHART_CACHE_SIZE', '128')),
+    disk_dir=os.getenv('CHART_CACHE_DIR')
+)
+
+# 繪圖程序池：在獨立程序中以 Figure/Agg API 繪圖，不佔用 webhook 執行緒與 GIL
+chart_renderer = ChartRenderPool(
+    processes=int(os.getenv('CHART_RENDER_PROCESSES', '2')),
+    max_pending=int(os.getenv('CHART_RENDER_MAX_PENDING', '8')),
+    timeout=float(os.getenv('CHART_RENDER_TIMEOUT', '30'))
+)
+
+@STAGE_LATENCY.timed(stage='render_chart')
+def _render_trend_chart(date_labels_ad, series):
+    """
+    繪製油價趨勢圖；series 為 {油品: 價格list}，多個油品時疊加並顯示圖例。
+    同一次繪圖輸出原圖 PNG 與縮圖 JPEG，回傳 {"png": bytes, "preview.jpg": bytes}。
+    """
+    options = {
+        "figsize": TREND_CHART_FIGSIZE,
+        "tick_positions": tick_positions(len(date_labels_ad)),
+        "legend": True,
+        "renditions": {
+            "png": {"format": "png", "dpi": TREND_CHART_DPI},
+            "preview.jpg": {
+                "format": "jpg", "dpi": TREND_PREVIEW_DPI,
+                "pil_kwargs": {"quality": TREND_PREVIEW_QUALITY, "optimize": True},
+            },
+        },
+    }
+    labeled = {LEGEND_LABELS.get(fuel, fuel): prices for fuel, prices in series.items()}
+    return chart_renderer.render(date_labels_ad, labeled, options)
 
-        dated_oil_prices = _parse_historical_oil_data(html)
+@STAGE_LATENCY.timed(stage='trend')
+def get_trend_renditions(fuel=DEFAULT_TREND_FUEL, range_key=DEFAULT_TREND_RANGE):
+    """
+    取得指定油品與區間的趨勢圖，回傳 {"png": 原圖, "preview.jpg": 縮圖}；無資料時回傳 None。
+    fuel 為 TREND_FUELS 的名稱（92/95/98/柴油/全部），range_key 為 TREND_RANGES 的名稱。
+    """
+    try:
+        fuels = TREND_FUELS[fuel]
+        days = TREND_RANGES[range_key]
+        logger.debug(f"開始取得油價趨勢資料（{fuel}，{range_key}），URL: {CPC_HISTORY_URL}")
+        dated_oil_prices = get_historical_oil_data(since_days=days)
         if not dated_oil_prices:
             logger.error("沒有有效的油價數據可供繪製圖表")
             return None
 
-        logger.info(f"成功解析歷史油價數據，共有 {len(dated_oil_prices)} 個日期")
         sorted_dates_roc = sorted(dated_oil_prices.keys())
-        logger.info(f"排序後的日期: {sorted_dates_roc}")
-
-        dates_roc = []
-        prices_95 = []
-        for roc_date in sorted_dates_roc:
-            dates_roc.append(roc_date)
-            current_day_prices = dated_oil_prices.get(roc_date, {})
-            prices_95.append(current_day_prices.get('95無鉛汽油', None))
-        logger.info(f"95無鉛汽油價格: {prices_95}")
-
-        date_labels_ad = [tw_date_to_ad_date(d) for d in dates_roc]
-        logger.info(f"轉換後的西元日期標籤: {date_labels_ad}")
-
-        plt.figure(figsize=(8, 4))
-        x_indices = range(len(date_labels_ad))
-        plt.plot(x_indices, prices_95, marker='o')
-        plt.xticks(x_indices, date_labels_ad, rotation=45, ha='right', fontsize=10)
-        plt.tight_layout()
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight', facecolor='white')
-        buffer.seek(0)
-        plt.close()
-
-        logger.info(f"Buffer size: {len(buffer.getvalue())} bytes")
-        return buffer
+        series = {
+            name: [dated_oil_prices[roc_date].get(name) for roc_date in sorted_dates_roc]
+            for name in fuels
+        }
+        date_labels_ad = [tw_date_to_ad_date(d) for d in sorted_dates_roc]
+
+        # 同一份資料與繪圖參數只繪製一次，之後直接回傳已編碼的圖片
+        render_params = {
+            "figsize": TREND_CHART_FIGSIZE, "dpi": TREND_CHART_DPI,
+            "preview_dpi": TREND_PREVIEW_DPI, "preview_quality": TREND_PREVIEW_QUALITY,
+        }
+        cache_key = chart_fingerprint([date_labels_ad, series], **render_params)
+        renditions = chart_cache.get_or_render_renditions(
+            cache_key,
+            TREND_RENDITIONS,
+            lambda: _render_trend_chart(date_labels_ad, series)
+        )
+        logger.info(
+            f"趨勢圖（{fuel}，{range_key}）：{len(sorted_dates_roc)} 個日期，"
+            f"原圖 {len(renditions['png'])} bytes，縮圖 {len(renditions['preview.jpg'])} bytes",
+            extra={"event": "chart.trend", "fuel": fuel, "range": range_key, "dates": len(sorted_dates_roc)}
+        )
+        return renditions
     except Exception as e:
         logger.error(f"生成油價趨勢圖表時發生錯誤: {str(e)}")
         import traceback
         logger.error(traceback.format_exc()) # Log full traceback
         return None
 
+def get_oil_price_trend(fuel=DEFAULT_TREND_FUEL, range_key=DEFAULT_TREND_RANGE):
+    """回傳趨勢圖原圖的 BytesIO（相容舊呼叫方式）。"""
+    renditions = get_trend_renditions(fuel, range_key)
+    if renditions is None:
+        return None
+    return BytesIO(renditions["png"])
+
+@STAGE_LATENCY.timed(stage='weekly_comparison')
 def get_weekly_oil_comparison():
     """
     Compares the current week's oil price with the last week's oil price for 95 Unleaded and Super Diesel.
     Returns a Flex Message containing the price changes with color-coded text.
     """
     try:
-        url = 'https://www.cpc.com.tw/historyprice.aspx?n=2890'
-        logger.info(f"開始抓取歷史油價數據進行週比週比較，URL: {url}")
-        response = requests.get(url)
-        response.raise_for_status()
-        html = response.text
-
-        dated_oil_prices = _parse_historical_oil_data(html)
+        logger.info(f"開始取得歷史油價數據進行週比週比較，URL: {CPC_HISTORY_URL}")
+        dated_oil_prices = get_historical_oil_data()
         if not dated_oil_prices:
             logger.error("沒有有效的歷史油價數據可供週比週比較")
             return None
@@ -429,58 +574,438 @@ def get_weekly_oil_comparison():
         logger.error(traceback.format_exc())
         return None
 
-def send_push_notification():
-    """發送推播訊息給所有訂閱用戶。"""
-    try:
-        # 載入訂閱用戶
-        subscribers = load_subscribers()
-        if not subscribers:
-            logger.info("沒有訂閱用戶，跳過推播。")
-            return
+HELP_TEXT = """📱 油價推播機器人使用說明：
+
+1️⃣ 訂閱油價：開始接收每週油價推播
+2️⃣ 取消訂閱：停止接收油價推播
+3️⃣ 測試推播：立即發送一次油價推播
+4️⃣ 訂閱人數：查看目前訂閱人數
+5️⃣ 查油價：查看本週油價（輸入「油價」可同時查看趨勢圖）
+6️⃣ 油價趨勢：查看油價趨勢圖（可指定油品與區間，例如「油價趨勢 柴油 1年」）
+7️⃣ 油價比較：查看本週與上週油價比較
+8️⃣ 提醒 95 1.5：95無鉛漲跌達 1.5 元時通知（也可用 2%、加上「漲」或「跌」）
+9️⃣ 我的提醒／取消提醒：查看或取消油價提醒
+🔟 油價預測：查看下週油價預測與預測準確度
+📖 說明：顯示此使用說明
+
+每週日中午 12 點會自動推播最新油價資訊！"""
+
+def format_price_message(oil_price_data, changes=None):
+    """組成本週油價訊息；有 changes 時在各油品後註明漲跌。"""
+    message = f"📊 本週油價資訊 ({oil_price_data['date_range']})\n\n"
+    for price in oil_price_data['oil_prices']:
+        change = (changes or {}).get(price['name'])
+        note = format_price_change(change) if change else ""
+        message += f"{price['name']}: {price['price']} 元/公升{note}\n"
+    return message
+
+# 已上傳到 ImageKit 的趨勢圖：內容雜湊 -> 公開網址，記錄在共享資料庫中讓所有 worker 共用
+def _open_upload_registry():
+    from image_uploads import UploadRegistry
+    return UploadRegistry(SUBSCRIBERS_DB)
+
+uploaded_images = LazyObject(_open_upload_registry)
+
+def upload_trend_image(image, extension='png'):
+    """上傳趨勢圖到 ImageKit 並回傳公開網址；相同內容（任何 worker 上傳過）只上傳一次。"""
+    digest = hashlib.sha256(image).hexdigest()[:16]
+    url = uploaded_images.get(digest)
+    if url is None:
+        from imagekitio.models.UploadFileRequestOptions import UploadFileRequestOptions
+        result = imagekit.upload_file(
+            file=base64.b64encode(image).decode('ascii'),
+            file_name=f"oil_trend_{digest}.{extension}",
+            options=UploadFileRequestOptions(use_unique_file_name=False, overwrite_file=True)
+        )
+        url = result.url
+        uploaded_images.put(digest, url)
+        logger.info(f"已上傳油價趨勢圖: {url}")
+    return url
+
+# 預先產生的回覆內容：有新油價時一次產生所有依賴資料的回覆，指令處理時只需查表
+def build_current_price_view():
+    oil_price_data = get_current_oil_price()
+    if not oil_price_data:
+        return None
+    return TextSendMessage(text=format_price_message(oil_price_data).rstrip())
+
+def build_weekly_comparison_view():
+    contents = get_weekly_oil_comparison()
+    if not contents:
+        return None
+    return FlexSendMessage(alt_text="本週與上週油價比較", contents=contents)
+
+# 下週油價預測：第一次以資料庫中的完整歷史建立模型，之後每週只做增量更新
+def _open_price_forecaster():
+    from price_forecast import PriceForecaster
+    return PriceForecaster(window=int(os.getenv('FORECAST_WINDOW', '8')))
+
+price_forecaster = LazyObject(_open_price_forecaster)
+
+def format_forecast_message(forecast, accuracy):
+    """組成下週油價預測訊息，並附上歷史回測的平均誤差與漲跌方向命中率。"""
+    message = f"🔮 下週油價預測（{date.fromordinal(forecast['date']):%Y/%m/%d} 起）\n\n"
+    for name, price in forecast['prices'].items():
+        last = forecast['last'][name]
+        if price is None or last is None:
+            continue
+        delta = round(price - last, 1)
+        note = "持平" if delta == 0 else f"{'漲' if delta > 0 else '跌'} {abs(delta):.1f}"
+        message += f"{name}: {price:.1f} 元/公升（預估{note}）\n"
+    scored = [stats for stats in accuracy.values() if stats]
+    if scored:
+        mae = sum(stats['mae'] for stats in scored) / len(scored)
+        direction = sum(stats['direction'] for stats in scored) / len(scored)
+        weeks = max(stats['samples'] for stats in scored)
+        message += f"\n📏 預測準確度（回測 {weeks} 週）：平均誤差 {mae:.2f} 元，漲跌方向命中 {direction:.0%}\n"
+    message += f"※ 依近 {price_forecaster.window} 週價格的線性趨勢估計，僅供參考"
+    return message
+
+def build_forecast_view():
+    # 先確認官網是否有新資料（新資料會寫入資料庫），再將新增的週次增量更新到模型
+    get_historical_oil_data()
+    dates, prices = price_store.range()
+    price_forecaster.sync(dates, prices)
+    forecast = price_forecaster.forecast()
+    if not forecast:
+        return None
+    return TextSendMessage(text=format_forecast_message(forecast, price_forecaster.accuracy()))
 
+def build_trend_view(fuel, range_key):
+    renditions = get_trend_renditions(fuel, range_key)
+    if not renditions:
+        return None
+    return ImageSendMessage(
+        original_content_url=upload_trend_image(renditions["png"], "png"),
+        preview_image_url=upload_trend_image(renditions["preview.jpg"], "jpg")
+    )
+
+# 需要多個上游資料的回覆（例如「油價」的本週油價加趨勢圖）：各項目在獨立執行緒中抓取與解析，
+# 趨勢圖另交給繪圖程序，回覆延遲為最慢的一項而不是各項的總和
+gather_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('GATHER_WORKERS', '8')), thread_name_prefix='gather')
+
+def gather(legs):
+    """同時執行 {名稱: 無參數函式}，回傳 {名稱: 結果}；發生錯誤的項目記錄後回傳 None。"""
+    with STAGE_LATENCY.time(stage='gather'):
+        futures = {name: gather_executor.submit(func) for name, func in legs.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                logger.error(f"同時取得 {name} 時發生錯誤: {str(e)}")
+                results[name] = None
+        return results
+
+def oil_price_reply(fuel=DEFAULT_TREND_FUEL, range_key=DEFAULT_TREND_RANGE):
+    """
+    「油價」指令：本週油價文字加上趨勢圖。兩者都已預先產生時直接查表；
+    否則同時抓取首頁與歷史頁面，完成後再在背景更新預先產生的內容。
+    """
+    trend_name = trend_view_name(fuel, range_key)
+    builders = {
+        "current_price": build_current_price_view,
+        trend_name: functools.partial(build_trend_view, fuel, range_key),
+    }
+    messages = {name: reply_views.get(name) for name in builders}
+    missing = {name: builders[name] for name, message in messages.items() if message is None}
+    if missing:
+        messages.update(gather(missing))
+        reply_views.refresh_in_background()
+    messages = [message for message in messages.values() if message is not None]
+    return messages or TextSendMessage(text="無法取得油價資訊，請稍後再試！")
+
+reply_views = ReplyViews(
+    {
+        "current_price": build_current_price_view,
+        "weekly_comparison": build_weekly_comparison_view,
+        "forecast": build_forecast_view,
+        "help": lambda: TextSendMessage(text=HELP_TEXT),
+        # 每種油品與區間的趨勢圖，例如「油價趨勢 柴油 1年」
+        **{
+            trend_view_name(fuel, range_key): functools.partial(build_trend_view, fuel, range_key)
+            for fuel, range_key in trend_variants()
+        },
+    },
+    path=os.getenv('REPLY_VIEWS_PATH', 'reply_views.json'),
+    # 多個趨勢圖可同時交給繪圖程序池
+    workers=max(1, chart_renderer.processes)
+)
+
+# 個人油價提醒規則（與訂閱用戶存放在同一個資料庫）
+def _open_alert_engine():
+    from price_alerts import PriceAlertEngine
+    return PriceAlertEngine(SUBSCRIBERS_DB)
+
+alert_engine = LazyObject(_open_alert_engine)
+
+# 油價變動偵測：只有價格與上次推播時不同才發送
+PRICE_SNAPSHOT_PATH = os.getenv('PRICE_SNAPSHOT_PATH', 'last_price_snapshot.json')
+price_change_detector = PriceChangeDetector(PRICE_SNAPSHOT_PATH)
+
+def format_price_change(change):
+    """將單一油品的變動轉為「（漲 0.2）」之類的說明文字。"""
+    if change['delta'] is None:
+        return ""
+    status = "漲" if change['delta'] > 0 else "跌"
+    return f"（{status} {abs(change['delta']):.1f}）"
+
+def send_price_alerts(changes, date_range=None):
+    """依使用者設定的提醒規則，推播油價變動提醒（經由推播 outbox，重新執行時不會重複發送）。"""
+    triggered = alert_engine.evaluate(changes)
+    if not triggered:
+        return []
+
+    # 觸發相同油品組合的使用者共用同一則訊息，以 multicast 分批發送
+    groups = defaultdict(list)
+    for user_id, fuels in triggered.items():
+        groups[tuple(sorted(set(fuels)))].append(user_id)
+
+    reports = []
+    for fuels, user_ids in groups.items():
+        lines = [
+            f"{fuel}: {changes[fuel]['previous']} → {changes[fuel]['current']} 元/公升{format_price_change(changes[fuel])}"
+            for fuel in fuels
+        ]
+        text = "🔔 油價變動提醒\n\n" + "\n".join(lines)
+        dedupe_key = f"alert:{date_range}:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+        reports.append(deliver_push("alert", user_ids, [TextSendMessage(text=text)], dedupe_key=dedupe_key))
+    logger.info(f"已發送油價提醒給 {len(triggered)} 位使用者")
+    return reports
+
+@STAGE_LATENCY.timed(stage='push_notification')
+def send_push_notification(force=False):
+    """
+    發送推播訊息給所有訂閱用戶，並依個人提醒規則發送變動提醒。
+    只有油價與上次推播的快照不同時才會發送；force=True（例如「測試推播」）則不論是否變動都發送，
+    但不觸發個人提醒、也不更新快照，油價變動仍留給正式排程推播與提醒。
+    """
+    try:
         # 取得當前油價
         oil_price_data = get_current_oil_price()
         if not oil_price_data:
             logger.error("無法取得油價資料，跳過推播。")
             return
 
-        # 建立推播訊息
-        message = f"📊 本週油價資訊 ({oil_price_data['date_range']})\n\n"
-        for price in oil_price_data['oil_prices']:
-            message += f"{price['name']}: {price['price']} 元/公升\n"
+        # 與上次推播的價格比較
+        changes = price_change_detector.detect(oil_price_data)
+        if not changes and not force:
+            logger.info("油價與上次推播相同，跳過推播。")
+            return
 
-        # 發送推播訊息給所有訂閱用戶
-        for user_id in subscribers:
-            try:
-                line_bot_api.push_message(
-                    user_id,
-                    TextSendMessage(text=message)
-                )
-                logger.info(f"成功發送推播訊息給用戶 {user_id}")
-            except Exception as e:
-                logger.error(f"發送推播訊息給用戶 {user_id} 時發生錯誤: {str(e)}")
+        alert_reports = send_price_alerts(changes, oil_price_data.get('date_range')) if changes and not force else []
+
+        if changes:
+            reply_views.refresh_in_background()
+
+        report = None
+        if subscriber_store.count() == 0:
+            logger.info("沒有訂閱用戶，跳過推播。")
+        else:
+            # 建立推播訊息
+            message = format_price_message(oil_price_data, changes)
+
+            # 先寫入推播 outbox，再以 multicast 分批並行發送給所有訂閱用戶；
+            # 同一份油價訊息只會建立一次推播工作，中斷後由排程從未完成的批次繼續
+            dedupe_key = None
+            if not force:
+                digest = hashlib.sha256(message.encode('utf-8')).hexdigest()[:16]
+                dedupe_key = f"broadcast:{oil_price_data.get('date_range')}:{digest}"
+            report = deliver_push(
+                "broadcast", subscriber_store.iter_subscribers(), [TextSendMessage(text=message)], dedupe_key=dedupe_key
+            )
+
+        # 推播工作已寫入 outbox 即確定會送達（失敗的批次由排程重試），因此可以更新快照
+        if not force and (report is not None or alert_reports):
+            price_change_detector.commit(oil_price_data)
+        return report
 
     except Exception as e:
         logger.error(f"執行推播任務時發生錯誤: {str(e)}")
 
+# 推播分批發送器（multicast 每批最多 500 人）
+push_fanout = PushFanout(
+    line_bot_api,
+    max_workers=int(os.getenv('PUSH_WORKERS', '4')),
+    rate_per_sec=float(os.getenv('PUSH_RATE_PER_SEC', '100')),
+    on_batch=lambda result: PUSH_BATCH_LATENCY.observe(result['elapsed'], result='ok' if result['ok'] else 'failed')
+)
+
+# 推播 outbox：先將推播工作與所有批次寫入資料庫再發送，每批完成後記錄檢查點，
+# 程序重新啟動後由排程從尚未確認的批次繼續，並依排程重試失敗的批次
+def _open_push_outbox():
+    from push_outbox import PushOutbox
+    return PushOutbox(
+        SUBSCRIBERS_DB,
+        max_attempts=int(os.getenv('PUSH_MAX_ATTEMPTS', '5')),
+        retry_delay=float(os.getenv('PUSH_RETRY_DELAY', '300')),
+        lease=float(os.getenv('PUSH_BATCH_LEASE', '300'))
+    )
+
+push_outbox = LazyObject(_open_push_outbox)
+
+# 分片推播（PUSH_SHARDS > 1）：用戶依 user_id 的雜湊分成多個分片，各 instance / worker 經由共享資料庫
+# 取得部分分片並只發送這些分片的批次；節點加入或離開時分片自動重新分配
+PUSH_SHARDS = int(os.getenv('PUSH_SHARDS', '1'))
+
+def _open_push_shard_coordinator():
+    from push_shards import ShardCoordinator
+    return ShardCoordinator(
+        SUBSCRIBERS_DB,
+        PUSH_SHARDS,
+        ttl=float(os.getenv('PUSH_SHARD_TTL', '30')),
+        heartbeat_interval=float(os.getenv('PUSH_SHARD_HEARTBEAT', '10'))
+    )
+
+push_shard_coordinator = LazyObject(_open_push_shard_coordinator)
+# 分片的取得與釋放只在兩次發送之間進行，避免釋放正在發送中的分片
+_push_shard_lock = threading.Lock()
+
+def deliver_push(kind, user_ids, messages, dedupe_key=None):
+    """
+    寫入推播 outbox 後立即發送，回傳推播工作的報告（sent / failed / pending / duration）。
+    分片推播時本程序只發送自己持有的分片，其餘分片由其他節點的 drain_push_shards 發送。
+    """
+    job_id = push_outbox.enqueue(kind, user_ids, messages, dedupe_key=dedupe_key, shards=PUSH_SHARDS)
+    if PUSH_SHARDS > 1:
+        reports = drain_push_shards(job_id)
+    else:
+        reports = push_outbox.drain(push_fanout, job_id)
+    return reports[0] if reports else push_outbox.report(job_id)
+
+def drain_push_shards(job_id=None):
+    """分片推播：依目前存活的節點重新分配分片，再發送 outbox 中屬於本程序分片的到期批次。"""
+    with _push_shard_lock:
+        shards = push_shard_coordinator.rebalance()
+        return push_outbox.drain(push_fanout, job_id, shards=shards)
+
+def resume_push_jobs():
+    """繼續發送中斷的推播工作，並重試已到期的失敗批次。"""
+    if not push_outbox.pending_jobs():
+        return []
+    logger.info("繼續發送推播 outbox 中未完成的工作")
+    return push_outbox.drain(push_fanout)
+
+# 排程工作的 leader 選舉：每個 worker / instance 都會啟動排程器，
+# 但只有持有共享資料庫中租約的程序會真的執行工作；leader 終止後租約到期即由其他程序接手
+scheduler_elector = LazyObject(lambda: LeaseElector(
+    SUBSCRIBERS_DB,
+    'scheduler',
+    ttl=float(os.getenv('SCHEDULER_LEASE_TTL', '30')),
+    renew_interval=float(os.getenv('SCHEDULER_LEASE_RENEW', '10'))
+))
+
+def run_if_leader(job):
+    """包裝排程工作，只有 leader 程序才會執行。"""
+    @functools.wraps(job)
+    def wrapper(*args, **kwargs):
+        if not scheduler_elector.is_leader():
+            leader = scheduler_elector.current_leader()
+            logger.info(f"本程序不是 leader（目前 leader: {leader['holder'] if leader else '無'}），略過排程工作 {job.__name__}")
+            return None
+        return job(*args, **kwargs)
+    return wrapper
+
+REPLY_VIEWS_REFRESH_SECONDS = int(os.getenv('REPLY_VIEWS_REFRESH_MINUTES', '10')) * 60
+
+def sync_reply_views():
+    """
+    定期更新預先產生的回覆內容：只有 leader 重新產生並寫入共享檔案，其他 worker 在檔案更新時重新載入，
+    避免每個 worker 各自抓取中油網站與上傳圖片。共享檔案超過兩個週期沒有更新
+    （例如 leader 在另一台沒有共用檔案的主機上）時才自行重新產生。
+    """
+    age = reply_views.file_age()
+    if scheduler_elector.is_leader():
+        if age is None or age >= REPLY_VIEWS_REFRESH_SECONDS:
+            return reply_views.refresh()
+        return []
+    reply_views.reload_if_changed()
+    if age is None or age >= 2 * REPLY_VIEWS_REFRESH_SECONDS:
+        return reply_views.refresh()
+    return []
+
+# leader 交接時，補跑這段時間內錯過的每週推播
+PUSH_CATCH_UP_SECONDS = float(os.getenv('PUSH_CATCH_UP_MINUTES', '360')) * 60
+
+def catch_up_weekly_push(trigger, now=None):
+    """
+    新取得 leader 時呼叫：若最近 PUSH_CATCH_UP_MINUTES 內有每週推播的排程時間（當時可能沒有程序持有租約，
+    各 worker 都略過了），補跑一次。send_push_notification 以快照與 outbox dedupe key 避免重複推播，
+    原 leader 已推播過時不會再次發送。
+    """
+    now = now or datetime.now(trigger.timezone)
+    missed = trigger.get_next_fire_time(None, now - timedelta(seconds=PUSH_CATCH_UP_SECONDS))
+    if missed is None or missed > now:
+        return None
+    logger.info(f"接手 leader：{missed} 的每週推播可能已錯過，補跑一次")
+    return send_push_notification()
+
 # 設定排程器
 def init_scheduler():
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+
     logger.info("開始設定排程器...")
     scheduler = BackgroundScheduler(timezone='Asia/Singapore')
     logger.info("排程器時區設定為：Asia/Singapore")
 
     # 正式用：每週日中午12點執行
+    weekly_trigger = CronTrigger(day_of_week='sun', hour=12, minute=0, timezone=scheduler.timezone)
     scheduler.add_job(
-        send_push_notification,
-        'cron',
-        day_of_week='sun',
-        hour=12,
-        minute=0,
+        run_if_leader(send_push_notification),
+        weekly_trigger,
         id='oil_price_notification',
         replace_existing=True
     )
     logger.info("已設定每週日中午 12 點執行排程任務")
 
+    # 取得 leader 租約時（包含原 leader 在排程時間前後終止而由本程序接手），交由排程器在背景補跑錯過的推播，
+    # 不佔用續約租約的執行緒
+    def catch_up_push_notification():
+        return catch_up_weekly_push(weekly_trigger)
+
+    scheduler_elector.on_acquire = lambda: scheduler.add_job(
+        run_if_leader(catch_up_push_notification),
+        id='oil_price_catch_up',
+        misfire_grace_time=None,
+        replace_existing=True
+    )
+    scheduler_elector.try_acquire()
+    scheduler_elector.start()
+    atexit.register(scheduler_elector.stop)
+
+    if PUSH_SHARDS > 1:
+        # 分片推播：每個程序都定期檢查 outbox，發送自己分片的批次（包含中斷與失敗重試的批次）
+        push_shard_coordinator.start()
+        atexit.register(push_shard_coordinator.stop)
+        scheduler.add_job(
+            drain_push_shards,
+            'interval',
+            seconds=float(os.getenv('PUSH_SHARD_POLL_SECONDS', '5')),
+            id='push_shards_drain',
+            replace_existing=True
+        )
+        logger.info(f"已啟用分片推播（{PUSH_SHARDS} 個分片，節點 {push_shard_coordinator.node_id}）")
+    else:
+        # 程序重新啟動或部署後繼續未完成的推播，並重試失敗的批次
+        scheduler.add_job(
+            run_if_leader(resume_push_jobs),
+            'interval',
+            minutes=int(os.getenv('PUSH_RESUME_MINUTES', '5')),
+            id='push_outbox_resume',
+            replace_existing=True
+        )
+
+    # 每個程序都會檢查，但只有 leader（或共享檔案太久沒更新時）重新產生回覆內容
+    scheduler.add_job(
+        sync_reply_views,
+        'interval',
+        seconds=int(os.getenv('REPLY_VIEWS_SYNC_SECONDS', '60')),
+        id='reply_views_refresh',
+        replace_existing=True
+    )
+
     try:
         scheduler.start()
         logger.info("排程器成功啟動！")
@@ -488,47 +1013,323 @@ def init_scheduler():
         logger.error(f"排程器啟動失敗：{str(e)}")
         raise e
 
-# 在應用程式啟動時初始化排程器
-init_scheduler()
+def warm_up():
+    """啟動排程器並預先載入較重的相依套件與用戶端，讓第一個請求不必等待。"""
+    try:
+        init_scheduler()
+    except Exception as e:
+        logger.error(f"預熱時啟動排程器失敗: {str(e)}")
+    for name, load in (
+        ("繪圖程序", chart_renderer.start),
+        ("LINE API", lambda: line_bot_api.get_bot_info),
+        ("ImageKit", lambda: imagekit.url),
+        ("訂閱用戶資料庫", subscriber_store.count),
+        ("油價歷史資料庫", price_store.latest_date),
+        ("回覆內容", reply_views.refresh),
+    ):
+        try:
+            load()
+        except Exception as e:
+            logger.warning(f"預熱 {name} 時發生錯誤: {str(e)}")
+    logger.info("背景預熱完成")
+
+atexit.register(chart_renderer.close)
+
+# 啟動模式：預設在背景延遲預熱（worker 可先開始接受請求）；LAZY_STARTUP=0 則於匯入時同步完成
+if __name__ == '__mp_main__':
+    # 直接執行本檔時，繪圖子程序（spawn）會以 __mp_main__ 名稱重新匯入本檔，子程序不需要預熱
+    pass
+elif os.getenv('LAZY_STARTUP', '1') == '0':
+    warm_up()
+else:
+    _warm_up_timer = threading.Timer(float(os.getenv('WARMUP_DELAY', '1')), warm_up)
+    _warm_up_timer.daemon = True
+    _warm_up_timer.start()
 
 @app.route("/", methods=['GET'])
 def health_check():
     """健康檢查端點"""
     return "OK", 200
 
+def _cache_events():
+    history = history_cache.stats()
+    charts = chart_cache.stats()
+    return {
+        ('history', 'hit'): history['hits'],
+        ('history', 'stale_hit'): history['stale_hits'],
+        ('history', 'miss'): history['misses'],
+        ('history', 'not_modified'): history['not_modified'],
+        ('chart', 'hit'): charts['hits'],
+        ('chart', 'disk_hit'): charts['disk_hits'],
+        ('chart', 'miss'): charts['misses'],
+        ('reply_views', 'hit'): reply_views.hits,
+        ('reply_views', 'miss'): reply_views.misses,
+    }
+
+metrics_registry.counter(
+    'oil_bot_cache_events_total', '歷史頁面、趨勢圖與預先產生回覆的命中／未命中次數', ['cache', 'result'], func=_cache_events)
+metrics_registry.gauge(
+    'oil_bot_circuit_open', '中油網站熔斷器是否開啟（1 為開啟或半開）',
+    func=lambda: 0 if cpc_client.breaker.state == "closed" else 1)
+metrics_registry.counter(
+    'oil_bot_circuit_rejected_total', '熔斷期間直接拒絕的中油請求數', func=lambda: cpc_client.breaker.rejected)
+metrics_registry.counter(
+    'oil_bot_chart_renders_total', '繪圖程序池的繪圖結果', ['result'],
+    func=lambda: {key: value for key, value in chart_renderer.stats().items()
+                  if key in ('rendered', 'timeouts', 'rejected')})
+metrics_registry.gauge(
+    'oil_bot_subscribers', '目前訂閱人數', func=lambda: subscriber_store.count())
+metrics_registry.gauge(
+    'oil_bot_push_shards_owned', '本程序目前持有的推播分片數（未啟用分片推播時為 0）',
+    func=lambda: len(push_shard_coordinator.owned()) if PUSH_SHARDS > 1 else 0)
+metrics_registry.gauge(
+    'oil_bot_webhook_queue_depth', 'webhook 佇列中等待處理的事件數', func=lambda: event_dispatcher.depth())
+metrics_registry.counter(
+    'oil_bot_webhook_events_total', 'webhook 事件處理結果', ['result'],
+    func=lambda: {key: value for key, value in event_dispatcher.stats().items()
+                  if key in ('enqueued', 'processed', 'failed', 'rejected')})
+WEBHOOK_COALESCED = metrics_registry.counter(
+    'oil_bot_webhook_coalesced_total', '同一批 webhook 中與其他相同指令合併處理的事件數')
+metrics_registry.counter(
+    'oil_bot_webhook_duplicates_total', '因 webhookEventId 重複而略過的事件數',
+    func=lambda: event_deduplicator.duplicates)
+
+metrics_registry.counter(
+    'oil_bot_log_records_dropped_total', '未輸出的日誌紀錄數（佇列已滿、抽樣、超過每秒上限）', ['reason'],
+    func=lambda: {key: value for key, value in log_pipeline.stats().items()
+                  if key in ('dropped', 'sampled_out', 'rate_limited')})
+
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    """Prometheus 文字格式的效能指標"""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route("/webhook", methods=['POST'])
 def callback():
     # 取得 X-Line-Signature header 值
     signature = request.headers['X-Line-Signature']
-    logger.info(f"收到 webhook 請求，signature: {signature}")
 
-    # 取得請求內容
+    # 取得請求內容（內容含使用者訊息，只在 DEBUG 層級記錄）
     body = request.get_data(as_text=True)
-    logger.info("Request body: " + body)
-    
+    logger.debug("Request body: " + body)
+
+    # 只驗證簽名並解析事件，實際處理交給背景工作執行緒，立即回應 LINE
     try:
-        handler.handle(body, signature)
-        logger.info("成功處理 webhook 請求")
+        events = handler.parser.parse(body, signature)
     except InvalidSignatureError:
         logger.error("無效的簽名")
         abort(400)
     except Exception as e:
-        logger.error(f"處理 webhook 請求時發生錯誤: {str(e)}")
+        logger.error(f"解析 webhook 請求時發生錯誤: {str(e)}")
         abort(500)
 
+    # 丟棄 LINE 重送的重複事件，再將同一批中相同的查詢指令合併，共用同一次資料查詢
+    accepted = [event for event in events if event_deduplicator.add(event.webhook_event_id)]
+    items = coalesce(accepted, coalesce_key)
+    coalesced = len(accepted) - len(items)
+    if coalesced:
+        WEBHOOK_COALESCED.inc(coalesced)
+
+    for index, item in enumerate(items):
+        if not event_dispatcher.submit(item):
+            # 佇列已滿：回應 503 讓 LINE 稍後重送，尚未放入佇列的事件不算已處理
+            for pending in items[index:]:
+                for event in (pending.events if isinstance(pending, CoalescedEvents) else [pending]):
+                    event_deduplicator.discard(event.webhook_event_id)
+            abort(503)
+
+    logger.info(
+        f"收到 {len(events)} 個 webhook 事件：重複 {len(events) - len(accepted)} 個，"
+        f"合併 {coalesced} 個，放入佇列 {len(items)} 項",
+        extra={"event": "webhook.batch", "events": len(events), "duplicates": len(events) - len(accepted),
+               "coalesced": coalesced, "queued": len(items)}
+    )
     return 'OK'
 
+@app.route("/webhook/stats", methods=['GET'])
+def webhook_stats():
+    """回傳 webhook 佇列深度、等待時間與去重複統計"""
+    stats = event_dispatcher.stats()
+    stats["duplicates"] = event_deduplicator.duplicates
+    stats["coalesced"] = WEBHOOK_COALESCED.value()
+    return jsonify(stats)
+
+@app.route("/leader", methods=['GET'])
+def leader_status():
+    """回傳目前持有排程租約的程序"""
+    return jsonify({
+        "leader": scheduler_elector.current_leader(),
+        "this_process": scheduler_elector.holder_id,
+        "is_leader": scheduler_elector.is_leader()
+    })
+
+@app.route("/push/outbox", methods=['GET'])
+def push_outbox_status():
+    """回傳推播 outbox 中尚未完成的推播工作"""
+    return jsonify([push_outbox.report(job_id) for job_id in push_outbox.pending_jobs()])
+
+@app.route("/push/shards", methods=['GET'])
+def push_shards_status():
+    """回傳分片推播的存活節點、目標分配與目前持有的分片"""
+    if PUSH_SHARDS <= 1:
+        return jsonify({"enabled": False})
+    return jsonify({
+        "enabled": True,
+        "shards": PUSH_SHARDS,
+        "this_process": push_shard_coordinator.node_id,
+        "owned": push_shard_coordinator.owned(),
+        "nodes": push_shard_coordinator.nodes(),
+        "assignment": push_shard_coordinator.assignment(),
+        "leases": push_shard_coordinator.leases(),
+    })
+
+def dispatch_event(event):
+    """在工作執行緒中依事件類型分派給對應的處理函式。"""
+    if isinstance(event, CoalescedEvents):
+        handle_coalesced(event)
+    elif isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
+    else:
+        logger.info(f"略過不支援的事件類型: {event.__class__.__name__}")
+
+# 已處理過的 webhookEventId（LINE 重送時略過）：記錄在各 worker 共用的資料庫中，重送到其他 worker 也會被略過。
+# 每個事件都會寫入，因此使用獨立的資料庫檔案，不與訂閱名單、租約與 outbox 共用寫入鎖
+WEBHOOK_DEDUP_DB = os.getenv('WEBHOOK_DEDUP_DB', 'webhook_events.db')
+
+event_deduplicator = LazyObject(lambda: EventDeduplicator(
+    WEBHOOK_DEDUP_DB,
+    ttl=float(os.getenv('WEBHOOK_DEDUP_TTL', '3600'))
+))
+
+# webhook 事件工作佇列
+event_dispatcher = EventDispatcher(
+    dispatch_event,
+    workers=int(os.getenv('WEBHOOK_WORKERS', '4')),
+    maxsize=int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+)
+
+# 指令名稱（作為指標標籤；其他文字一律歸為「其他」，避免標籤數量無限增長）
+COMMAND_NAMES = ("訂閱油價", "取消訂閱", "訂閱人數", "油價", "查油價", "油價趨勢", "油價比較", "油價預測", "測試推播", "取消提醒", "我的提醒", "說明")
+
+def command_label(text):
+    if text in COMMAND_NAMES:
+        return text
+    if text.startswith("提醒"):
+        return "提醒"
+    if text.startswith("油價趨勢"):
+        return "油價趨勢"
+    return "其他"
+
+def timed_command(func):
+    """記錄每個指令分支的處理耗時。"""
+    @functools.wraps(func)
+    def wrapper(event):
+        with COMMAND_LATENCY.time(command=command_label(event.message.text)):
+            return func(event)
+    return wrapper
+
+def view_message(name, unavailable_text):
+    """取得預先產生的回覆內容；尚未產生時回傳提示文字並在背景產生。"""
+    message = reply_views.get(name)
+    if message is None:
+        reply_views.refresh_in_background()
+        message = TextSendMessage(text=unavailable_text)
+    return message
+
+# 回覆內容與使用者無關的指令：同一批 webhook 中的相同指令只需處理一次
+SHARED_COMMANDS = ("訂閱人數", "油價", "查油價", "油價比較", "油價預測", "測試推播", "說明")
+
+def is_shared_command(text):
+    return text in SHARED_COMMANDS or text.startswith("油價趨勢")
+
+def coalesce_key(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage) and is_shared_command(event.message.text):
+        return event.message.text
+    return None
+
+def shared_reply(text):
+    """產生與使用者無關的指令的回覆訊息；其他指令回傳 None。"""
+    # 處理訂閱人數指令
+    if text == "訂閱人數":
+        return TextSendMessage(text=f"目前共有 {subscriber_store.count()} 人訂閱油價推播！")
+
+    # 處理油價指令：本週油價與趨勢圖同時取得
+    if text == "油價":
+        return oil_price_reply()
+
+    # 處理查油價指令
+    if text == "查油價":
+        return view_message("current_price", "無法取得本週油價，請稍後再試！")
+
+    # 處理油價趨勢指令，例如「油價趨勢」、「油價趨勢 柴油 1年」
+    if text.startswith("油價趨勢"):
+        options = parse_trend_command(text)
+        if options:
+            return view_message(trend_view_name(options["fuel"], options["range"]), "無法取得油價趨勢圖，請稍後再試！")
+        return TextSendMessage(text=f"格式：油價趨勢 [{'/'.join(TREND_FUELS)}] [{'/'.join(TREND_RANGES)}]\n例如：油價趨勢 柴油 1年")
+
+    # 處理油價比較指令
+    if text == "油價比較":
+        return view_message("weekly_comparison", "無法取得油價比較，請稍後再試！")
+
+    # 處理油價預測指令
+    if text == "油價預測":
+        return view_message("forecast", "無法產生油價預測，請稍後再試！")
+
+    # 處理測試推播指令
+    if text == "測試推播":
+        try:
+            send_push_notification(force=True)
+            return TextSendMessage(text="已發送測試推播！")
+        except Exception as e:
+            logger.error(f"發送測試推播時發生錯誤: {str(e)}")
+            return TextSendMessage(text="發送測試推播時發生錯誤，請稍後再試！")
+
+    # 處理說明指令
+    if text == "說明":
+        return reply_views.get("help") or TextSendMessage(text=HELP_TEXT)
+
+    return None
+
+def handle_coalesced(group):
+    """同一批 webhook 中相同指令的多個事件：回覆內容只產生一次，再分別回覆每個事件。"""
+    logger.info(
+        f"合併處理 {len(group)} 個「{group.key}」指令",
+        extra={"event": "webhook.message", "command": command_label(group.key), "events": len(group)}
+    )
+    with COMMAND_LATENCY.time(command=command_label(group.key)):
+        message = shared_reply(group.key)
+        for event in group.events:
+            # 單一 reply token 失效（例如 LINE 回傳 400）時仍繼續回覆同組的其他用戶；
+            # 失敗次數已由 _instrument_line_call 計入 UPSTREAM_ERRORS
+            try:
+                line_bot_api.reply_message(event.reply_token, message)
+            except Exception as e:
+                logger.error(
+                    f"回覆「{group.key}」指令時發生錯誤: {str(e)}",
+                    extra={"event": "webhook.reply_failed", "command": command_label(group.key),
+                           "user_id": event.source.user_id}
+                )
+
 @handler.add(MessageEvent, message=TextMessage)
+@timed_command
 def handle_message(event):
     """處理收到的文字訊息"""
-    logger.info(f"收到訊息: {event.message.text}")
-    logger.info(f"訊息來源: {event.source.user_id}")
+    logger.info(
+        f"收到訊息: {event.message.text}",
+        extra={"event": "webhook.message", "command": command_label(event.message.text), "user_id": event.source.user_id}
+    )
     
     # 取得用戶 ID
     user_id = event.source.user_id
     
+    # 與使用者無關的指令（查詢、測試推播、說明）
+    message = shared_reply(event.message.text)
+    if message is not None:
+        line_bot_api.reply_message(event.reply_token, message)
+
     # 處理訂閱指令
-    if event.message.text == "訂閱油價":
+    elif event.message.text == "訂閱油價":
         if add_subscriber(user_id):
             line_bot_api.reply_message(
                 event.reply_token,
@@ -553,63 +1354,42 @@ def handle_message(event):
                 TextSendMessage(text="您尚未訂閱油價推播！")
             )
     
-    # 處理訂閱人數指令
-    elif event.message.text == "訂閱人數":
-        subscribers = load_subscribers()
+    # 處理設定價格提醒指令，例如「提醒 95 1.5」、「提醒 柴油 2% 漲」
+    elif event.message.text.startswith("提醒"):
+        rule = parse_alert_command(event.message.text)
+        if rule:
+            alert_engine.set_rule(user_id, **rule)
+            reply_text = f"已設定提醒：{describe_rule(rule)}時通知您！"
+        else:
+            reply_text = "格式：提醒 <92/95/98/柴油> <金額或百分比> [漲/跌]\n例如：提醒 95 1.5、提醒 柴油 2% 漲"
         line_bot_api.reply_message(
             event.reply_token,
-            TextSendMessage(text=f"目前共有 {len(subscribers)} 人訂閱油價推播！")
+            TextSendMessage(text=reply_text)
         )
-    
-    # 處理油價趨勢指令
-    elif event.message.text == "油價趨勢":
-        trend_buffer = get_oil_price_trend()
-        if trend_buffer:
-            line_bot_api.reply_message(
-                event.reply_token,
-                ImageSendMessage(
-                    original_content_url=trend_buffer,
-                    preview_image_url=trend_buffer
-                )
-            )
-        else:
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="無法取得油價趨勢圖，請稍後再試！")
-            )
-    
-    # 處理測試推播指令
-    elif event.message.text == "測試推播":
-        try:
-            send_push_notification()
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="已發送測試推播！")
-            )
-        except Exception as e:
-            logger.error(f"發送測試推播時發生錯誤: {str(e)}")
-            line_bot_api.reply_message(
-                event.reply_token,
-                TextSendMessage(text="發送測試推播時發生錯誤，請稍後再試！")
-            )
-    
-    # 處理說明指令
-    elif event.message.text == "說明":
-        help_text = """📱 油價推播機器人使用說明：
 
-1️⃣ 訂閱油價：開始接收每週油價推播
-2️⃣ 取消訂閱：停止接收油價推播
-3️⃣ 測試推播：立即發送一次油價推播
-4️⃣ 訂閱人數：查看目前訂閱人數
-5️⃣ 油價趨勢：查看油價趨勢圖
-6️⃣ 說明：顯示此使用說明
+    # 處理取消價格提醒指令
+    elif event.message.text == "取消提醒":
+        if alert_engine.remove_rules(user_id):
+            reply_text = "已取消您所有的油價提醒！"
+        else:
+            reply_text = "您尚未設定油價提醒！"
+        line_bot_api.reply_message(
+            event.reply_token,
+            TextSendMessage(text=reply_text)
+        )
 
-每週日中午 12 點會自動推播最新油價資訊！"""
+    # 處理查詢價格提醒指令
+    elif event.message.text == "我的提醒":
+        rules = alert_engine.list_rules(user_id)
+        if rules:
+            reply_text = "您的油價提醒：\n" + "\n".join(f"・{describe_rule(rule)}" for rule in rules)
+        else:
+            reply_text = "您尚未設定油價提醒！"
         line_bot_api.reply_message(
             event.reply_token,
-            TextSendMessage(text=help_text)
+            TextSendMessage(text=reply_text)
         )
-    
+
     # 處理其他訊息
     else:
         line_bot_api.reply_message(
@@ -0,0 +1,405 @@
+"""
+壓力測試：以正確簽章（X-Line-Signature，使用測試用 channel secret）的 webhook 請求，
+依設定的速率與指令比例對 Flask 服務施壓。LINE Messaging API 與中油網站都換成本地替身伺服器
+（延遲與錯誤率可調整），結果包含吞吐量、p50/p95/p99 延遲與錯誤率：
+
+- ack：webhook 請求從「排定送出時間」到收到 HTTP 回應的時間（以排定時間計算，
+  送出端塞車時的等待也會算進延遲）。
+- reply：從排定送出時間到替身 LINE 伺服器收到該事件回覆的時間（端對端延遲）。
+
+預設在本程序中啟動機器人（HTTP 伺服器），也可以用 --subscribers 建立大量訂閱用戶，
+並以 --push 在壓測開始時同時發送一次推播。若要對已啟動的服務施壓，使用 --target，
+並將該服務的 LINE_API_ENDPOINT、CPC_HOME_URL、CPC_HISTORY_URL 指向本程式印出的替身位址
+（可用 --line-port / --cpc-port 固定埠號）。
+
+用法：python loadtest.py [--rate 200] [--duration 10] [--mix 油價趨勢=6,查油價=3,訂閱油價=1]
+                         [--users 5000] [--batch 1] [--concurrency 32] [--line-latency 0.05]
+                         [--subscribers 100000 --push] [--target http://127.0.0.1:5000/webhook]
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bench_commands import start_cpc_stand_in
+
+DEFAULT_SECRET = 'loadtest-secret'
+DEFAULT_MIX = '油價趨勢=6,查油價=3,訂閱油價=1'
+
+
+def sign(body, secret):
+    """計算 LINE webhook 的 X-Line-Signature（HMAC-SHA256 後以 base64 編碼）。"""
+    return base64.b64encode(hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()).decode('ascii')
+
+
+def parse_mix(text):
+    """解析 "油價趨勢=6,查油價=3" 為 [(指令, 權重)]。"""
+    mix = []
+    for item in text.split(','):
+        if '=' in item:
+            command, weight = item.rsplit('=', 1)
+            mix.append((command.strip(), float(weight)))
+        elif item.strip():
+            mix.append((item.strip(), 1.0))
+    return mix
+
+
+def percentiles(values):
+    """回傳 p50/p95/p99/max（毫秒，nearest-rank）；沒有資料時為 None。"""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {name: round(rank(p) * 1000, 3) for name, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))}
+
+
+class LineRecorder:
+    """記錄替身 LINE 伺服器收到的呼叫；回覆以 replyToken 對應到送出時間。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.replies = {}
+        self.calls = Counter()
+        self.recipients = 0
+        self.injected_errors = 0
+
+    def record(self, path, payload):
+        now = time.perf_counter()
+        with self.lock:
+            self.calls[path] += 1
+            if path.endswith('/reply'):
+                self.replies.setdefault(payload.get('replyToken'), now)
+            elif path.endswith('/multicast'):
+                self.recipients += len(payload.get('to', []))
+            elif path.endswith('/push'):
+                self.recipients += 1
+
+
+class LineStandIn(BaseHTTPRequestHandler):
+    """替身 LINE Messaging API：延遲 latency 秒後回應，並依 error_rate 隨機回應 500。"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    error_rate = 0.0
+    recorder = None
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b'{}'
+        time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            with self.recorder.lock:
+                self.recorder.injected_errors += 1
+            self._respond(500, b'{"message":"injected error"}')
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = {}
+        self.recorder.record(self.path, payload)
+        self._respond(200, b'{}')
+
+    def do_GET(self):
+        self._respond(200, b'{}')
+
+    def _respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_line_stand_in(latency, error_rate, port=0):
+    recorder = LineRecorder()
+    LineStandIn.latency = latency
+    LineStandIn.error_rate = error_rate
+    LineStandIn.recorder = recorder
+    server = ThreadingHTTPServer(('127.0.0.1', port), LineStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", recorder
+
+
+class LoadGenerator:
+    """
+    Open-loop webhook generator: request i is scheduled at start + i / rate and
+    sent by a pool of `concurrency` threads, each with its own HTTP session.
+    Every request carries `batch` message events drawn from the command mix.
+    """
+
+    def __init__(self, url, secret, rate, duration, mix, users=1000, batch=1, concurrency=32):
+        self.url = url
+        self.secret = secret
+        self.rate = rate
+        self.duration = duration
+        self.commands = [command for command, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.users = [f"U{uuid.uuid4().hex}" for _ in range(users)]
+        self.batch = batch
+        self.concurrency = concurrency
+        self._local = threading.local()
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self.samples = []
+        self.scheduled_tokens = {}
+
+    def make_request(self, sequence):
+        events = []
+        for i in range(self.batch):
+            token = f"lt-{sequence}-{i}"
+            with self._lock:
+                text = self._random.choices(self.commands, self.weights)[0]
+                user_id = self._random.choice(self.users)
+            events.append({
+                "type": "message",
+                "mode": "active",
+                "timestamp": int(time.time() * 1000),
+                "webhookEventId": uuid.uuid4().hex.upper(),
+                "deliveryContext": {"isRedelivery": False},
+                "replyToken": token,
+                "source": {"type": "user", "userId": user_id},
+                "message": {"id": str(sequence * self.batch + i), "type": "text", "text": text, "quoteToken": "q"},
+            })
+        body = json.dumps({"destination": "Uloadtest", "events": events}, ensure_ascii=False).encode('utf-8')
+        return body, [event["replyToken"] for event in events], [event["message"]["text"] for event in events]
+
+    def run(self):
+        total = int(self.rate * self.duration)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='loadtest') as pool:
+            for sequence in range(total):
+                scheduled = started + sequence / self.rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, sequence, scheduled)
+        self.elapsed = time.perf_counter() - started
+        return self.samples
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, sequence, scheduled):
+        body, tokens, texts = self.make_request(sequence)
+        headers = {'Content-Type': 'application/json', 'X-Line-Signature': sign(body, self.secret)}
+        status, error = None, None
+        try:
+            response = self._session().post(self.url, data=body, headers=headers, timeout=30)
+            status = response.status_code
+        except requests.RequestException as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        with self._lock:
+            self.samples.append({"ack": finished - scheduled, "status": status, "error": error, "events": len(tokens)})
+            if status == 200:
+                for token, text in zip(tokens, texts):
+                    self.scheduled_tokens[token] = (scheduled, text)
+
+
+def wait_for_replies(recorder, expected, timeout):
+    """等待替身 LINE 伺服器收到所有已受理事件的回覆，最多 timeout 秒。"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        with recorder.lock:
+            received = sum(1 for token in expected if token in recorder.replies)
+        if received >= len(expected):
+            break
+        time.sleep(0.05)
+
+
+def summarize(generator, recorder, push=None, server_stats=None):
+    samples = generator.samples
+    statuses = Counter(str(sample["status"] or sample["error"]) for sample in samples)
+    ok = [sample for sample in samples if sample["status"] == 200]
+    with recorder.lock:
+        replies = dict(recorder.replies)
+        calls = dict(recorder.calls)
+        recipients, injected = recorder.recipients, recorder.injected_errors
+
+    reply_latency, by_command = [], {}
+    for token, (scheduled, text) in generator.scheduled_tokens.items():
+        arrived = replies.get(token)
+        if arrived is None:
+            continue
+        reply_latency.append(arrived - scheduled)
+        by_command.setdefault(text, []).append(arrived - scheduled)
+    expected = len(generator.scheduled_tokens)
+    events = sum(sample["events"] for sample in samples)
+
+    report = {
+        "requests": {
+            "sent": len(samples),
+            "events": events,
+            "status": dict(statuses),
+            "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+            "throughput": round(len(samples) / generator.elapsed, 1) if samples else 0.0,
+            "ack_ms": percentiles([sample["ack"] for sample in ok]),
+        },
+        "replies": {
+            "expected": expected,
+            "received": len(reply_latency),
+            "missing_rate": round(1 - len(reply_latency) / expected, 4) if expected else 0.0,
+            "throughput": round(len(reply_latency) / generator.elapsed, 1) if reply_latency else 0.0,
+            "latency_ms": percentiles(reply_latency),
+            "by_command_ms": {text: percentiles(values) for text, values in by_command.items()},
+        },
+        "line_api": {"calls": calls, "recipients": recipients, "injected_errors": injected},
+    }
+    if push is not None:
+        report["push"] = push
+    if server_stats is not None:
+        report["server"] = server_stats
+    return report
+
+
+def start_bot(secret, line_url, cpc_url, subscribers, workdir):
+    """設定環境變數指向替身伺服器後匯入機器人，並以多執行緒 HTTP 伺服器提供服務。"""
+    os.environ.update({
+        'LINE_CHANNEL_ACCESS_TOKEN': 'loadtest-token',
+        'LINE_CHANNEL_SECRET': secret,
+        'LINE_API_ENDPOINT': line_url,
+        'CPC_HOME_URL': cpc_url + '/',
+        'CPC_HISTORY_URL': cpc_url + '/historyprice.aspx?n=2890',
+        'SUBSCRIBERS_DB': os.path.join(workdir, 'subscribers.db'),
+        'PRICE_STORE_PATH': os.path.join(workdir, 'price_history.npy'),
+        'PRICE_SNAPSHOT_PATH': os.path.join(workdir, 'last_price_snapshot.json'),
+        'REPLY_VIEWS_PATH': os.path.join(workdir, 'reply_views.json'),
+        'LAZY_STARTUP': '0',
+    })
+    os.environ.setdefault('IMAGEKIT_PUBLIC_KEY', 'loadtest')
+    os.environ.setdefault('IMAGEKIT_PRIVATE_KEY', 'loadtest')
+    os.environ.setdefault('IMAGEKIT_URL_ENDPOINT', 'https://ik.example.invalid')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import line_bot_oil_v1 as bot
+
+    # ImageKit 沒有替身伺服器：上傳只回傳假的網址，再重新產生回覆內容（趨勢圖已在繪圖快取中）
+    bot.upload_trend_image = lambda image, extension='png': f"https://ik.example.invalid/{len(image)}.{extension}"
+    bot.reply_views.refresh()
+    if subscribers:
+        bot.subscriber_store.add_many(f"U{i:032d}" for i in range(subscribers))
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, bot.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return bot, server, f"http://127.0.0.1:{server.server_port}/webhook"
+
+
+def print_report(report):
+    requests_report, replies = report["requests"], report["replies"]
+    ack = requests_report["ack_ms"] or {}
+    latency = replies["latency_ms"] or {}
+    print(
+        f"webhook 請求 {requests_report['sent']} 個（{requests_report['events']} 個事件），"
+        f"{requests_report['throughput']} 個/秒，錯誤率 {requests_report['error_rate']:.2%}，狀態 {requests_report['status']}"
+    )
+    print(f"ack    p50 {ack.get('p50')} ms  p95 {ack.get('p95')} ms  p99 {ack.get('p99')} ms  max {ack.get('max')} ms")
+    print(
+        f"reply  {replies['received']}/{replies['expected']}（未回覆 {replies['missing_rate']:.2%}），{replies['throughput']} 個/秒  "
+        f"p50 {latency.get('p50')} ms  p95 {latency.get('p95')} ms  p99 {latency.get('p99')} ms"
+    )
+    for text, values in replies["by_command_ms"].items():
+        print(f"  {text:<8} p50 {values['p50']} ms  p95 {values['p95']} ms  p99 {values['p99']} ms")
+    print(f"LINE API 呼叫 {report['line_api']['calls']}，注入錯誤 {report['line_api']['injected_errors']} 次")
+    if "push" in report:
+        push = report["push"]
+        print(f"推播 {push.get('recipients')} 人，耗時 {push.get('seconds', 0):.2f} 秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rate', type=float, default=200, help='每秒送出的 webhook 請求數')
+    parser.add_argument('--duration', type=float, default=10, help='壓測秒數')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='指令比例，例如 "油價趨勢=6,查油價=3,訂閱油價=1"')
+    parser.add_argument('--users', type=int, default=5000, help='送出訊息的不同使用者數')
+    parser.add_argument('--batch', type=int, default=1, help='每個 webhook 請求包含的事件數')
+    parser.add_argument('--concurrency', type=int, default=32, help='同時送出請求的執行緒數')
+    parser.add_argument('--line-latency', type=float, default=0.05, help='替身 LINE API 每次呼叫延遲（秒）')
+    parser.add_argument('--line-error-rate', type=float, default=0.0, help='替身 LINE API 回應 500 的比例')
+    parser.add_argument('--cpc-latency', type=float, default=0.2, help='替身中油網站每次回應延遲（秒）')
+    parser.add_argument('--line-port', type=int, default=0)
+    parser.add_argument('--cpc-port', type=int, default=0)
+    parser.add_argument('--subscribers', type=int, default=0, help='預先建立的訂閱用戶數（僅限本程序模式）')
+    parser.add_argument('--push', action='store_true', help='壓測開始時同時對所有訂閱用戶推播一次（僅限本程序模式）')
+    parser.add_argument('--drain-timeout', type=float, default=30, help='壓測結束後等待回覆的秒數')
+    parser.add_argument('--target', help='已啟動服務的 webhook 網址；未指定時在本程序中啟動機器人')
+    parser.add_argument('--secret', default=os.getenv('LOADTEST_CHANNEL_SECRET', DEFAULT_SECRET))
+    parser.add_argument('--output', help='將結果寫入 JSON 檔')
+    args = parser.parse_args()
+
+    line_server, line_url, recorder = start_line_stand_in(args.line_latency, args.line_error_rate, args.line_port)
+    cpc_server, cpc_url = start_cpc_stand_in(args.cpc_latency, args.cpc_port)
+    print(f"替身 LINE API：{line_url}  替身中油網站：{cpc_url}", flush=True)
+
+    bot = app_server = None
+    if args.target:
+        url = args.target
+        if args.subscribers or args.push:
+            parser.error("--subscribers 與 --push 只能在本程序模式中使用")
+    else:
+        bot, app_server, url = start_bot(args.secret, line_url, cpc_url, args.subscribers, tempfile.mkdtemp(prefix='oil-loadtest-'))
+
+    push = None
+    push_thread = None
+    if args.push:
+        push = {"recipients": bot.subscriber_store.count()}
+
+        def run_push():
+            started = time.perf_counter()
+            bot.send_push_notification(force=True)
+            push["seconds"] = time.perf_counter() - started
+
+        push_thread = threading.Thread(target=run_push, name='loadtest-push', daemon=True)
+        push_thread.start()
+
+    generator = LoadGenerator(
+        url, args.secret, args.rate, args.duration, parse_mix(args.mix),
+        users=args.users, batch=args.batch, concurrency=args.concurrency
+    )
+    try:
+        generator.run()
+        wait_for_replies(recorder, list(generator.scheduled_tokens), args.drain_timeout)
+        if push_thread is not None:
+            push_thread.join(args.drain_timeout)
+        server_stats = None
+        if bot is not None:
+            server_stats = {"webhook": bot.event_dispatcher.stats(), "duplicates": bot.event_deduplicator.duplicates}
+        report = summarize(generator, recorder, push, server_stats)
+    finally:
+        if app_server is not None:
+            app_server.shutdown()
+        line_server.shutdown()
+        cpc_server.shutdown()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# LogRecord 內建的屬性；其餘屬性（logger.info(..., extra={...}) 帶入的欄位）會輸出為結構化欄位
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+def message_type(record):
+    """紀錄的訊息類型：extra 中的 event 欄位，沒有時使用 logger 名稱。"""
+    return getattr(record, 'event', None) or record.name
+
+
+def parse_rates(text):
+    """解析 "webhook.message=0.1,push.batch=20" 形式的設定為 {訊息類型: 數值}。"""
+    rates = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            rates[name.strip()] = float(value)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, thread and any `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records of each message type (`rates` maps a
+    type to 0..1). Kept records carry `sample_rate` so counts can be scaled back
+    up. WARNING and above are never sampled out.
+    """
+
+    def __init__(self, rates=None, default=1.0):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.default = default
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(message_type(record), self.default)
+        if rate >= 1:
+            return True
+        if random.random() < rate:
+            record.sample_rate = rate
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    At most `limits[type]` records per second for each message type (token bucket
+    with one second of burst). The number of records dropped in between is
+    attached to the next record that gets through as `suppressed`.
+    WARNING and above are never dropped.
+    """
+
+    def __init__(self, limits=None, default=None):
+        super().__init__()
+        self.limits = dict(limits or {})
+        self.default = default
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.rate_limited = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        kind = message_type(record)
+        limit = self.limits.get(kind, self.default)
+        if limit is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(kind)
+            if bucket is None:
+                bucket = self._buckets[kind] = {"tokens": limit, "updated": now, "suppressed": 0}
+            bucket["tokens"] = min(limit, bucket["tokens"] + (now - bucket["updated"]) * limit)
+            bucket["updated"] = now
+            if bucket["tokens"] < 1:
+                bucket["suppressed"] += 1
+                self.rate_limited += 1
+                return False
+            bucket["tokens"] -= 1
+            if bucket["suppressed"]:
+                record.suppressed = bucket["suppressed"]
+                bucket["suppressed"] = 0
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler whose only work on the calling thread is a put_nowait().
+
+    Records are passed to the listener as-is (formatting happens on the listener
+    thread); when the queue is full the record is dropped and counted instead of
+    blocking the request or push loop.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Root logging pipeline: sampling and rate-limit filters in front of either a
+    queue handler drained by a background QueueListener (asynchronous=True) or,
+    for comparison, the output handler itself.
+    """
+
+    def __init__(self, output_handler, asynchronous=True, queue_size=10000, sample_rates=None, rate_limits=None):
+        self.output_handler = output_handler
+        self.asynchronous = asynchronous
+        self.sampler = SamplingFilter(sample_rates)
+        self.rate_limiter = RateLimitFilter(rate_limits)
+        self._listener = None
+        if asynchronous:
+            self.handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+            self._listener = QueueListener(self.handler.queue, output_handler, respect_handler_level=True)
+        else:
+            self.handler = output_handler
+        self.handler.addFilter(self.sampler)
+        self.handler.addFilter(self.rate_limiter)
+
+    def install(self, logger=None, level=logging.INFO):
+        """以本管線取代先前安裝的管線，掛到 root logger（或指定的 logger）上。"""
+        logger = logger or logging.getLogger()
+        for handler in list(logger.handlers):
+            if getattr(handler, '_log_pipeline', False):
+                logger.removeHandler(handler)
+        self.handler._log_pipeline = True
+        logger.addHandler(self.handler)
+        logger.setLevel(level)
+        if self._listener is not None:
+            self._listener.start()
+        return self
+
+    def stop(self):
+        """停止背景執行緒並寫出佇列中剩餘的紀錄。"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+        self.output_handler.flush()
+
+    def stats(self):
+        return {
+            "asynchronous": self.asynchronous,
+            "queued": self.handler.queue.qsize() if self.asynchronous else 0,
+            "dropped": self.handler.dropped if self.asynchronous else 0,
+            "sampled_out": self.sampler.sampled_out,
+            "rate_limited": self.rate_limiter.rate_limited,
+        }
+
+
+def setup_logging(level=logging.INFO, json_format=True, stream=None, asynchronous=True, queue_size=10000,
+                  sample_rates=None, rate_limits=None):
+    """建立並安裝 root logger 的日誌管線（輸出到 stream，預設 stderr），回傳 LogPipeline。"""
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter() if json_format else logging.Formatter(logging.BASIC_FORMAT))
+    pipeline = LogPipeline(
+        output, asynchronous=asynchronous, queue_size=queue_size, sample_rates=sample_rates, rate_limits=rate_limits
+    )
+    return pipeline.install(level=level)
@@ -0,0 +1,186 @@
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+
+from table_version import TableVersion
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("abs", "pct")
+DIRECTIONS = ("up", "down", "both")
+
+# 使用者輸入的油品簡稱 -> get_current_oil_price() 的油品名稱
+FUEL_ALIASES = {
+    "92": "92無鉛", "92無鉛": "92無鉛",
+    "95": "95無鉛", "95無鉛": "95無鉛",
+    "98": "98無鉛", "98無鉛": "98無鉛",
+    "柴油": "超級柴油", "超級柴油": "超級柴油",
+}
+DIRECTION_ALIASES = {"漲": "up", "跌": "down"}
+
+
+def parse_alert_command(text):
+    """
+    解析「提醒 <油品> <門檻>[%] [漲|跌]」，例如「提醒 95 1.5」、「提醒 柴油 2% 漲」。
+    格式錯誤時回傳 None。
+    """
+    parts = text.split()
+    if len(parts) not in (3, 4) or parts[0] != "提醒":
+        return None
+    fuel = FUEL_ALIASES.get(parts[1])
+    if fuel is None:
+        return None
+    raw = parts[2]
+    kind = "pct" if raw.endswith('%') else "abs"
+    try:
+        threshold = float(raw.rstrip('%'))
+    except ValueError:
+        return None
+    if threshold <= 0:
+        return None
+    direction = "both"
+    if len(parts) == 4:
+        direction = DIRECTION_ALIASES.get(parts[3])
+        if direction is None:
+            return None
+    return {"fuel": fuel, "kind": kind, "threshold": threshold, "direction": direction}
+
+
+def describe_rule(rule):
+    unit = "%" if rule["kind"] == "pct" else " 元"
+    direction = {"up": "上漲", "down": "下跌", "both": "漲跌"}[rule["direction"]]
+    return f"{rule['fuel']} {direction}達 {rule['threshold']:g}{unit}"
+
+
+class _ThresholdIndex:
+    """One (fuel, kind, direction) bucket: thresholds sorted ascending with matching user IDs."""
+
+    def __init__(self, thresholds, user_ids):
+        # numpy 在第一次建立索引時才載入，讓指令解析等輕量功能不必付出匯入成本
+        import numpy as np
+
+        order = np.argsort(thresholds, kind='stable')
+        self.thresholds = np.asarray(thresholds, dtype=np.float64)[order]
+        self.user_ids = np.asarray(user_ids, dtype=object)[order]
+
+    def triggered(self, magnitude):
+        # 門檻 <= 變動幅度的規則都會觸發：已排序，二分搜尋後取前綴即可
+        return self.user_ids[:self.thresholds.searchsorted(magnitude, side='right')]
+
+
+class PriceAlertEngine:
+    """
+    Per-user price alert rules stored next to the subscribers (same SQLite file).
+
+    Rules are bucketed by (fuel, kind, direction) into sorted NumPy threshold arrays,
+    so finding everyone to notify for one price change is a binary search per bucket
+    rather than a Python loop over every rule. The index is rebuilt only when the
+    alert_rules table changes (TableVersion), not on writes to other tables in the file.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS alert_rules ("
+            "user_id TEXT NOT NULL, fuel TEXT NOT NULL, kind TEXT NOT NULL, "
+            "threshold REAL NOT NULL, direction TEXT NOT NULL, PRIMARY KEY (user_id, fuel))"
+        )
+        self._version = TableVersion(self._conn, "alert_rules")
+        self._index = None
+        self.rebuilds = 0
+
+    def set_rule(self, user_id, fuel, kind, threshold, direction="both"):
+        """新增或取代使用者對某油品的提醒規則。"""
+        if kind not in KINDS or direction not in DIRECTIONS:
+            raise ValueError(f"不支援的提醒規則: {kind}/{direction}")
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO alert_rules (user_id, fuel, kind, threshold, direction) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, fuel, kind, float(threshold), direction)]
+            )
+
+    def set_rules(self, rules):
+        """批次寫入 (user_id, fuel, kind, threshold, direction) 規則。"""
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO alert_rules (user_id, fuel, kind, threshold, direction) VALUES (?, ?, ?, ?, ?)",
+                rules
+            )
+
+    def remove_rules(self, user_id, fuel=None):
+        """移除使用者的提醒規則（可指定油品），回傳移除筆數。"""
+        with self._lock:
+            if fuel is None:
+                return self._write("DELETE FROM alert_rules WHERE user_id = ?", [(user_id,)])
+            return self._write("DELETE FROM alert_rules WHERE user_id = ? AND fuel = ?", [(user_id, fuel)])
+
+    def _write(self, sql, rows):
+        """在單一交易中寫入規則並遞增 alert_rules 的版本，回傳異動筆數。"""
+        before = self._conn.total_changes
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(sql, rows)
+            changes = self._conn.total_changes - before
+            if changes:
+                self._version.bump()
+                # 本程序的索引也需重建
+                self._version.reset()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            self._version.reset()
+            raise
+        return changes
+
+    def list_rules(self, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT fuel, kind, threshold, direction FROM alert_rules WHERE user_id = ? ORDER BY fuel", (user_id,)
+            ).fetchall()
+        return [{"fuel": f, "kind": k, "threshold": t, "direction": d} for f, k, t, d in rows]
+
+    def _ensure_index(self):
+        if self._index is not None and not self._version.changed():
+            return self._index
+
+        version = self._version.current()
+        buckets = defaultdict(lambda: ([], []))
+        for user_id, fuel, kind, threshold, direction in self._conn.execute(
+            "SELECT user_id, fuel, kind, threshold, direction FROM alert_rules"
+        ):
+            for side in (("up", "down") if direction == "both" else (direction,)):
+                thresholds, user_ids = buckets[(fuel, kind, side)]
+                thresholds.append(threshold)
+                user_ids.append(user_id)
+
+        self._index = {key: _ThresholdIndex(*values) for key, values in buckets.items()}
+        self._version.mark(version)
+        self.rebuilds += 1
+        return self._index
+
+    def evaluate(self, changes):
+        """
+        依油價變動找出需要提醒的使用者。
+        changes 為 price_change.compute_deltas() 的結果；回傳 {user_id: [油品, ...]}。
+        """
+        with self._lock:
+            index = self._ensure_index()
+        triggered = defaultdict(list)
+        for fuel, change in changes.items():
+            delta = change.get("delta")
+            if not delta:
+                continue
+            side = "up" if delta > 0 else "down"
+            magnitudes = {"abs": abs(delta)}
+            if change.get("previous"):
+                magnitudes["pct"] = abs(delta) / change["previous"] * 100
+            for kind, magnitude in magnitudes.items():
+                bucket = index.get((fuel, kind, side))
+                if bucket is None:
+                    continue
+                for user_id in bucket.triggered(magnitude):
+                    triggered[user_id].append(fuel)
+        return dict(triggered)
@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def prices_by_name(oil_price_data):
+    """將 get_current_oil_price() 的結果轉為 {油品: 價格}。"""
+    return {item['name']: float(item['price']) for item in oil_price_data['oil_prices']}
+
+
+def compute_deltas(previous, current):
+    """比較兩份 {油品: 價格}，回傳有變動（或新出現）的油品 {油品: {previous, current, delta}}。"""
+    changes = {}
+    for name, price in current.items():
+        before = previous.get(name)
+        if before is None:
+            changes[name] = {"previous": None, "current": price, "delta": None}
+        elif round(price - before, 2) != 0:
+            changes[name] = {"previous": before, "current": price, "delta": round(price - before, 2)}
+    return changes
+
+
+class PriceChangeDetector:
+    """
+    Compares each fresh scrape with the last snapshot that was actually pushed.
+
+    The snapshot is a small JSON file written atomically after a successful
+    broadcast, so a skipped or failed run is re-evaluated next time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"讀取油價快照時發生錯誤: {str(e)}")
+            return None
+
+    def detect(self, oil_price_data):
+        """回傳與上次快照相比的變動；沒有快照時所有油品都視為變動。"""
+        snapshot = self.load()
+        previous = snapshot['prices'] if snapshot else {}
+        return compute_deltas(previous, prices_by_name(oil_price_data))
+
+    def commit(self, oil_price_data):
+        """推播完成後記錄本次價格，作為下次比較的基準。"""
+        snapshot = {
+            "prices": prices_by_name(oil_price_data),
+            "date_range": oil_price_data.get('date_range'),
+            "saved_at": time.time(),
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        return snapshot
@@ -0,0 +1,209 @@
+import logging
+import threading
+
+import numpy as np
+
+from price_store import FUEL_TYPES
+
+logger = logging.getLogger(__name__)
+
+# 以最近幾週的價格估計線性趨勢
+DEFAULT_WINDOW = 8
+
+
+def fill_missing(prices):
+    """各油品缺漏的價格沿用前一週（開頭的缺漏則使用第一個有效價格），全欄缺漏時維持 NaN。"""
+    prices = np.array(prices, dtype=float)
+    if not len(prices):
+        return prices
+    valid = ~np.isnan(prices)
+    index = np.where(valid, np.arange(len(prices))[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    filled = prices[index, np.arange(prices.shape[1])]
+    first_valid = valid.argmax(axis=0)
+    leading = np.arange(len(prices))[:, None] < first_valid
+    return np.where(leading, prices[first_valid, np.arange(prices.shape[1])], filled)
+
+
+def window_predictions(weeks, prices, window):
+    """
+    對每一週 i，以第 max(0, i-window+1)..i 週做最小平方法直線擬合，並預測第 i+1 週的價格。
+    以累積和一次算出所有視窗的迴歸係數（不需逐週迴圈），回傳 (預測值[T-1, F], 視窗大小[T-1])。
+    """
+    count = len(weeks)
+    if count < 2:
+        return np.empty((0, prices.shape[1])), np.empty(0, dtype=int)
+    x = weeks[:, None]
+    zeros = np.zeros((1, prices.shape[1]))
+    sums = {
+        name: np.concatenate([zeros, np.cumsum(np.broadcast_to(values, prices.shape), axis=0)])
+        for name, values in (("x", x), ("y", prices), ("xx", x * x), ("xy", x * prices))
+    }
+    end = np.arange(1, count)
+    start = np.maximum(0, end - window)
+    n = (end - start)[:, None].astype(float)
+    sx, sy, sxx, sxy = (sums[name][end] - sums[name][start] for name in ("x", "y", "xx", "xy"))
+    predictions = _extrapolate(n, sx, sy, sxx, sxy, weeks[1:, None])
+    return predictions, (end - start)
+
+
+def _extrapolate(n, sx, sy, sxx, sxy, x_next):
+    denominator = n * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 1e-9, (n * sxy - sx * sy) / denominator, 0.0)
+    intercept = (sy - slope * sx) / n
+    return intercept + slope * x_next
+
+
+class PriceForecaster:
+    """
+    Next-week price forecast per fuel from a rolling linear regression.
+
+    fit() computes every historical window at once from cumulative sums, which
+    also back-tests the model: each week's forecast is compared with the price
+    that was actually announced, giving MAE / RMSE / direction hit rate per fuel.
+    update() then folds in one new week in O(window) time, independent of how
+    long the history is; sync() picks fit or update depending on what changed.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, fuels=FUEL_TYPES):
+        self.window = window
+        self.fuels = tuple(fuels)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        size = len(self.fuels)
+        self.origin = None
+        self.dates = np.empty(0, dtype=np.int64)
+        self._weeks = np.empty(0)
+        self._prices = np.empty((0, size))
+        self.last_date = None
+        self.samples = 0
+        self._abs_error = np.zeros(size)
+        self._sq_error = np.zeros(size)
+        self._error_count = np.zeros(size, dtype=int)
+        self._direction_hits = np.zeros(size, dtype=int)
+        self._next = None
+
+    def fit(self, dates, prices):
+        """以完整歷史 (日期 ordinal 陣列, 價格矩陣) 重新建立模型與準確度統計。"""
+        dates = np.asarray(dates, dtype=np.int64)
+        observed = np.asarray(prices, dtype=float)
+        with self._lock:
+            self._reset()
+            if not len(dates):
+                return self
+            filled = fill_missing(observed)
+            self.origin = int(dates[0])
+            weeks = (dates - self.origin) / 7.0
+            predictions, sizes = window_predictions(weeks, filled, self.window)
+            scored = sizes >= 2
+            self._score(predictions[scored], filled[:-1][scored], observed[1:][scored])
+            self.samples = int(np.count_nonzero(scored))
+            self._keep_window(dates, weeks, filled)
+            return self
+
+    def update(self, date, prices):
+        """加入新的一週（日期必須晚於目前最後一週），先以新價格評分上次的預測，再更新模型。"""
+        observed = np.asarray(prices, dtype=float)[None, :]
+        with self._lock:
+            if self.last_date is None:
+                raise ValueError("尚未建立模型，請先呼叫 fit()")
+            if date <= self.last_date:
+                raise ValueError("只能加入比目前最新一週更晚的資料")
+            filled = np.where(np.isnan(observed), self._prices[-1], observed)
+            week = (date - self.origin) / 7.0
+            if len(self._weeks) >= 2:
+                predictions = self._predict_at(week)[None, :]
+                self._score(predictions, self._prices[-1:], observed)
+                self.samples += 1
+            self._keep_window(
+                np.append(self.dates, date), np.append(self._weeks, week), np.vstack([self._prices, filled])
+            )
+            return self
+
+    def sync(self, dates, prices):
+        """
+        與價格資料庫同步：只有新增較晚的週次時逐週 update，否則（修正舊資料、第一次同步）重新 fit。
+        回傳 "fit"、"update" 或 "unchanged"。
+        """
+        dates = np.asarray(dates, dtype=np.int64)
+        prices = np.asarray(prices, dtype=float)
+        if not len(dates):
+            return "unchanged"
+        last_date = self.last_date
+        if last_date is not None:
+            known = int(np.searchsorted(dates, last_date, side='right'))
+            tail = slice(max(0, known - len(self.dates)), known)
+            unchanged_tail = (
+                known >= len(self.dates)
+                and np.array_equal(dates[tail], self.dates)
+                and np.allclose(fill_missing(prices[:known])[tail], self._prices, equal_nan=True)
+            )
+            if unchanged_tail:
+                if known == len(dates):
+                    return "unchanged"
+                for date, row in zip(dates[known:], prices[known:]):
+                    self.update(int(date), row)
+                return "update"
+        self.fit(dates, prices)
+        return "fit"
+
+    def forecast(self):
+        """回傳下一週的預測 {"date": 日期 ordinal, "prices": {油品: 價格}, "last": {油品: 最新價格}}；資料不足時回傳 None。"""
+        with self._lock:
+            if self._next is None:
+                return None
+            return {
+                "date": self.last_date + 7,
+                "prices": self._as_dict(self._next),
+                "last": self._as_dict(self._prices[-1]),
+            }
+
+    def accuracy(self):
+        """回傳各油品歷史預測的 {mae, rmse, direction, samples}；沒有可評分的預測時為 None。"""
+        with self._lock:
+            result = {}
+            for i, fuel in enumerate(self.fuels):
+                count = int(self._error_count[i])
+                if not count:
+                    result[fuel] = None
+                    continue
+                result[fuel] = {
+                    "mae": float(self._abs_error[i] / count),
+                    "rmse": float(np.sqrt(self._sq_error[i] / count)),
+                    "direction": float(self._direction_hits[i] / count),
+                    "samples": count,
+                }
+            return result
+
+    def _predict_at(self, week):
+        x = self._weeks[:, None]
+        y = self._prices
+        n = np.full((1, y.shape[1]), float(len(x)))
+        return _extrapolate(
+            n, x.sum(), y.sum(axis=0), (x * x).sum(), (x * y).sum(axis=0), week
+        )[0]
+
+    def _keep_window(self, dates, weeks, prices):
+        # 只保留最近 window 週，之後的 update 與預測都只需要這幾週
+        self.dates = dates[-self.window:]
+        self._weeks = weeks[-self.window:]
+        self._prices = prices[-self.window:]
+        self.last_date = int(self.dates[-1])
+        self._next = self._predict_at(self._weeks[-1] + 1) if len(self._weeks) >= 2 else None
+
+    def _score(self, predictions, previous, actual):
+        valid = ~np.isnan(actual) & ~np.isnan(predictions)
+        errors = np.where(valid, actual - predictions, 0.0)
+        self._abs_error += np.abs(errors).sum(axis=0)
+        self._sq_error += (errors ** 2).sum(axis=0)
+        self._error_count += valid.sum(axis=0)
+        # 方向以 0.1 元為單位判斷（中油調價的最小單位），持平也算一種方向
+        predicted = np.sign(np.round(predictions - previous, 1))
+        announced = np.sign(np.round(actual - previous, 1))
+        self._direction_hits += (valid & (predicted == announced)).sum(axis=0)
+
+    def _as_dict(self, values):
+        return {fuel: (None if np.isnan(value) else round(float(value), 1)) for fuel, value in zip(self.fuels, values)}
@@ -0,0 +1,135 @@
+import fcntl
+import logging
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 儲存欄位順序（與 _parse_historical_oil_data 的標準化名稱一致）
+FUEL_TYPES = ("92無鉛汽油", "95無鉛汽油", "98無鉛汽油", "超級/高級柴油")
+
+RECORD_DTYPE = np.dtype([("date", "<i4"), ("prices", "<f8", (len(FUEL_TYPES),))])
+
+
+def roc_to_ordinal(roc_date):
+    """將民國日期字串 (YYY/MM/DD) 轉為 date.toordinal()。"""
+    year_roc, month, day = map(int, roc_date.split('/'))
+    return date(year_roc + 1911, month, day).toordinal()
+
+
+def ordinal_to_roc(ordinal):
+    d = date.fromordinal(int(ordinal))
+    return f"{d.year - 1911}/{d.month:02d}/{d.day:02d}"
+
+
+class PriceStore:
+    """
+    Columnar, append-merge price history persisted as a single memory-mapped .npy file.
+
+    Each record is (date ordinal, prices[FUEL_TYPES]) sorted by date; missing
+    prices are NaN. Date range lookups use np.searchsorted, so they are O(log n)
+    and never touch the network. Writers hold an fcntl lock and replace the file
+    atomically; readers re-map it when its mtime changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = np.empty(0, dtype=RECORD_DTYPE)
+        self._mtime = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._records = np.load(self.path, mmap_mode='r')
+            self._mtime = mtime
+
+    def records(self):
+        with self._lock:
+            self._reload()
+            return self._records
+
+    def __len__(self):
+        return len(self.records())
+
+    def ingest(self, dated_oil_prices):
+        """將 {民國日期: {油品: 價格}} 合併進儲存庫，回傳新增或變更的筆數。"""
+        if not dated_oil_prices:
+            return 0
+        incoming = np.empty(len(dated_oil_prices), dtype=RECORD_DTYPE)
+        incoming["prices"] = np.nan
+        for i, (roc_date, prices) in enumerate(dated_oil_prices.items()):
+            incoming["date"][i] = roc_to_ordinal(roc_date)
+            for j, fuel in enumerate(FUEL_TYPES):
+                price = prices.get(fuel)
+                if price is not None:
+                    incoming["prices"][i, j] = price
+        return self.ingest_records(incoming)
+
+    def ingest_records(self, incoming):
+        """合併已轉換為 RECORD_DTYPE 的紀錄（同一日期以新資料的非 NaN 欄位覆蓋）。"""
+        incoming = np.sort(incoming, order="date")
+        with self._lock, open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._mtime = None
+            self._reload()
+            existing = np.array(self._records)
+
+            merged_dates = np.union1d(existing["date"], incoming["date"])
+            merged = np.empty(len(merged_dates), dtype=RECORD_DTYPE)
+            merged["date"] = merged_dates
+            merged["prices"] = np.nan
+            merged["prices"][np.searchsorted(merged_dates, existing["date"])] = existing["prices"]
+
+            positions = np.searchsorted(merged_dates, incoming["date"])
+            before = merged["prices"][positions].copy()
+            updates = np.where(np.isnan(incoming["prices"]), before, incoming["prices"])
+            merged["prices"][positions] = updates
+            changed = int(np.count_nonzero(~np.all((before == updates) | (np.isnan(before) & np.isnan(updates)), axis=1)))
+
+            if changed:
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, merged)
+                os.replace(tmp_path, self.path)
+                self._mtime = None
+                self._reload()
+                logger.info(f"油價歷史資料已更新 {changed} 筆，共 {len(merged)} 筆")
+            return changed
+
+    def range(self, start=None, end=None):
+        """回傳 start~end（含）之間的 (日期 ordinal 陣列, 價格矩陣)，以二分搜尋定位。"""
+        records = self.records()
+        dates = records["date"]
+        lo = 0 if start is None else int(np.searchsorted(dates, start.toordinal(), side='left'))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, end.toordinal(), side='right'))
+        return dates[lo:hi], records["prices"][lo:hi]
+
+    def latest_date(self):
+        records = self.records()
+        if not len(records):
+            return None
+        return date.fromordinal(int(records["date"][-1]))
+
+    def to_dated_dict(self, since_days=None):
+        """以 _parse_historical_oil_data 相同的格式回傳資料（可限定最近 since_days 天）。"""
+        latest = self.latest_date()
+        if latest is None:
+            return {}
+        start = None if since_days is None else latest - timedelta(days=since_days)
+        dates, prices = self.range(start, None)
+        dated_oil_prices = {}
+        for ordinal, row in zip(dates, prices):
+            dated_oil_prices[ordinal_to_roc(ordinal)] = {
+                fuel: (None if np.isnan(price) else float(price)) for fuel, price in zip(FUEL_TYPES, row)
+            }
+        return dated_oil_prices
@@ -0,0 +1,192 @@
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# LINE Messaging API 的 multicast 每次最多 500 位收件人
+MULTICAST_MAX_RECIPIENTS = 500
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 以相同 retry key 重送時，LINE 已受理過這個請求
+ALREADY_ACCEPTED_STATUS_CODE = 409
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def chunked(items, size):
+    """將可迭代物件切成每批最多 size 筆的 list。"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _status_code(error):
+    return getattr(error, 'status_code', None)
+
+
+def _is_retryable(error):
+    """429/5xx 與逾時、連線中斷（沒有 status_code）都視為暫時性錯誤。"""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+class PushFanout:
+    """
+    Sends one set of messages to many users via multicast batches.
+
+    Batches are sent from a bounded thread pool, throttled by a token bucket,
+    and 429/5xx responses, timeouts and dropped connections are retried with
+    jittered exponential backoff. Every attempt of a batch carries the same
+    X-Line-Retry-Key, so a retry after LINE already accepted the request (for
+    example a read timeout) is answered with 409 and counted as sent instead
+    of pushing the messages twice.
+    `on_batch(result)`, if given, is called with each finished batch's result.
+    """
+
+    def __init__(self, api, batch_size=MULTICAST_MAX_RECIPIENTS, max_workers=4, rate_per_sec=100,
+                 max_retries=4, backoff_base=0.5, backoff_max=30.0, on_batch=None):
+        self.api = api
+        self.batch_size = min(batch_size, MULTICAST_MAX_RECIPIENTS)
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(rate_per_sec)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_batch = on_batch
+
+    def send(self, user_ids, messages):
+        """推播給所有 user_ids，回傳包含每批耗時的報告。"""
+        return self.send_batches(enumerate(chunked(user_ids, self.batch_size)), messages)
+
+    def send_batches(self, batches, messages, on_result=None, before_attempt=None, retry_keys=None):
+        """
+        推播已切好的批次 [(index, user_ids)]，回傳包含每批耗時的報告。
+        retry_keys 為 {index: retry key}（例如存在 outbox 中、跨程序重送時沿用的 key）；未指定的批次各自產生一個。
+        on_result(result) 會在每批完成時（於工作執行緒中）呼叫，例如用來記錄檢查點。
+        before_attempt(index) 會在每次呼叫 LINE API 前呼叫；回傳 False 時放棄該批（不發送，結果標記 skipped），
+        例如該批已被其他程序接手。
+        """
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='push-fanout') as pool:
+            futures = [
+                pool.submit(
+                    self._send_batch, index, batch, messages, on_result, before_attempt,
+                    (retry_keys or {}).get(index)
+                )
+                for index, batch in batches
+            ]
+            batches = [future.result() for future in futures]
+
+        report = {
+            "batches": batches,
+            "sent": sum(b["size"] for b in batches if b["ok"]),
+            "failed": sum(b["size"] for b in batches if not b["ok"] and not b.get("skipped")),
+            "elapsed": time.monotonic() - started,
+        }
+        logger.info(
+            f"推播完成：{len(batches)} 批，成功 {report['sent']} 人，失敗 {report['failed']} 人，"
+            f"耗時 {report['elapsed']:.2f} 秒",
+            extra={"event": "push.summary", "batches": len(batches), "sent": report['sent'],
+                   "failed": report['failed'], "elapsed": round(report['elapsed'], 3)}
+        )
+        return report
+
+    def _send_batch(self, index, user_ids, messages, on_result=None, before_attempt=None, retry_key=None):
+        retry_key = retry_key or str(uuid.uuid4())
+        started = time.monotonic()
+        attempts = 0
+        error = None
+        skipped = False
+        while True:
+            self.bucket.acquire()
+            if before_attempt is not None and not before_attempt(index):
+                skipped = True
+                break
+            attempts += 1
+            try:
+                self.api.multicast(user_ids, messages, retry_key=retry_key)
+                error = None
+                break
+            except Exception as e:
+                if _status_code(e) == ALREADY_ACCEPTED_STATUS_CODE:
+                    logger.info(f"第 {index} 批推播先前已由 LINE 受理（retry key {retry_key}），視為成功")
+                    error = None
+                    break
+                error = e
+                if not _is_retryable(e) or attempts > self.max_retries:
+                    break
+                time.sleep(self._backoff(attempts))
+
+        result = {
+            "index": index,
+            "size": len(user_ids),
+            "attempts": attempts,
+            "elapsed": time.monotonic() - started,
+            "ok": error is None and not skipped,
+        }
+        if skipped:
+            # 沒有發送，也沒有需要記錄的結果
+            result["skipped"] = True
+            logger.warning(
+                f"第 {index} 批推播已由其他程序接手，略過（{len(user_ids)} 人）",
+                extra={"event": "push.batch", "batch": index, "size": len(user_ids), "attempts": attempts}
+            )
+            return result
+        if error is not None:
+            result["error"] = str(error)
+            logger.error(
+                f"第 {index} 批推播失敗（{len(user_ids)} 人，嘗試 {attempts} 次）: {str(error)}",
+                extra={"event": "push.batch", "batch": index, "size": len(user_ids), "attempts": attempts}
+            )
+        else:
+            logger.info(
+                f"第 {index} 批推播成功（{len(user_ids)} 人），耗時 {result['elapsed']:.3f} 秒",
+                extra={"event": "push.batch", "batch": index, "size": len(user_ids), "attempts": attempts,
+                       "elapsed": round(result['elapsed'], 3)}
+            )
+        for callback in (on_result, self.on_batch):
+            if callback is None:
+                continue
+            try:
+                callback(result)
+            except Exception as e:
+                logger.warning(f"執行推播批次回呼時發生錯誤: {str(e)}")
+        return result
+
+    def _backoff(self, attempt):
+        # full jitter：在 [0, base * 2^attempt] 之間隨機等待，避免所有批次同時重試
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
@@ -0,0 +1,332 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from push_fanout import MULTICAST_MAX_RECIPIENTS, chunked
+from push_shards import shard_of
+from reply_views import PreparedMessage
+
+logger = logging.getLogger(__name__)
+
+
+class PushOutbox:
+    """
+    Durable outbox for broadcasts, stored in SQLite next to the subscribers.
+
+    enqueue() writes one push job and all of its multicast batches (recipients
+    and serialized messages) in a single transaction before anything is sent.
+    drain() then sends the due batches through a PushFanout and checkpoints each
+    batch as soon as LINE answers, so after a crash or deploy delivery resumes
+    with the batches that were not yet confirmed. Only a batch that was in flight
+    at the moment of the crash can be sent twice.
+
+    Before sending, drain() claims its batches in one transaction (status
+    'sending' with a `lease` deadline), so processes that drain the same job at
+    the same time never pick up the same batch. Batches are claimed a pool's
+    worth (fanout.max_workers) at a time, and the lease is extended before every
+    send attempt, so batches never sit claimed in a queue while their lease runs
+    out. A batch whose claim was taken over is skipped, and results are only
+    recorded while the claim is still held. Claims are released when a drain
+    fails; claims of a crashed process are taken over once their lease expires.
+
+    Every batch gets a LINE retry key when it is enqueued; all attempts and
+    re-drains of the batch send it with that key, so a batch LINE accepted but
+    did not confirm (a timeout, a crash mid-request) is not pushed twice.
+
+    Failed batches are retried with exponential backoff (`retry_delay` * 2^n)
+    until `max_attempts`; a job is finished once no batch is pending, and its
+    completion report (sent / failed / duration) is stored with the job.
+
+    With `shards` > 1 recipients are grouped by shard_of(user_id) and every batch
+    holds users of a single shard, so several instances can drain the same job,
+    each sending only the shards it holds (see push_shards.ShardCoordinator).
+    """
+
+    def __init__(self, path, batch_size=MULTICAST_MAX_RECIPIENTS, max_attempts=5, retry_delay=300, lease=300):
+        self.path = path
+        self.batch_size = min(batch_size, MULTICAST_MAX_RECIPIENTS)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._lock = threading.RLock()
+        # 同一程序內同時只有一個 drain，避免排程重試與正在進行的推播重複發送同一批
+        self._drain_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS push_jobs ("
+            "job_id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, dedupe_key TEXT UNIQUE, "
+            "messages TEXT NOT NULL, status TEXT NOT NULL, recipients INTEGER NOT NULL, "
+            "sent INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS push_batches ("
+            "job_id INTEGER NOT NULL, batch_index INTEGER NOT NULL, user_ids TEXT NOT NULL, "
+            "size INTEGER NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT, sent_at REAL, "
+            "shard INTEGER NOT NULL DEFAULT 0, lease_until REAL NOT NULL DEFAULT 0, claimed_by TEXT, "
+            "retry_key TEXT, PRIMARY KEY (job_id, batch_index))"
+        )
+        # 較早版本建立的資料庫補上新欄位（舊批次都歸在第 0 個分片、沒有人認領，retry key 於認領時補上）
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(push_batches)")]
+        for name, definition in (
+            ("shard", "INTEGER NOT NULL DEFAULT 0"),
+            ("lease_until", "REAL NOT NULL DEFAULT 0"),
+            ("claimed_by", "TEXT"),
+            ("retry_key", "TEXT"),
+        ):
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE push_batches ADD COLUMN {name} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS push_batches_due ON push_batches (status, next_attempt_at)")
+
+    def enqueue(self, kind, user_ids, messages, dedupe_key=None, shards=1):
+        """
+        建立推播工作並寫入所有批次，回傳 job_id。
+        相同 dedupe_key 的工作已存在時不重複建立，直接回傳原本的 job_id（重新執行排程不會重複推播）。
+        shards > 1 時依用戶所屬分片分組，每一批只包含同一分片的用戶。
+        """
+        payload = json.dumps([message.as_json_dict() for message in messages], ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if dedupe_key is not None:
+                    row = self._conn.execute(
+                        "SELECT job_id FROM push_jobs WHERE dedupe_key = ?", (dedupe_key,)
+                    ).fetchone()
+                    if row is not None:
+                        self._conn.execute("COMMIT")
+                        logger.info(f"推播工作 {dedupe_key} 已存在（#{row[0]}），不重複建立")
+                        return row[0]
+                cursor = self._conn.execute(
+                    "INSERT INTO push_jobs (kind, dedupe_key, messages, status, recipients, created_at) "
+                    "VALUES (?, ?, ?, 'pending', 0, ?)",
+                    (kind, dedupe_key, payload, now)
+                )
+                job_id = cursor.lastrowid
+                recipients = 0
+                for index, (shard, batch) in enumerate(self._batches(user_ids, shards)):
+                    self._conn.execute(
+                        "INSERT INTO push_batches (job_id, batch_index, user_ids, size, status, shard, retry_key) "
+                        "VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+                        (job_id, index, json.dumps(batch), len(batch), shard, str(uuid.uuid4()))
+                    )
+                    recipients += len(batch)
+                self._conn.execute("UPDATE push_jobs SET recipients = ? WHERE job_id = ?", (recipients, job_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"已建立推播工作 #{job_id}（{kind}，{recipients} 人）")
+        return job_id
+
+    def _batches(self, user_ids, shards):
+        """依序產生 (分片, 用戶批次)；分片推播時每個分片各自累積到一批的人數才寫出。"""
+        if shards <= 1:
+            for batch in chunked(user_ids, self.batch_size):
+                yield 0, batch
+            return
+        pending = {}
+        for user_id in user_ids:
+            shard = shard_of(user_id, shards)
+            batch = pending.setdefault(shard, [])
+            batch.append(user_id)
+            if len(batch) >= self.batch_size:
+                yield shard, pending.pop(shard)
+        for shard in sorted(pending):
+            yield shard, pending[shard]
+
+    def drain(self, fanout, job_id=None, shards=None):
+        """
+        發送到期的批次（預設所有未完成的工作），每批完成後立即記錄結果。
+        shards 不是 None 時只發送這些分片的批次（其他分片由持有它們的節點發送）。
+        回傳本次處理過的工作報告 list（尚有批次等待重試的工作 status 不是 done）。
+        """
+        with self._drain_lock:
+            reports = []
+            for current_job, messages in self._due_jobs(job_id):
+                claim = uuid.uuid4().hex
+                # 本次 drain 開始後才排定重試的批次留給下一次 drain
+                due_at = time.time()
+                try:
+                    while True:
+                        batches = self._claim_batches(
+                            current_job, claim, shards, limit=fanout.max_workers, due_at=due_at
+                        )
+                        if not batches:
+                            break
+                        fanout.send_batches(
+                            [(index, user_ids) for index, user_ids, _ in batches], messages,
+                            retry_keys={index: retry_key for index, _, retry_key in batches},
+                            on_result=lambda result, job=current_job, owner=claim: self._record(job, owner, result),
+                            before_attempt=lambda index, job=current_job, owner=claim: self._extend_lease(job, owner, index)
+                        )
+                except BaseException:
+                    self._release(current_job, claim)
+                    raise
+                reports.append(self._finish_if_done(current_job) or self.report(current_job))
+            return reports
+
+    def report(self, job_id):
+        """回傳推播工作的狀態與統計。"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT kind, status, recipients, sent, failed, created_at, finished_at FROM push_jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            pending = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM push_batches WHERE job_id = ? AND status IN ('pending', 'sending')",
+                (job_id,)
+            ).fetchone()[0]
+        kind, status, recipients, sent, failed, created_at, finished_at = row
+        return {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "recipients": recipients,
+            "sent": sent,
+            "failed": failed,
+            "pending": pending,
+            "duration": (finished_at or time.time()) - created_at,
+        }
+
+    def pending_jobs(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT job_id FROM push_jobs WHERE status != 'done' ORDER BY job_id"
+            )]
+
+    def _due_jobs(self, job_id):
+        with self._lock:
+            if job_id is not None:
+                rows = self._conn.execute(
+                    "SELECT job_id, messages FROM push_jobs WHERE job_id = ? AND status != 'done'", (job_id,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT job_id, messages FROM push_jobs WHERE status != 'done' ORDER BY job_id"
+                ).fetchall()
+        return [(row[0], [PreparedMessage(payload) for payload in json.loads(row[1])]) for row in rows]
+
+    def _claim_batches(self, job_id, claim, shards=None, limit=None, due_at=None):
+        """
+        在同一個交易中選出最多 limit 個到期的批次（next_attempt_at <= due_at 的等待發送批次，或認領者的租約
+        已到期）並標記為由 claim 發送中，其他程序同時 drain 時不會選到相同的批次。
+        回傳 [(batch_index, user_ids, retry_key)]。
+        """
+        if shards is not None and not shards:
+            return []
+        now = time.time()
+        query = (
+            "SELECT batch_index, user_ids, retry_key FROM push_batches WHERE job_id = ? AND "
+            "((status = 'pending' AND next_attempt_at <= ?) OR (status = 'sending' AND lease_until <= ?))"
+        )
+        params = [job_id, now if due_at is None else due_at, now]
+        if shards is not None:
+            query += f" AND shard IN ({', '.join('?' * len(shards))})"
+            params.extend(shards)
+        query += " ORDER BY batch_index"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [
+                    (index, user_ids, retry_key or str(uuid.uuid4()))
+                    for index, user_ids, retry_key in self._conn.execute(query, params).fetchall()
+                ]
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE push_batches SET status = 'sending', lease_until = ?, claimed_by = ?, retry_key = ? "
+                        "WHERE job_id = ? AND batch_index = ?",
+                        [(now + self.lease, claim, retry_key, job_id, index) for index, _, retry_key in rows]
+                    )
+                    self._conn.execute("UPDATE push_jobs SET status = 'sending' WHERE job_id = ?", (job_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(index, json.loads(user_ids), retry_key) for index, user_ids, retry_key in rows]
+
+    def _release(self, job_id, claim):
+        """drain 中途失敗：將本次認領但尚未有結果的批次放回等待發送。"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE push_batches SET status = 'pending', lease_until = 0, claimed_by = NULL "
+                "WHERE job_id = ? AND status = 'sending' AND claimed_by = ?",
+                (job_id, claim)
+            )
+
+    def _extend_lease(self, job_id, claim, index):
+        """每次發送前延長批次的租約；批次已被其他程序接手時回傳 False（不應再發送）。"""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE push_batches SET lease_until = ? "
+                "WHERE job_id = ? AND batch_index = ? AND status = 'sending' AND claimed_by = ?",
+                (time.time() + self.lease, job_id, index, claim)
+            ).rowcount == 1
+
+    def _record(self, job_id, claim, result):
+        """批次完成時的檢查點：成功標記為 sent，失敗則排定下次重試或放棄。只更新仍由 claim 認領的批次。"""
+        now = time.time()
+        owned = "WHERE job_id = ? AND batch_index = ? AND status = 'sending' AND claimed_by = ?"
+        key = (job_id, result["index"], claim)
+        with self._lock:
+            if result["ok"]:
+                recorded = self._conn.execute(
+                    "UPDATE push_batches SET status = 'sent', attempts = attempts + 1, sent_at = ?, last_error = NULL "
+                    + owned,
+                    (now, *key)
+                ).rowcount
+                if not recorded:
+                    logger.warning(f"推播工作 #{job_id} 第 {result['index']} 批已由其他程序接手，不記錄本次結果")
+                return
+            row = self._conn.execute("SELECT attempts FROM push_batches " + owned, key).fetchone()
+            if row is None:
+                logger.warning(f"推播工作 #{job_id} 第 {result['index']} 批已由其他程序接手，不記錄本次結果")
+                return
+            attempts = row[0] + 1
+            if attempts >= self.max_attempts:
+                status, next_attempt_at = 'failed', 0
+                logger.error(f"推播工作 #{job_id} 第 {result['index']} 批已失敗 {attempts} 次，放棄重試")
+            else:
+                status, next_attempt_at = 'pending', now + self.retry_delay * (2 ** (attempts - 1))
+            self._conn.execute(
+                "UPDATE push_batches SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? " + owned,
+                (status, attempts, next_attempt_at, result.get("error"), *key)
+            )
+
+    def _finish_if_done(self, job_id):
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT status, COALESCE(SUM(size), 0) FROM push_batches WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+            sent, failed = counts.get('sent', 0), counts.get('failed', 0)
+            if counts.get('pending') or counts.get('sending'):
+                self._conn.execute(
+                    "UPDATE push_jobs SET sent = ?, failed = ? WHERE job_id = ?", (sent, failed, job_id)
+                )
+                return None
+            # 分片推播時多個節點可能同時發現工作已完成，只由第一個更新的節點記錄完成
+            finished = self._conn.execute(
+                "UPDATE push_jobs SET status = 'done', sent = ?, failed = ?, finished_at = ? "
+                "WHERE job_id = ? AND status != 'done'",
+                (sent, failed, time.time(), job_id)
+            ).rowcount
+        report = self.report(job_id)
+        if not finished:
+            return report
+        logger.info(
+            f"推播工作 #{job_id}（{report['kind']}）完成：成功 {report['sent']} 人，失敗 {report['failed']} 人，"
+            f"耗時 {report['duration']:.2f} 秒",
+            extra={"event": "push.job", **report}
+        )
+        return report
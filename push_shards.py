@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from leader_election import default_holder_id
+
+logger = logging.getLogger(__name__)
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def shard_of(user_id, shards):
+    """用戶所屬的分片；以內容雜湊計算（不使用 hash()），所有程序與主機的結果一致。"""
+    return _hash64(user_id) % shards
+
+
+def assign_shards(shards, nodes):
+    """
+    以有負載上限的 rendezvous hashing 分配分片，回傳 {節點: [分片]}。
+    每個分片交給權重最高、且尚未達到 ceil(分片數 / 節點數) 個的節點：各節點負責的分片數相同，
+    節點加入或離開時大部分分片仍留在原節點。
+    """
+    result = {node: [] for node in nodes}
+    if not nodes:
+        return result
+    capacity = -(-shards // len(nodes))
+    for shard in range(shards):
+        ranked = sorted(nodes, key=lambda node: _hash64(f"{node}/{shard}"), reverse=True)
+        owner = next(node for node in ranked if len(result[node]) < capacity)
+        result[owner].append(shard)
+    return result
+
+
+class ShardCoordinator:
+    """
+    Splits push work across instances through a shared SQLite database.
+
+    Every node heartbeats a row in `push_nodes`; assign_shards() over the live
+    nodes decides which shards each node should own, so every node computes the
+    same assignment without talking to the others. Ownership is made exclusive
+    by a lease per shard in `push_shard_leases`: rebalance() releases the shards
+    this node no longer owns and claims its own shards once they are free or
+    expired. A node that joins takes over its shards on the next rebalance of the
+    old owners; a node that dies stops heartbeating and its leases expire after
+    `ttl` seconds.
+
+    rebalance() is meant to run between drains on the thread that sends, so a
+    shard is never released while its batches are being pushed.
+    """
+
+    def __init__(self, db_path, shards, node_id=None, ttl=30, heartbeat_interval=10):
+        self.db_path = db_path
+        self.shards = shards
+        self.node_id = node_id or default_holder_id()
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self._owned = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS push_nodes ("
+            "node_id TEXT PRIMARY KEY, started_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS push_shard_leases ("
+            "shard INTEGER PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def heartbeat(self):
+        """更新本節點的存活時間，並續約已持有的分片。"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO push_nodes (node_id, started_at, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(node_id) DO UPDATE SET expires_at = excluded.expires_at",
+                    (self.node_id, now, now + self.ttl)
+                )
+                self._conn.execute(
+                    "UPDATE push_shard_leases SET expires_at = ? WHERE holder = ?", (now + self.ttl, self.node_id)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def nodes(self):
+        """回傳目前存活的節點（依名稱排序）。"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT node_id FROM push_nodes WHERE expires_at > ? ORDER BY node_id", (time.time(),)
+            )]
+
+    def assignment(self, nodes=None):
+        """回傳 {節點: [分片]}：依存活節點計算的目標分配（不代表已取得租約）。"""
+        return assign_shards(self.shards, self.nodes() if nodes is None else nodes)
+
+    def rebalance(self):
+        """
+        依目前存活的節點重新分配：釋放不再屬於本節點的分片，取得屬於本節點且已空出（或租約到期）的分片。
+        回傳本節點目前持有的分片 list。
+        """
+        self.heartbeat()
+        wanted = set(self.assignment().get(self.node_id, []))
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                held = {row[0]: row[1:] for row in self._conn.execute(
+                    "SELECT shard, holder, expires_at FROM push_shard_leases"
+                )}
+                released = [shard for shard, (holder, _) in held.items()
+                            if holder == self.node_id and shard not in wanted]
+                self._conn.executemany(
+                    "DELETE FROM push_shard_leases WHERE shard = ? AND holder = ?",
+                    [(shard, self.node_id) for shard in released]
+                )
+                owned = []
+                for shard in sorted(wanted):
+                    holder, expires_at = held.get(shard, (None, 0))
+                    if holder is None or holder == self.node_id or expires_at <= now:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO push_shard_leases (shard, holder, expires_at) VALUES (?, ?, ?)",
+                            (shard, self.node_id, now + self.ttl)
+                        )
+                        owned.append(shard)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if owned != self._owned or released:
+            waiting = len(wanted) - len(owned)
+            logger.info(
+                f"{self.node_id} 負責 {len(owned)}/{self.shards} 個推播分片"
+                f"（釋放 {len(released)} 個，等待 {waiting} 個由其他節點釋放）"
+            )
+        self._owned = owned
+        return owned
+
+    def owned(self):
+        """上次 rebalance() 後本節點持有的分片。"""
+        return list(self._owned)
+
+    def leases(self):
+        """回傳 {分片: 持有節點}（僅含未到期的租約）。"""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT shard, holder FROM push_shard_leases WHERE expires_at > ? ORDER BY shard", (time.time(),)
+            ).fetchall())
+
+    def start(self):
+        """啟動背景執行緒定期送出心跳；分片的取得與釋放仍由 rebalance() 在發送前進行。"""
+        if self._thread is not None:
+            return
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name="push-shards-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self, release=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.heartbeat_interval + 1)
+            self._thread = None
+        if release:
+            self.leave()
+
+    def leave(self):
+        """離開叢集：刪除心跳並釋放所有分片，其他節點下次 rebalance 時即可接手。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM push_shard_leases WHERE holder = ?", (self.node_id,))
+            self._conn.execute("DELETE FROM push_nodes WHERE node_id = ?", (self.node_id,))
+        self._owned = []
+        logger.info(f"{self.node_id} 已離開推播分片叢集")
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"送出推播分片心跳時發生錯誤: {str(e)}")
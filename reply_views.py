@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PreparedMessage:
+    """
+    A reply message that has already been serialized.
+
+    LineBotApi only calls `as_json_dict()` on the messages it sends, so this can
+    be passed to reply_message / push_message like any SendMessage.
+    """
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def as_json_dict(self):
+        return self.payload
+
+
+class ReplyViews:
+    """
+    Materialized reply payloads for data-dependent commands.
+
+    `builders` maps a view name to a function that returns a SendMessage (or None
+    when its data is unavailable). refresh() rebuilds every view once and stores
+    its JSON payload; get() is then a dictionary lookup with no I/O. A view whose
+    builder fails keeps its last good payload. With `path`, the views are also
+    written to a JSON file so a freshly started worker can answer immediately.
+    With `workers` > 1, builders run concurrently (e.g. charts rendered in a process pool).
+    """
+
+    def __init__(self, builders, path=None, workers=1):
+        self.builders = dict(builders)
+        self.path = path
+        self.workers = workers
+        self._views = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+        self._loaded = False
+        self._file_mtime = None
+
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        """回傳已預先產生的訊息；尚未產生時回傳 None。"""
+        if not self._loaded:
+            self._load()
+        view = self._views.get(name)
+        if view is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return view["message"]
+
+    def refresh(self, names=None):
+        """重新產生指定（預設全部）的回覆內容，回傳內容有變動的名稱。"""
+        with self._refresh_lock:
+            if not self._loaded:
+                self._load()
+            names = list(names or self.builders)
+            if self.workers > 1 and len(names) > 1:
+                with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='reply-views') as pool:
+                    built = list(pool.map(self._build, names))
+            else:
+                built = [self._build(name) for name in names]
+
+            changed = []
+            for name, message, elapsed in built:
+                if message is None:
+                    continue
+                payload = message.as_json_dict()
+                with self._lock:
+                    current = self._views.get(name)
+                    if current is not None and current["payload"] == payload:
+                        continue
+                    self._views[name] = {
+                        "payload": payload,
+                        "message": PreparedMessage(payload),
+                        "updated_at": time.time(),
+                    }
+                changed.append(name)
+                logger.info(f"已更新回覆內容 {name}，耗時 {elapsed * 1000:.1f} ms")
+            self.refreshes += 1
+            if changed:
+                self._save()
+            else:
+                self._touch()
+            return changed
+
+    def _build(self, name):
+        started = time.perf_counter()
+        try:
+            message = self.builders[name]()
+        except Exception as e:
+            logger.error(f"產生回覆內容 {name} 時發生錯誤，沿用舊內容: {str(e)}")
+            message = None
+        else:
+            if message is None:
+                logger.warning(f"回覆內容 {name} 暫時無法產生，沿用舊內容")
+        return name, message, time.perf_counter() - started
+
+    def refresh_in_background(self, names=None):
+        """在背景執行緒中更新；已有更新進行中時略過。"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(names)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        self._thread = threading.Thread(target=run, name="reply-views-refresh", daemon=True)
+        self._thread.start()
+        return True
+
+    def join(self, timeout=None):
+        """等待背景更新完成（測試與效能量測時使用）。"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            updated = {name: view["updated_at"] for name, view in self._views.items()}
+        return {"refreshes": self.refreshes, "hits": self.hits, "misses": self.misses, "updated_at": updated}
+
+    def reload_if_changed(self):
+        """
+        其他 worker 更新了共享的檔案時重新載入（只取代較新的內容），回傳更新的名稱；
+        讓只有一個程序需要定期重新產生回覆內容。
+        """
+        if not self.path:
+            return []
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return []
+        if mtime == self._file_mtime:
+            return []
+        with self._lock:
+            self._loaded = True
+            changed = self._read_file()
+        if changed:
+            logger.info(f"已從 {self.path} 重新載入 {len(changed)} 則回覆內容")
+        return changed
+
+    def file_age(self):
+        """共享檔案距上次寫入的秒數；沒有檔案時回傳 None。"""
+        try:
+            return time.time() - os.stat(self.path).st_mtime if self.path else None
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if self.path and self._read_file():
+                logger.info(f"已載入 {len(self._views)} 則預先產生的回覆內容")
+
+    def _read_file(self):
+        # 呼叫端需持有 self._lock
+        try:
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception as e:
+            logger.error(f"讀取預先產生的回覆內容時發生錯誤: {str(e)}")
+            return []
+        self._file_mtime = mtime
+        changed = []
+        for name, view in stored.items():
+            current = self._views.get(name)
+            if name in self.builders and (current is None or current["updated_at"] < view["updated_at"]):
+                self._views[name] = {
+                    "payload": view["payload"],
+                    "message": PreparedMessage(view["payload"]),
+                    "updated_at": view["updated_at"],
+                }
+                changed.append(name)
+        return changed
+
+    def _touch(self):
+        # 內容沒有變動也更新檔案時間，讓其他 worker 知道內容仍是最新的
+        if not self.path:
+            return
+        try:
+            os.utime(self.path)
+            self._file_mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            pass
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            stored = {name: {"payload": view["payload"], "updated_at": view["updated_at"]}
+                      for name, view in self._views.items()}
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(stored, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._file_mtime = os.stat(self.path).st_mtime
+        except Exception as e:
+            logger.error(f"儲存預先產生的回覆內容時發生錯誤: {str(e)}")
@@ -0,0 +1,149 @@
+import logging
+import os
+import sqlite3
+import threading
+
+from table_version import TableVersion
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriberStore:
+    """
+    SQLite (WAL mode) subscriber store with an in-memory index.
+
+    Every add/remove is a single-row write, so concurrent gunicorn workers never
+    overwrite each other. The in-memory set is kept in sync with other processes
+    through a subscribers-only change counter (TableVersion): writes to other
+    tables in the same file (leases, outbox, webhook dedup) do not reload it,
+    so membership checks and count() stay O(1).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS subscribers (user_id TEXT PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._version = TableVersion(self._conn, "subscribers")
+        self._index = set()
+        self.reloads = 0
+        self._sync_index()
+
+    def _sync_index(self):
+        """若其他連線修改過訂閱名單，重新載入記憶體索引。"""
+        if self._version.changed():
+            version = self._version.current()
+            self._index = {row[0] for row in self._conn.execute("SELECT user_id FROM subscribers")}
+            self._version.mark(version)
+            self.reloads += 1
+
+    def _write(self, sql, params):
+        """在交易中執行單筆寫入，有異動時遞增版本，回傳異動筆數。"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            changes = self._conn.execute(sql, params).rowcount
+            if changes:
+                self._version.bump()
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            self._version.reset()
+            raise
+        return changes
+
+    def __contains__(self, user_id):
+        with self._lock:
+            self._sync_index()
+            return user_id in self._index
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return self.iter_subscribers()
+
+    def count(self):
+        with self._lock:
+            self._sync_index()
+            return len(self._index)
+
+    def add(self, user_id):
+        """新增訂閱用戶，若原本不存在則回傳 True。"""
+        with self._lock:
+            added = self._write("INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)", (user_id,)) == 1
+            self._index.add(user_id)
+            return added
+
+    def remove(self, user_id):
+        """移除訂閱用戶，若原本存在則回傳 True。"""
+        with self._lock:
+            removed = self._write("DELETE FROM subscribers WHERE user_id = ?", (user_id,)) == 1
+            self._index.discard(user_id)
+            return removed
+
+    def add_many(self, user_ids):
+        """在單一交易中批次新增訂閱用戶，回傳實際新增的筆數。"""
+        return self._insert_in_transaction(user_ids)
+
+    def _insert_in_transaction(self, user_ids, meta=None):
+        """在同一個交易中新增用戶並寫入 store_meta（meta 為 (key, value)），回傳實際新增的筆數。"""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)",
+                    ((user_id,) for user_id in user_ids)
+                )
+                added = self._conn.total_changes - before
+                if added:
+                    self._version.bump()
+                if meta is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES (?, ?)", meta)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._version.reset()
+            self._sync_index()
+            return added
+
+    def iter_subscribers(self, batch_size=1000):
+        """以串流方式逐批讀取訂閱用戶，推播時不需一次載入全部。"""
+        # 使用獨立連線，避免長時間讀取期間佔用共用連線的鎖
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            cursor = conn.execute("SELECT user_id FROM subscribers ORDER BY user_id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0]
+        finally:
+            conn.close()
+
+    def migrate_from_text_file(self, text_path):
+        """一次性將舊的 subscribed_users.txt 匯入資料庫，完成後將原檔改名保留。"""
+        if not os.path.exists(text_path):
+            return 0
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT value FROM store_meta WHERE key = 'migrated_from_text'"
+            ).fetchone()
+            if done:
+                return 0
+            with open(text_path, 'r') as f:
+                user_ids = [line.strip() for line in f if line.strip()]
+            # 用戶與「已匯入」標記在同一個交易中寫入，中途失敗時下次啟動會重新匯入
+            added = self._insert_in_transaction(user_ids, meta=('migrated_from_text', text_path))
+        os.replace(text_path, text_path + '.migrated')
+        logger.info(f"已從 {text_path} 匯入 {added} 個訂閱用戶 ID（檔案中共 {len(user_ids)} 行）。")
+        return added
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
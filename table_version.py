@@ -0,0 +1,51 @@
+class TableVersion:
+    """
+    Change counter for one table in a SQLite file shared with other writers.
+
+    `PRAGMA data_version` changes whenever another connection commits to *any*
+    table in the file, so it alone cannot tell whether a cached copy of one
+    table is stale. Writers of the table call bump() inside their write
+    transaction; readers call changed(), which only queries the counter row
+    after data_version moved, and reload when the counter differs from the
+    version they last loaded (mark()).
+    """
+
+    def __init__(self, conn, name):
+        self._conn = conn
+        self.name = name
+        self._seen = None
+        self._data_version = None
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 0)", (name,))
+
+    def current(self):
+        row = self._conn.execute("SELECT version FROM table_versions WHERE name = ?", (self.name,)).fetchone()
+        return row[0] if row else None
+
+    def changed(self):
+        """自上次 mark() 後，資料表是否可能已被其他連線修改。"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._seen is not None and data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        return self._seen is None or self.current() != self._seen
+
+    def mark(self, version):
+        """記錄已載入的版本；version 須在讀取資料表之前取得。"""
+        self._seen = version
+
+    def reset(self):
+        """強制下次 changed() 回傳 True。"""
+        self._seen = None
+
+    def bump(self):
+        """
+        在寫入交易（BEGIN IMMEDIATE）中呼叫：遞增計數。若寫入前快取已是最新版本，快取仍視為最新
+        （呼叫端須自行更新快取），否則下次 changed() 時重新載入。
+        """
+        before = self.current()
+        self._conn.execute("UPDATE table_versions SET version = version + 1 WHERE name = ?", (self.name,))
+        if self._seen is not None and before == self._seen:
+            self._seen = before + 1
@@ -0,0 +1,71 @@
+import json
+import tarfile
+
+from backfill import backfill
+from price_store import PriceStore
+
+
+def history_page(dates_and_prices):
+    entries = ",".join(
+        f"{{'name':'{roc_date}','data':[{{'name':'95 無鉛汽油','y':{price},'color':undefined}}]}}"
+        for roc_date, price in dates_and_prices
+    )
+    return f"<html><script>var pieSeries = [{entries}];</script></html>".encode('utf-8')
+
+
+def write_archives(tmp_path):
+    pages = tmp_path / "pages"
+    pages.mkdir()
+    (pages / "2025-01-13.html").write_bytes(history_page([("114/01/06", 29.5), ("114/01/13", 29.7)]))
+    (pages / "2025-01-20.html").write_bytes(history_page([("114/01/13", 29.7), ("114/01/20", 29.9)]))
+    (pages / "broken.html").write_bytes(b"<html></html>")
+    (pages / "dump.json").write_text(json.dumps({"114/01/20": {"超級/高級柴油": 27.1}}), encoding='utf-8')
+
+    (tmp_path / "2025-01-27.html").write_bytes(history_page([("114/01/27", 30.1)]))
+    archive = tmp_path / "older.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(tmp_path / "2025-01-27.html", arcname="weekly/2025-01-27.html")
+    return [str(pages), str(archive)]
+
+
+def test_backfill_merges_pages_json_and_tarballs(tmp_path):
+    store = PriceStore(str(tmp_path / "prices.npy"))
+    report = backfill(write_archives(tmp_path), store, workers=0)
+
+    assert report["files"] == 5 and report["parsed"] == 4 and report["failed"] == 1
+    assert report["duplicates"] == 1 and report["conflicts"] == 0
+    data = store.to_dated_dict()
+    assert list(data) == ["114/01/06", "114/01/13", "114/01/20", "114/01/27"]
+    assert data["114/01/20"]["95無鉛汽油"] == 29.9 and data["114/01/20"]["超級/高級柴油"] == 27.1
+    assert report["written"] == 4
+
+
+def test_process_pool_gives_the_same_result(tmp_path):
+    paths = write_archives(tmp_path)
+    inline = PriceStore(str(tmp_path / "inline.npy"))
+    pooled = PriceStore(str(tmp_path / "pooled.npy"))
+    backfill(paths, inline, workers=0)
+    report = backfill(paths, pooled, workers=2, chunk_size=1)
+
+    assert report["parsed"] == 4
+    assert pooled.to_dated_dict() == inline.to_dated_dict()
+
+
+def test_malformed_json_dumps_fail_instead_of_aborting(tmp_path):
+    dumps = {
+        "list_of_numbers.json": [1, 2],
+        "not_a_dict.json": "114/01/06",
+        "bad_price.json": {"114/01/06": {"95無鉛汽油": "N/A"}},
+        "bad_row.json": {"114/01/06": 29.5},
+        "mixed.json": {"114/01/13": {"95無鉛汽油": "29.7", "酒精汽油": 28.0, "98無鉛汽油": None}},
+    }
+    for name, data in dumps.items():
+        (tmp_path / name).write_text(json.dumps(data), encoding='utf-8')
+    store = PriceStore(str(tmp_path / "prices.npy"))
+    report = backfill([str(tmp_path)], store, workers=0)
+
+    assert report["parsed"] == 1 and report["failed"] == 4
+    # 不支援的油品不計入，也不會寫入資料庫
+    assert report["values"] == 1
+    data = store.to_dated_dict()
+    assert list(data) == ["114/01/13"] and data["114/01/13"]["95無鉛汽油"] == 29.7
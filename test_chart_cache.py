@@ -0,0 +1,62 @@
+from chart_cache import ChartCache, chart_fingerprint
+
+
+def test_fingerprint_changes_with_series_and_params():
+    base = chart_fingerprint([["2025-01-06"], [29.5]], dpi=100)
+    assert base == chart_fingerprint([["2025-01-06"], [29.5]], dpi=100)
+    assert base != chart_fingerprint([["2025-01-06"], [29.6]], dpi=100)
+    assert base != chart_fingerprint([["2025-01-06"], [29.5]], dpi=72)
+
+
+def test_renders_once_and_evicts_least_recently_used():
+    cache = ChartCache(max_entries=2)
+    calls = []
+
+    def render(name):
+        calls.append(name)
+        return name.encode()
+
+    assert cache.get_or_render('a', lambda: render('a')) == b'a'
+    assert cache.get_or_render('a', lambda: render('a')) == b'a'
+    cache.get_or_render('b', lambda: render('b'))
+    cache.get('a')
+    cache.get_or_render('c', lambda: render('c'))
+
+    assert calls == ['a', 'b', 'c']
+    assert cache.get('b') is None
+    assert cache.get('a') == b'a'
+
+
+def test_disk_tier_survives_a_new_process(tmp_path):
+    ChartCache(disk_dir=str(tmp_path)).put('k', b'png-bytes')
+    fresh = ChartCache(disk_dir=str(tmp_path))
+    assert fresh.get_or_render('k', lambda: b'rendered') == b'png-bytes'
+    assert fresh.disk_hits == 1
+
+
+def test_single_images_and_renditions_never_share_a_file(tmp_path):
+    cache = ChartCache(disk_dir=str(tmp_path))
+    cache.put('k', b'single')
+    cache.get_or_render_renditions('k', ("png",), lambda: {"png": b"rendition"})
+
+    fresh = ChartCache(disk_dir=str(tmp_path))
+    assert fresh.get_or_render('k', lambda: b'rendered') == b'single'
+    assert fresh.get_renditions('k', ("png",)) == {"png": b"rendition"}
+
+
+def test_renditions_come_from_one_render_and_persist_to_disk(tmp_path):
+    calls = []
+
+    def render():
+        calls.append(1)
+        return {"png": b"full", "preview.jpg": b"thumb"}
+
+    cache = ChartCache(disk_dir=str(tmp_path))
+    names = ("png", "preview.jpg")
+    assert cache.get_or_render_renditions('k', names, render) == {"png": b"full", "preview.jpg": b"thumb"}
+    assert cache.get_or_render_renditions('k', names, render)["preview.jpg"] == b"thumb"
+    assert len(calls) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["k.png.bin", "k.preview.jpg.bin"]
+
+    fresh = ChartCache(disk_dir=str(tmp_path))
+    assert fresh.get_renditions('k', names) == {"png": b"full", "preview.jpg": b"thumb"}
@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from chart_render import ChartRenderBusy, ChartRenderPool, ChartRenderTimeout
+
+LABELS = [f"2025-01-{day:02d}" for day in range(1, 9)]
+OPTIONS = {
+    "figsize": (8, 4),
+    "legend": True,
+    "renditions": {
+        "png": {"format": "png", "dpi": 100},
+        "preview.jpg": {"format": "jpg", "dpi": 30, "pil_kwargs": {"quality": 45}},
+    },
+}
+
+
+def series(offset):
+    return {"95": [29.0 + offset + i * 0.1 for i in range(8)], "Diesel": [26.0 + offset] * 8}
+
+
+@pytest.fixture(scope="module")
+def pool():
+    renderer = ChartRenderPool(processes=2, max_pending=4, timeout=30)
+    renderer.start()
+    yield renderer
+    renderer.close()
+
+
+def test_renders_png_and_jpeg_preview_in_worker_processes(pool):
+    renditions = pool.render(LABELS, series(0), OPTIONS)
+    assert renditions["png"].startswith(b"\x89PNG")
+    assert renditions["preview.jpg"].startswith(b"\xff\xd8")
+    assert len(renditions["preview.jpg"]) < len(renditions["png"]) / 4
+
+
+def test_concurrent_renders_do_not_interfere(pool):
+    expected = {offset: pool.render(LABELS, series(offset), OPTIONS)["png"] for offset in range(4)}
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        offsets = list(range(4)) * 2
+        results = list(threads.map(lambda offset: pool.render(LABELS, series(offset), OPTIONS)["png"], offsets))
+    assert results == [expected[offset] for offset in offsets]
+
+
+def test_stuck_render_times_out_and_pool_recovers():
+    renderer = ChartRenderPool(processes=1, timeout=0.001)
+    try:
+        with pytest.raises(ChartRenderTimeout):
+            renderer.render(LABELS, series(0), OPTIONS)
+        assert renderer.restarts == 1
+        renderer.timeout = 30
+        assert renderer.render(LABELS, series(0), OPTIONS)["png"].startswith(b"\x89PNG")
+    finally:
+        renderer.close()
+
+
+def test_full_queue_is_rejected_instead_of_waiting():
+    renderer = ChartRenderPool(processes=0, max_pending=1, queue_timeout=0)
+    slow_options = dict(OPTIONS, renditions={"png": {"format": "png", "dpi": 400}})
+    long_labels = [f"d{i}" for i in range(400)]
+    started = threading.Event()
+
+    def slow_render():
+        started.set()
+        renderer.render(long_labels, {"95": list(range(400))}, slow_options)
+
+    worker = threading.Thread(target=slow_render)
+    worker.start()
+    started.wait()
+    time.sleep(0.05)
+    with pytest.raises(ChartRenderBusy):
+        renderer.render(LABELS, series(0), OPTIONS)
+    worker.join()
+    assert renderer.rejected == 1
@@ -0,0 +1,45 @@
+import json
+import os
+import re
+
+from bs4 import BeautifulSoup
+
+from cpc_extract import extract_pie_series, find_price_sentence, parse_price_sentence, pie_series_to_dated_prices
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def test_price_sentence_matches_beautifulsoup():
+    raw = read_fixture('cpc_home.html')
+    soup = BeautifulSoup(raw.decode('utf-8'), 'html.parser')
+    expected = next(t for t in soup.find_all(string=re.compile('每公升')))
+
+    sentence = find_price_sentence(raw)
+    assert sentence == str(expected)
+    assert parse_price_sentence(sentence) == [
+        ('92無鉛汽油', '29.5'), ('95無鉛汽油', '31.0'), ('98無鉛汽油', '33.0'), ('超級柴油', '27.8')
+    ]
+
+
+def test_pie_series_matches_regex_parser():
+    raw = read_fixture('cpc_history.html')
+    text = raw.decode('utf-8')
+    legacy = re.search(r'var\s+pieSeries\s*=\s*(\[.*?\]);', text, re.DOTALL).group(1)
+    legacy = json.loads(legacy.replace("'", '"').replace("undefined", "null"))
+
+    assert extract_pie_series(raw) == legacy
+    dated = pie_series_to_dated_prices(extract_pie_series(raw))
+    assert len(dated) == 8
+    assert set(dated['113/11/25']) == {'92無鉛汽油', '95無鉛汽油', '98無鉛汽油', '超級/高級柴油'}
+
+
+def test_pie_series_keeps_apostrophes_and_rejects_missing_array():
+    raw = "var pieSeries = [{'name':'it\\'s','data':[undefined]}];".encode('utf-8')
+    assert extract_pie_series(raw) == [{'name': "it's", 'data': [None]}]
+    assert extract_pie_series(b'<html>no chart here</html>') is None
+    assert find_price_sentence(b'<html>no price here</html>') is None
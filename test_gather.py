@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 在子程序中匯入機器人（與 test_startup 相同），將兩個資料來源換成各需 0.3 秒的假函式
+SCRIPT = """
+import json, time
+import line_bot_oil_v1 as bot
+from linebot.models import TextSendMessage
+
+def slow(text):
+    def build(*args):
+        time.sleep(0.3)
+        return TextSendMessage(text=text)
+    return build
+
+bot.build_current_price_view = slow("price")
+bot.build_trend_view = slow("trend")
+bot.reply_views.refresh_in_background = lambda names=None: False
+started = time.perf_counter()
+messages = bot.oil_price_reply()
+print(json.dumps({"elapsed": time.perf_counter() - started, "texts": [m.text for m in messages]}))
+"""
+
+
+def test_oil_price_reply_fetches_price_and_trend_concurrently(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT,
+        'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+        'LINE_CHANNEL_SECRET': 'test-secret',
+        'SUBSCRIBERS_DB': str(tmp_path / 'subscribers.db'),
+        'PRICE_STORE_PATH': str(tmp_path / 'price_history.npy'),
+        'REPLY_VIEWS_PATH': str(tmp_path / 'reply_views.json'),
+        'LAZY_STARTUP': '1',
+        'WARMUP_DELAY': '60',
+    })
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT], cwd=str(tmp_path), env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    outcome = json.loads(result.stdout.strip().splitlines()[-1])
+    assert outcome["texts"] == ["price", "trend"]
+    # 延遲為較慢的一項（約 0.3 秒），而不是兩項相加（0.6 秒）
+    assert outcome["elapsed"] < 0.5
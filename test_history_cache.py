@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from history_cache import HistoryPageCache
+
+PAGE = "<script>var pieSeries = [];</script>"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        StandInHandler.requests_seen.append(dict(self.headers))
+        time.sleep(0.05)
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAGE.encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Last-Modified', 'Sun, 05 Jan 2025 00:00:00 GMT')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    StandInHandler.requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/historyprice.aspx"
+
+
+def test_burst_costs_one_upstream_request():
+    server, url = start_server()
+    try:
+        cache = HistoryPageCache(url, lambda raw: {"html": raw.decode()}, ttl=60)
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(lambda _: cache.get(), range(200)))
+        assert all(r == {"html": PAGE} for r in results)
+        assert len(StandInHandler.requests_seen) == 1
+        assert cache.upstream_requests == 1
+        assert cache.hits + cache.misses == 200
+    finally:
+        server.shutdown()
+
+
+def test_stale_entry_is_served_and_revalidated_with_etag():
+    server, url = start_server()
+    try:
+        cache = HistoryPageCache(url, lambda raw: {"html": raw.decode()}, ttl=0, stale_ttl=60)
+        first = cache.get()
+        second = cache.get()
+        assert second is first
+        assert cache.stale_hits == 1
+
+        deadline = time.time() + 2
+        while cache.not_modified == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert cache.not_modified == 1
+        assert StandInHandler.requests_seen[-1].get('If-None-Match') == '"v1"'
+        assert StandInHandler.requests_seen[-1].get('If-Modified-Since')
+    finally:
+        server.shutdown()
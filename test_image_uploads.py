@@ -0,0 +1,10 @@
+from image_uploads import UploadRegistry
+
+
+def test_uploads_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / "subs.db")
+    worker_a, worker_b = UploadRegistry(path), UploadRegistry(path)
+    assert worker_b.get("abc") is None
+
+    worker_a.put("abc", "https://ik.example/oil_trend_abc.png")
+    assert worker_b.get("abc") == "https://ik.example/oil_trend_abc.png"
@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from leader_election import LeaseElector
+
+
+def test_only_one_holder_and_failover_after_expiry(tmp_path):
+    path = str(tmp_path / "coord.db")
+    a = LeaseElector(path, "scheduler", holder_id="a", ttl=0.6, renew_interval=0.1)
+    b = LeaseElector(path, "scheduler", holder_id="b", ttl=0.6, renew_interval=0.1)
+
+    assert a.try_acquire()
+    assert not b.try_acquire()
+    assert a.is_leader() and not b.is_leader()
+    assert b.current_leader()["holder"] == "a"
+
+    # a 停止續約（模擬程序終止），租約到期後 b 接手
+    time.sleep(0.7)
+    assert b.try_acquire()
+    assert b.current_leader()["holder"] == "b"
+    assert not a.try_acquire()
+
+
+def test_background_renewal_keeps_leadership_and_release_hands_over(tmp_path):
+    path = str(tmp_path / "coord.db")
+    a = LeaseElector(path, "scheduler", holder_id="a", ttl=0.5, renew_interval=0.1)
+    b = LeaseElector(path, "scheduler", holder_id="b", ttl=0.5, renew_interval=0.1)
+    a.start()
+    try:
+        time.sleep(0.8)
+        assert a.is_leader()
+        assert not b.try_acquire()
+    finally:
+        a.stop()
+    assert a.current_leader() is None
+    assert b.try_acquire()
+
+
+def test_on_acquire_runs_on_takeover_but_not_on_renewal(tmp_path):
+    path = str(tmp_path / "coord.db")
+    takeovers = []
+    a = LeaseElector(path, "scheduler", holder_id="a", ttl=0.6, renew_interval=0.1,
+                     on_acquire=lambda: takeovers.append("a"))
+    b = LeaseElector(path, "scheduler", holder_id="b", ttl=0.6, renew_interval=0.1,
+                     on_acquire=lambda: takeovers.append("b"))
+
+    assert a.try_acquire() and a.try_acquire()
+    assert not b.try_acquire()
+    assert takeovers == ["a"]
+
+    time.sleep(0.7)
+    assert b.try_acquire() and b.try_acquire()
+    assert takeovers == ["a", "b"]
+
+
+# 在子程序中匯入機器人（與 test_gather 相同），以假推播函式檢查接手 leader 時是否補跑每週推播
+CATCH_UP_SCRIPT = """
+import json
+from datetime import datetime
+from apscheduler.triggers.cron import CronTrigger
+import line_bot_oil_v1 as bot
+
+bot.send_push_notification = lambda: "pushed"
+trigger = CronTrigger(day_of_week='sun', hour=12, minute=0, timezone='Asia/Singapore')
+tz = trigger.timezone
+print(json.dumps([
+    bot.catch_up_weekly_push(trigger, now=tz.localize(datetime(2026, 10, 18, hour, minute)))
+    for hour, minute in ((11, 55), (12, 0), (12, 5), (17, 59), (18, 1))
+]))
+"""
+
+
+def test_new_leader_catches_up_a_missed_weekly_push(tmp_path):
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': root,
+        'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+        'LINE_CHANNEL_SECRET': 'test-secret',
+        'SUBSCRIBERS_DB': str(tmp_path / 'subscribers.db'),
+        'PRICE_STORE_PATH': str(tmp_path / 'price_history.npy'),
+        'LAZY_STARTUP': '1',
+        'WARMUP_DELAY': '60',
+        'PUSH_CATCH_UP_MINUTES': '360',
+    })
+    result = subprocess.run(
+        [sys.executable, '-c', CATCH_UP_SCRIPT], cwd=str(tmp_path), env=env, capture_output=True, text=True,
+        timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    # 2026-10-18 為週日：12:00 之前沒有錯過的排程，之後 6 小時內補跑，超過時限則不再補跑
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == [None, "pushed", "pushed", "pushed", None]
@@ -0,0 +1,20 @@
+from linebot import WebhookParser
+
+from loadtest import LoadGenerator, parse_mix, percentiles, sign
+
+
+def test_generated_webhooks_pass_signature_validation():
+    generator = LoadGenerator("http://unused", "test-secret", rate=1, duration=1,
+                              mix=parse_mix("油價趨勢=1,查油價=0"), users=3, batch=2)
+    body, tokens, texts = generator.make_request(7)
+
+    events = WebhookParser("test-secret").parse(body.decode('utf-8'), sign(body, "test-secret"))
+    assert [event.reply_token for event in events] == tokens == ["lt-7-0", "lt-7-1"]
+    assert texts == ["油價趨勢", "油價趨勢"]
+    assert len({event.webhook_event_id for event in events}) == 2
+
+
+def test_percentiles_use_nearest_rank():
+    assert percentiles([]) is None
+    result = percentiles([i / 1000 for i in range(1, 101)])
+    assert result == {"p50": 50.0, "p95": 95.0, "p99": 99.0, "max": 100.0}
@@ -0,0 +1,59 @@
+import io
+import json
+import logging
+import queue
+
+from log_pipeline import (
+    JsonFormatter, LogPipeline, NonBlockingQueueHandler, RateLimitFilter, SamplingFilter, parse_rates
+)
+
+
+def make_record(msg, level=logging.INFO, **extra):
+    record = logging.LogRecord('bot', level, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_records_include_extra_fields():
+    entry = json.loads(JsonFormatter().format(make_record("收到訊息", event="webhook.message", user_id="U1")))
+    assert entry["message"] == "收到訊息" and entry["level"] == "INFO" and entry["logger"] == "bot"
+    assert entry["event"] == "webhook.message" and entry["user_id"] == "U1"
+
+
+def test_sampling_and_rate_limits_are_per_message_type():
+    assert parse_rates("webhook.message=0.5, push.batch=20") == {"webhook.message": 0.5, "push.batch": 20.0}
+
+    sampler = SamplingFilter({"noisy": 0.0})
+    assert not sampler.filter(make_record("x", event="noisy"))
+    assert sampler.filter(make_record("x", event="other"))
+    assert sampler.filter(make_record("x", level=logging.ERROR, event="noisy"))
+
+    limiter = RateLimitFilter({"noisy": 2})
+    kept = [limiter.filter(make_record("x", event="noisy")) for _ in range(5)]
+    assert kept == [True, True, False, False, False] and limiter.rate_limited == 3
+    limiter._buckets["noisy"]["tokens"] = 1
+    record = make_record("x", event="noisy")
+    assert limiter.filter(record) and record.suppressed == 3
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(make_record("a"))
+    handler.handle(make_record("b"))
+    assert handler.dropped == 1
+
+
+def test_records_are_written_by_the_background_listener():
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    target = logging.getLogger("test_log_pipeline")
+    target.propagate = False
+    pipeline = LogPipeline(output).install(logger=target)
+    for i in range(3):
+        target.info(f"第 {i} 批推播成功", extra={"event": "push.batch", "batch": i})
+    pipeline.stop()
+    target.removeHandler(pipeline.handler)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["batch"] for line in lines] == [0, 1, 2]
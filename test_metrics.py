@@ -0,0 +1,52 @@
+import pytest
+
+from metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = registry.histogram('demo_seconds', 'demo', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, stage='parse')
+
+    text = registry.render()
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{stage="parse",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="parse",le="1"} 3' in text
+    assert 'demo_seconds_bucket{stage="parse",le="+Inf"} 4' in text
+    assert 'demo_seconds_count{stage="parse"} 4' in text
+    assert 'demo_seconds_sum{stage="parse"} 4.05' in text
+
+
+def test_timer_records_even_when_the_call_fails():
+    registry = Registry()
+    latency = registry.histogram('demo_seconds', 'demo', ['stage'])
+
+    @latency.timed(stage='fetch')
+    def fetch():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        fetch()
+    assert latency.count(stage='fetch') == 1
+
+
+def test_counter_combines_increments_with_callback_values():
+    registry = Registry()
+    errors = registry.counter('demo_errors_total', 'demo', ['upstream'], func=lambda: {'history': 2})
+    errors.inc(upstream='home')
+    errors.inc(upstream='history')
+
+    assert errors.value(upstream='history') == 3
+    assert 'demo_errors_total{upstream="home"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        errors.inc(target='home')
+
+
+def test_failing_callback_does_not_break_other_metrics():
+    registry = Registry()
+    registry.gauge('broken', 'demo', func=lambda: 1 / 0)
+    registry.gauge('queue_depth', 'demo', func=lambda: 7)
+    text = registry.render()
+    assert 'queue_depth 7' in text
+    assert 'broken' not in text
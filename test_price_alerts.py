@@ -0,0 +1,76 @@
+import random
+
+from leader_election import LeaseElector
+from price_alerts import PriceAlertEngine, parse_alert_command
+from subscriber_store import SubscriberStore
+
+
+def test_parse_alert_command():
+    assert parse_alert_command("提醒 95 1.5") == {"fuel": "95無鉛", "kind": "abs", "threshold": 1.5, "direction": "both"}
+    assert parse_alert_command("提醒 柴油 2% 漲") == {"fuel": "超級柴油", "kind": "pct", "threshold": 2.0, "direction": "up"}
+    assert parse_alert_command("提醒 95") is None
+    assert parse_alert_command("提醒 汽油 1") is None
+    assert parse_alert_command("提醒 95 -1") is None
+
+
+def test_evaluate_respects_threshold_kind_and_direction(tmp_path):
+    engine = PriceAlertEngine(str(tmp_path / "subs.db"))
+    engine.set_rule("small", "95無鉛", "abs", 0.1)
+    engine.set_rule("big", "95無鉛", "abs", 1.0)
+    engine.set_rule("up-only", "95無鉛", "abs", 0.1, "up")
+    engine.set_rule("down-only", "95無鉛", "abs", 0.1, "down")
+    engine.set_rule("pct", "95無鉛", "pct", 1.0)
+    engine.set_rule("diesel", "超級柴油", "abs", 0.1)
+
+    rise = {"95無鉛": {"previous": 30.0, "current": 30.4, "delta": 0.4}}
+    assert set(engine.evaluate(rise)) == {"small", "up-only", "pct"}
+
+    drop = {"95無鉛": {"previous": 30.0, "current": 29.8, "delta": -0.2}}
+    assert set(engine.evaluate(drop)) == {"small", "down-only"}
+
+    engine.remove_rules("small")
+    assert set(engine.evaluate(drop)) == {"down-only"}
+    assert engine.evaluate({"95無鉛": {"previous": None, "current": 30.0, "delta": None}}) == {}
+
+
+def test_100k_rules_are_indexed_once_and_match_a_full_scan(tmp_path):
+    path = str(tmp_path / "subs.db")
+    engine = PriceAlertEngine(path)
+    rng = random.Random(1)
+    fuels = ["92無鉛", "95無鉛", "98無鉛", "超級柴油"]
+    rules = [
+        (f"U{i}", fuels[i % 4], rng.choice(["abs", "pct"]), rng.uniform(0.1, 3.0), rng.choice(["up", "down", "both"]))
+        for i in range(100_000)
+    ]
+    engine.set_rules(rules)
+    change = {"95無鉛": {"previous": 30.0, "current": 30.3, "delta": 0.3}}
+    engine.evaluate(change)  # 第一次呼叫會建立索引
+    index = engine._index
+
+    # 規則未變動時不重新讀取資料庫，只查詢已建立的索引（耗時另見效能量測）；
+    # 其他程序寫入同一個檔案的其他資料表（租約、訂閱名單）也不會觸發重建
+    elector = LeaseElector(path, "scheduler", holder_id="other-worker")
+    subscribers = SubscriberStore(path)
+    for i in range(3):
+        elector.try_acquire()
+        subscribers.add(f"S{i}")
+        triggered = engine.evaluate(change)
+    assert engine._index is index and engine.rebuilds == 1
+    magnitudes = {"abs": 0.3, "pct": 0.3 / 30.0 * 100}
+    expected = {
+        user_id for user_id, fuel, kind, threshold, direction in rules
+        if fuel == "95無鉛" and direction in ("up", "both") and magnitudes[kind] >= threshold
+    }
+    assert set(triggered) == expected
+
+
+def test_rules_written_by_another_worker_rebuild_the_index(tmp_path):
+    path = str(tmp_path / "subs.db")
+    engine = PriceAlertEngine(path)
+    change = {"95無鉛": {"previous": 30.0, "current": 31.0, "delta": 1.0}}
+    assert engine.evaluate(change) == {}
+
+    PriceAlertEngine(path).set_rule("U1", "95無鉛", "abs", 0.5)
+    assert engine.evaluate(change) == {"U1": ["95無鉛"]}
+    engine.remove_rules("U1")
+    assert engine.evaluate(change) == {}
@@ -0,0 +1,25 @@
+from price_change import PriceChangeDetector, compute_deltas
+
+
+def price_data(**prices):
+    return {"date_range": "01/12~01/18", "oil_prices": [{"name": n, "price": p} for n, p in prices.items()]}
+
+
+def test_compute_deltas_reports_only_changed_fuels():
+    changes = compute_deltas({"92無鉛": 29.5, "超級柴油": 27.8}, {"92無鉛": 29.7, "超級柴油": 27.8, "98無鉛": 33.0})
+    assert changes == {
+        "92無鉛": {"previous": 29.5, "current": 29.7, "delta": 0.2},
+        "98無鉛": {"previous": None, "current": 33.0, "delta": None},
+    }
+
+
+def test_detector_compares_against_last_committed_snapshot(tmp_path):
+    detector = PriceChangeDetector(str(tmp_path / "snapshot.json"))
+    first = price_data(**{"92無鉛": "29.5", "95無鉛": "31.0"})
+    assert set(detector.detect(first)) == {"92無鉛", "95無鉛"}
+
+    detector.commit(first)
+    assert detector.detect(first) == {}
+
+    second = price_data(**{"92無鉛": "29.3", "95無鉛": "31.0"})
+    assert detector.detect(second) == {"92無鉛": {"previous": 29.5, "current": 29.3, "delta": -0.2}}
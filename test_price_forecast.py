@@ -0,0 +1,56 @@
+from datetime import date
+
+import numpy as np
+
+from price_forecast import PriceForecaster, fill_missing
+
+
+def weekly_history(weeks, seed=0):
+    start = date(2020, 1, 6).toordinal()
+    dates = start + 7 * np.arange(weeks)
+    rng = np.random.default_rng(seed)
+    steps = np.round(rng.normal(0, 0.3, size=(weeks, 4)), 1)
+    return dates, 29.0 + np.cumsum(steps, axis=0)
+
+
+def test_linear_trend_is_extrapolated_and_scored():
+    dates = date(2025, 1, 6).toordinal() + 7 * np.arange(10)
+    prices = np.column_stack([28.0 + 0.1 * np.arange(10)] * 4)
+    forecaster = PriceForecaster(window=4).fit(dates, prices)
+
+    forecast = forecaster.forecast()
+    assert forecast["date"] == int(dates[-1]) + 7
+    assert forecast["prices"]["95無鉛汽油"] == 29.0 and forecast["last"]["95無鉛汽油"] == 28.9
+    accuracy = forecaster.accuracy()["92無鉛汽油"]
+    assert accuracy["samples"] == 8 and accuracy["mae"] < 1e-9 and accuracy["direction"] == 1.0
+
+
+def test_incremental_updates_match_a_full_refit():
+    dates, prices = weekly_history(120)
+    full = PriceForecaster().fit(dates, prices)
+    incremental = PriceForecaster().fit(dates[:100], prices[:100])
+    for day, row in zip(dates[100:], prices[100:]):
+        incremental.update(int(day), row)
+
+    assert incremental.forecast() == full.forecast()
+    for fuel, stats in full.accuracy().items():
+        other = incremental.accuracy()[fuel]
+        assert other["samples"] == stats["samples"]
+        assert np.isclose(other["mae"], stats["mae"]) and np.isclose(other["direction"], stats["direction"])
+
+
+def test_sync_updates_only_new_weeks_and_refits_on_corrections():
+    dates, prices = weekly_history(30)
+    forecaster = PriceForecaster()
+    assert forecaster.sync(dates[:20], prices[:20]) == "fit"
+    assert forecaster.sync(dates[:20], prices[:20]) == "unchanged"
+    assert forecaster.sync(dates, prices) == "update"
+
+    corrected = prices.copy()
+    corrected[-2, 0] += 1.0
+    assert forecaster.sync(dates, corrected) == "fit"
+
+
+def test_missing_prices_carry_forward():
+    prices = np.array([[np.nan, 1.0], [2.0, np.nan], [np.nan, np.nan]])
+    assert np.array_equal(fill_missing(prices), np.array([[2.0, 1.0], [2.0, 1.0], [2.0, 1.0]]))
@@ -0,0 +1,36 @@
+from datetime import date
+
+import numpy as np
+
+from price_store import PriceStore
+
+
+def test_ingest_merges_incrementally(tmp_path):
+    store = PriceStore(str(tmp_path / "prices.npy"))
+    assert store.ingest({
+        "114/01/06": {"95無鉛汽油": 29.5, "超級/高級柴油": 27.0},
+        "114/01/13": {"95無鉛汽油": 29.7},
+    }) == 2
+    assert store.ingest({"114/01/13": {"95無鉛汽油": 29.7}}) == 0
+    assert store.ingest({
+        "114/01/13": {"超級/高級柴油": 26.9},
+        "114/01/20": {"95無鉛汽油": 29.9},
+    }) == 2
+
+    data = store.to_dated_dict()
+    assert list(data) == ["114/01/06", "114/01/13", "114/01/20"]
+    assert data["114/01/13"]["95無鉛汽油"] == 29.7
+    assert data["114/01/13"]["超級/高級柴油"] == 26.9
+    assert data["114/01/20"]["98無鉛汽油"] is None
+
+
+def test_range_lookup_and_reopen_from_disk(tmp_path):
+    path = str(tmp_path / "prices.npy")
+    PriceStore(path).ingest({f"113/{m:02d}/01": {"92無鉛汽油": 28.0 + m / 10} for m in range(1, 13)})
+
+    reopened = PriceStore(path)
+    assert len(reopened) == 12
+    dates, prices = reopened.range(date(2024, 3, 1), date(2024, 5, 1))
+    assert [date.fromordinal(int(d)).month for d in dates] == [3, 4, 5]
+    assert np.allclose(prices[:, 0], [28.3, 28.4, 28.5])
+    assert list(reopened.to_dated_dict(since_days=31)) == ["113/11/01", "113/12/01"]
@@ -0,0 +1,76 @@
+import threading
+
+import requests
+
+from push_fanout import PushFanout, chunked
+
+
+class FakeApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeApi:
+    def __init__(self, failures=None):
+        self.calls = []
+        self.failures = dict(failures or {})
+        self.lock = threading.Lock()
+
+    def multicast(self, to, messages, retry_key=None):
+        with self.lock:
+            self.calls.append(list(to))
+            remaining = self.failures.get(to[0], [])
+            if remaining:
+                failure = remaining.pop(0)
+                raise failure if isinstance(failure, Exception) else FakeApiError(failure)
+
+
+def test_chunked_respects_batch_size():
+    assert [len(b) for b in chunked(range(1201), 500)] == [500, 500, 201]
+
+
+def test_groups_users_into_multicast_batches():
+    api = FakeApi()
+    users = [f"U{i:05d}" for i in range(1234)]
+    report = PushFanout(api, rate_per_sec=10000).send(users, ["msg"])
+
+    assert len(api.calls) == 3
+    assert sorted(u for call in api.calls for u in call) == users
+    assert report["sent"] == 1234 and report["failed"] == 0
+    assert [b["size"] for b in sorted(report["batches"], key=lambda b: b["index"])] == [500, 500, 234]
+
+
+def test_retries_throttling_and_server_errors_but_not_client_errors():
+    api = FakeApi(failures={"A": [429, 503], "B": [400]})
+    fanout = PushFanout(api, batch_size=1, rate_per_sec=10000, backoff_base=0.001)
+    report = fanout.send(["A", "B"], ["msg"])
+
+    by_user = {b["index"]: b for b in report["batches"]}
+    assert by_user[0]["ok"] and by_user[0]["attempts"] == 3
+    assert not by_user[1]["ok"] and by_user[1]["attempts"] == 1
+    assert report["sent"] == 1 and report["failed"] == 1
+
+
+def test_retries_timeouts_and_dropped_connections():
+    api = FakeApi(failures={"A": [requests.Timeout("read timed out"), requests.ConnectionError("reset")]})
+    fanout = PushFanout(api, batch_size=1, rate_per_sec=10000, backoff_base=0.001)
+    report = fanout.send(["A"], ["msg"])
+
+    assert report["sent"] == 1 and report["batches"][0]["attempts"] == 3
+
+
+def test_retries_reuse_the_retry_key_and_treat_409_as_sent():
+    keys = []
+
+    class AcceptThenTimeoutApi:
+        def multicast(self, to, messages, retry_key=None):
+            keys.append(retry_key)
+            if len(keys) == 1:
+                # LINE 已受理請求，但回應在途中逾時
+                raise requests.Timeout("read timed out")
+            raise FakeApiError(409)
+
+    report = PushFanout(AcceptThenTimeoutApi(), rate_per_sec=10000, backoff_base=0.001).send(["A"], ["msg"])
+    assert report["sent"] == 1 and report["batches"][0]["attempts"] == 2
+    assert keys[0] and keys == [keys[0], keys[0]]
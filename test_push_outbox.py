@@ -0,0 +1,173 @@
+import sqlite3
+import threading
+import time
+
+import requests
+
+from push_fanout import PushFanout
+from push_outbox import PushOutbox
+from reply_views import PreparedMessage
+
+
+class RecordingApi:
+    def __init__(self, crash_after=None, fail_first=()):
+        self.calls = []
+        self.crash_after = crash_after
+        self.fail_first = set(fail_first)
+
+    def multicast(self, to, messages, retry_key=None):
+        if self.crash_after is not None and len(self.calls) >= self.crash_after:
+            raise KeyboardInterrupt("process killed")
+        if to[0] in self.fail_first:
+            self.fail_first.discard(to[0])
+            raise RuntimeError("LINE API error")
+        self.calls.append((list(to), [m.as_json_dict() for m in messages]))
+
+
+def fanout(api):
+    return PushFanout(api, batch_size=10, max_workers=1, rate_per_sec=10000, max_retries=0)
+
+
+def test_delivery_resumes_where_it_stopped(tmp_path):
+    db = str(tmp_path / "outbox.db")
+    users = [f"U{i:03d}" for i in range(35)]
+    message = PreparedMessage({"type": "text", "text": "本週油價"})
+
+    outbox = PushOutbox(db, batch_size=10)
+    job_id = outbox.enqueue("broadcast", users, [message])
+    crashed = RecordingApi(crash_after=2)
+    try:
+        outbox.drain(fanout(crashed), job_id)
+    except KeyboardInterrupt:
+        pass
+    assert len(crashed.calls) == 2
+
+    # 重新啟動：只發送尚未確認的批次
+    api = RecordingApi()
+    reports = PushOutbox(db, batch_size=10).drain(fanout(api))
+    assert [call[0][0] for call in api.calls] == ["U020", "U030"]
+    assert api.calls[0][1] == [{"type": "text", "text": "本週油價"}]
+    assert reports[0]["status"] == "done" and reports[0]["sent"] == 35 and reports[0]["failed"] == 0
+
+
+def test_failed_batches_are_retried_on_schedule(tmp_path):
+    outbox = PushOutbox(str(tmp_path / "outbox.db"), batch_size=10, max_attempts=2, retry_delay=0)
+    job_id = outbox.enqueue("broadcast", [f"U{i:03d}" for i in range(20)], [PreparedMessage({})])
+
+    api = RecordingApi(fail_first={"U010"})
+    report = outbox.drain(fanout(api), job_id)[0]
+    assert report["status"] != "done" and report["sent"] == 10 and report["pending"] == 10
+    assert outbox.pending_jobs() == [job_id]
+
+    report = outbox.drain(fanout(api))[0]
+    assert report["status"] == "done" and report["sent"] == 20
+    assert outbox.pending_jobs() == []
+
+
+def test_same_dedupe_key_does_not_send_twice(tmp_path):
+    outbox = PushOutbox(str(tmp_path / "outbox.db"))
+    first = outbox.enqueue("broadcast", ["U1"], [PreparedMessage({})], dedupe_key="broadcast:w1")
+    api = RecordingApi()
+    outbox.drain(fanout(api), first)
+
+    assert outbox.enqueue("broadcast", ["U1"], [PreparedMessage({})], dedupe_key="broadcast:w1") == first
+    assert outbox.drain(fanout(api), first) == []
+    assert len(api.calls) == 1
+
+
+def test_concurrent_drains_never_send_the_same_batch(tmp_path):
+    db = str(tmp_path / "outbox.db")
+    users = [f"U{i:03d}" for i in range(100)]
+    job_id = PushOutbox(db, batch_size=10).enqueue("broadcast", users, [PreparedMessage({})])
+
+    class SlowApi(RecordingApi):
+        def multicast(self, to, messages, retry_key=None):
+            time.sleep(0.01)
+            super().multicast(to, messages, retry_key)
+
+    # 兩個各自連線的 outbox（模擬兩個程序）同時 drain 同一個推播工作
+    apis = [SlowApi(), SlowApi()]
+    threads = [
+        threading.Thread(target=PushOutbox(db, batch_size=10).drain, args=(fanout(api), job_id)) for api in apis
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    delivered = [user for api in apis for call in api.calls for user in call[0]]
+    assert sorted(delivered) == users
+    assert PushOutbox(db).report(job_id)["sent"] == 100
+
+
+def test_batches_are_claimed_a_pool_at_a_time(tmp_path):
+    db = str(tmp_path / "outbox.db")
+    job_id = PushOutbox(db, batch_size=10).enqueue("broadcast", [f"U{i:03d}" for i in range(50)], [PreparedMessage({})])
+    watcher = sqlite3.connect(db, check_same_thread=False)
+
+    class WatchingApi(RecordingApi):
+        def __init__(self):
+            super().__init__()
+            self.claimed = []
+
+        def multicast(self, to, messages, retry_key=None):
+            self.claimed.append(watcher.execute(
+                "SELECT COUNT(*) FROM push_batches WHERE status = 'sending'"
+            ).fetchone()[0])
+            super().multicast(to, messages, retry_key)
+
+    # max_workers=1：每次只認領一批，其餘批次不會在佇列中佔著租約
+    api = WatchingApi()
+    report = PushOutbox(db, batch_size=10).drain(fanout(api), job_id)[0]
+    assert api.claimed == [1] * 5
+    assert report["status"] == "done" and report["sent"] == 50
+
+
+def test_a_lost_claim_is_neither_sent_nor_recorded(tmp_path):
+    db = str(tmp_path / "outbox.db")
+    slow = PushOutbox(db, batch_size=10, lease=0.05)
+    job_id = slow.enqueue("broadcast", [f"U{i:03d}" for i in range(10)], [PreparedMessage({})])
+    assert [batch[:2] for batch in slow._claim_batches(job_id, "slow")] == [(0, [f"U{i:03d}" for i in range(10)])]
+
+    # 租約到期後由另一個程序接手並完成發送
+    time.sleep(0.06)
+    other = PushOutbox(db, batch_size=10)
+    assert other._claim_batches(job_id, "other")
+    other._record(job_id, "other", {"index": 0, "ok": True})
+
+    # 原本的程序不再發送，遲來的失敗結果也不會覆蓋已送達的紀錄
+    assert not slow._extend_lease(job_id, "slow", 0)
+    slow._record(job_id, "slow", {"index": 0, "ok": False, "error": "timeout"})
+    report = other.drain(fanout(RecordingApi()), job_id)[0]
+    assert report["status"] == "done" and report["sent"] == 10 and report["failed"] == 0
+
+
+class AcceptedApiError(Exception):
+    status_code = 409
+
+
+def test_timed_out_batches_are_resent_with_the_same_retry_key(tmp_path):
+    outbox = PushOutbox(str(tmp_path / "outbox.db"), batch_size=10, retry_delay=0)
+    job_id = outbox.enqueue("broadcast", [f"U{i:03d}" for i in range(20)], [PreparedMessage({})])
+
+    class AcceptThenTimeoutApi:
+        """LINE 已受理請求但回應逾時；以相同 retry key 重送時回傳 409。"""
+
+        def __init__(self):
+            self.accepted = {}
+
+        def multicast(self, to, messages, retry_key=None):
+            if retry_key in self.accepted:
+                raise AcceptedApiError("409 already accepted")
+            self.accepted[retry_key] = list(to)
+            raise requests.Timeout("read timed out")
+
+    api = AcceptThenTimeoutApi()
+    # 同一次 drain 內的重試，以及下一次 drain（例如其他程序接手）都沿用批次的 retry key
+    outbox.drain(fanout(api), job_id)
+    report = PushOutbox(outbox.path, batch_size=10, retry_delay=0).drain(
+        PushFanout(api, batch_size=10, max_workers=1, rate_per_sec=10000, max_retries=1, backoff_base=0.001), job_id
+    )[0]
+    assert len(api.accepted) == 2
+    assert sorted(user for users in api.accepted.values() for user in users) == [f"U{i:03d}" for i in range(20)]
+    assert report["status"] == "done" and report["sent"] == 20 and report["failed"] == 0
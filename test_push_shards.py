@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+
+from push_fanout import PushFanout
+from push_outbox import PushOutbox
+from push_shards import ShardCoordinator, shard_of
+from reply_views import PreparedMessage
+
+SHARDS = 12
+
+
+def test_stable_assignment_moves_only_the_joining_nodes_shards(tmp_path):
+    path = str(tmp_path / "coord.db")
+    a = ShardCoordinator(path, SHARDS, node_id="a", ttl=5)
+    b = ShardCoordinator(path, SHARDS, node_id="b", ttl=5)
+    assert shard_of("U123", SHARDS) == shard_of("U123", SHARDS) < SHARDS
+
+    a.heartbeat()
+    assert a.rebalance() == list(range(SHARDS))
+
+    # b 加入：在 a 釋放之前 b 拿不到任何分片，a 重新分配後 b 取得屬於它的分片
+    b.heartbeat()
+    assert b.rebalance() == []
+    target = a.assignment()
+    kept = a.rebalance()
+    assert kept == target["a"] and b.rebalance() == target["b"]
+    assert sorted(kept + b.owned()) == list(range(SHARDS))
+
+    # 新節點平均分到分片，且只從既有節點拿走分片，a、b 之間不互換
+    c = ShardCoordinator(path, SHARDS, node_id="c", ttl=5)
+    c.heartbeat()
+    after = c.assignment()
+    assert [len(shards) for shards in after.values()] == [4, 4, 4]
+    assert set(after["a"]) <= set(target["a"]) and set(after["b"]) <= set(target["b"])
+
+    # a 離開後其他節點接手它的分片
+    a.leave()
+    b.rebalance()
+    c.rebalance()
+    assert sorted(b.owned() + c.owned()) == list(range(SHARDS))
+
+
+class SlowApi:
+    """模擬 LINE API 延遲，記錄每次 multicast 的收件人。"""
+
+    def __init__(self, sent, latency):
+        self.sent = sent
+        self.latency = latency
+
+    def multicast(self, to, messages, retry_key=None):
+        time.sleep(self.latency)
+        self.sent.extend(to)
+
+
+def run_node(path, node_id, nodes, results):
+    coordinator = ShardCoordinator(path, SHARDS, node_id=node_id, ttl=5)
+    outbox = PushOutbox(path, batch_size=10)
+    sent = []
+    fanout = PushFanout(SlowApi(sent, 0.02), batch_size=10, max_workers=1, rate_per_sec=10000, max_retries=0)
+    coordinator.heartbeat()
+    deadline = time.time() + 60
+    while len(coordinator.nodes()) < nodes and time.time() < deadline:
+        time.sleep(0.01)
+    while outbox.pending_jobs() and time.time() < deadline:
+        outbox.drain(fanout, shards=coordinator.rebalance())
+        time.sleep(0.01)
+    coordinator.leave()
+    results.put((node_id, sent))
+
+
+def test_processes_split_a_broadcast_without_duplicates(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    users = [f"U{i:04d}" for i in range(600)]
+    PushOutbox(path, batch_size=10).enqueue("broadcast", users, [PreparedMessage({})], shards=SHARDS)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    nodes = [context.Process(target=run_node, args=(path, f"n{i}", 3, results)) for i in range(3)]
+    for node in nodes:
+        node.start()
+    sent = dict(results.get(timeout=120) for _ in nodes)
+    for node in nodes:
+        node.join(timeout=10)
+
+    delivered = [user for users_sent in sent.values() for user in users_sent]
+    assert sorted(delivered) == users
+    assert all(sent.values())
+    report = PushOutbox(path).report(1)
+    assert report["status"] == "done" and report["sent"] == 600
@@ -0,0 +1,83 @@
+import json
+import time
+
+from reply_views import ReplyViews
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+
+    def as_json_dict(self):
+        return {"type": "text", "text": self.text}
+
+
+def test_lookup_after_refresh_does_not_call_builders(tmp_path):
+    calls = []
+
+    def build_price():
+        calls.append("price")
+        return FakeMessage("95無鉛: 31.0 元/公升")
+
+    views = ReplyViews({"current_price": build_price}, path=str(tmp_path / "views.json"))
+    assert views.get("current_price") is None
+
+    assert views.refresh() == ["current_price"]
+    for _ in range(100):
+        message = views.get("current_price")
+    assert message.as_json_dict() == {"type": "text", "text": "95無鉛: 31.0 元/公升"}
+    assert calls == ["price"]
+
+
+def test_failed_or_unavailable_builder_keeps_last_good_view():
+    state = {"text": "v1"}
+
+    def build():
+        if state["text"] == "boom":
+            raise RuntimeError("upstream down")
+        return FakeMessage(state["text"]) if state["text"] else None
+
+    views = ReplyViews({"trend": build})
+    views.refresh()
+    assert views.refresh() == []
+
+    for broken in ("boom", None):
+        state["text"] = broken
+        assert views.refresh() == []
+        assert views.get("trend").as_json_dict()["text"] == "v1"
+
+    state["text"] = "v2"
+    assert views.refresh() == ["trend"]
+    assert views.get("trend").as_json_dict()["text"] == "v2"
+
+
+def test_new_worker_loads_persisted_views(tmp_path):
+    path = str(tmp_path / "views.json")
+    ReplyViews({"help": lambda: FakeMessage("說明")}, path=path).refresh()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["help"]["payload"]["text"] == "說明"
+
+    def never_called():
+        raise AssertionError("should not rebuild")
+
+    fresh = ReplyViews({"help": never_called}, path=path)
+    assert fresh.get("help").as_json_dict() == {"type": "text", "text": "說明"}
+
+
+def test_other_workers_reload_the_shared_file_instead_of_rebuilding(tmp_path):
+    path = str(tmp_path / "views.json")
+    leader = ReplyViews({"price": lambda: FakeMessage("v1")}, path=path)
+    leader.refresh()
+
+    def never_called():
+        raise AssertionError("should not rebuild")
+
+    worker = ReplyViews({"price": never_called}, path=path)
+    assert worker.get("price").as_json_dict()["text"] == "v1"
+    assert worker.reload_if_changed() == []
+
+    time.sleep(0.01)
+    leader.builders["price"] = lambda: FakeMessage("v2")
+    leader.refresh()
+    assert worker.reload_if_changed() == ["price"]
+    assert worker.get("price").as_json_dict()["text"] == "v2"
@@ -0,0 +1,44 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 匯入時間預算（毫秒），可用環境變數依機器調整
+IMPORT_BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', '800'))
+HEAVY_MODULES = ('matplotlib', 'numpy', 'bs4', 'imagekitio', 'apscheduler')
+
+
+def profile_import(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT,
+        'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+        'LINE_CHANNEL_SECRET': 'test-secret',
+        'SUBSCRIBERS_DB': str(tmp_path / 'subscribers.db'),
+        'PRICE_STORE_PATH': str(tmp_path / 'price_history.npy'),
+        'LAZY_STARTUP': '1',
+        'WARMUP_DELAY': '60',
+    })
+    code = (
+        "import json, sys, line_bot_oil_v1; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=str(tmp_path), env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    match = re.search(r'import time:\s+\d+ \|\s+(\d+) \| line_bot_oil_v1$', result.stderr, re.MULTILINE)
+    assert match, "找不到 line_bot_oil_v1 的 importtime 紀錄"
+    return loaded, int(match.group(1)) / 1000
+
+
+def test_import_skips_heavy_dependencies_and_fits_budget(tmp_path):
+    loaded, import_ms = profile_import(tmp_path)
+    assert loaded == []
+    assert import_ms < IMPORT_BUDGET_MS, f"匯入耗時 {import_ms:.0f} ms，超過預算 {IMPORT_BUDGET_MS:.0f} ms"
+    assert not (tmp_path / 'subscribers.db').exists()
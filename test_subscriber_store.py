@@ -0,0 +1,57 @@
+import sqlite3
+
+from subscriber_store import SubscriberStore
+
+
+def test_add_remove_and_count(tmp_path):
+    store = SubscriberStore(str(tmp_path / "subs.db"))
+    assert store.add("U1")
+    assert not store.add("U1")
+    assert store.add("U2")
+    assert "U1" in store and store.count() == 2
+    assert store.remove("U1")
+    assert not store.remove("U1")
+    assert list(store.iter_subscribers()) == ["U2"]
+
+
+def test_index_sees_writes_from_other_connections(tmp_path):
+    path = str(tmp_path / "subs.db")
+    worker_a = SubscriberStore(path)
+    worker_b = SubscriberStore(path)
+    worker_a.add("U1")
+    worker_b.add("U2")
+    assert worker_a.count() == 2 and "U2" in worker_a
+    assert worker_b.count() == 2 and "U1" in worker_b
+
+
+def test_writes_to_other_tables_do_not_reload_the_index(tmp_path):
+    path = str(tmp_path / "subs.db")
+    store = SubscriberStore(path)
+    store.add_many(f"U{i}" for i in range(1000))
+    reloads = store.reloads
+
+    # 同一個檔案中的其他資料表（租約、outbox、webhook 去重）由其他連線寫入
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, expires_at REAL)")
+    for i in range(5):
+        other.execute("INSERT OR REPLACE INTO leases (name, expires_at) VALUES ('scheduler', ?)", (i,))
+        assert store.count() == 1000 and "U1" in store
+    assert store.reloads == reloads
+
+    SubscriberStore(path).add("U-new")
+    assert "U-new" in store and store.reloads == reloads + 1
+
+
+def test_migrates_text_file_once(tmp_path):
+    text_path = tmp_path / "subscribed_users.txt"
+    text_path.write_text("U1\n\nU2\nU1\n")
+    store = SubscriberStore(str(tmp_path / "subs.db"))
+
+    assert store.migrate_from_text_file(str(text_path)) == 2
+    assert store.count() == 2
+    assert not text_path.exists()
+    assert (tmp_path / "subscribed_users.txt.migrated").exists()
+
+    text_path.write_text("U3\n")
+    assert store.migrate_from_text_file(str(text_path)) == 0
+    assert store.count() == 2
@@ -0,0 +1,21 @@
+from trend_charts import TREND_FUELS, TREND_RANGES, parse_trend_command, tick_positions, trend_variants
+
+
+def test_parse_trend_command_defaults_and_aliases():
+    assert parse_trend_command("油價趨勢") == {"fuel": "95", "range": "7週"}
+    assert parse_trend_command("油價趨勢 柴油 1年") == {"fuel": "柴油", "range": "1年"}
+    assert parse_trend_command("油價趨勢 半年 全部") == {"fuel": "全部", "range": "6月"}
+    assert parse_trend_command("油價趨勢 92無鉛") == {"fuel": "92", "range": "7週"}
+    assert parse_trend_command("油價趨勢 煤油") is None
+    assert parse_trend_command("油價趨勢 95 4週 多餘") is None
+
+
+def test_every_variant_is_addressable():
+    assert len(trend_variants()) == len(TREND_FUELS) * len(TREND_RANGES)
+
+
+def test_tick_positions_thin_long_ranges_and_keep_latest():
+    assert tick_positions(8) == list(range(8))
+    ticks = tick_positions(53)
+    assert len(ticks) <= 12
+    assert ticks[-1] == 52
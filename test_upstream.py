@@ -0,0 +1,120 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from history_cache import HistoryPageCache
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """本地替身：依 script 依序回應指定狀態碼，或延遲 delay 秒模擬卡住的上游。"""
+
+    protocol_version = 'HTTP/1.1'
+    script = []
+    delay = 0.0
+    requests_seen = 0
+    client_ports = set()
+
+    def do_GET(self):
+        FlakyHandler.requests_seen += 1
+        FlakyHandler.client_ports.add(self.client_address[1])
+        time.sleep(self.delay)
+        status = FlakyHandler.script.pop(0) if FlakyHandler.script else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    FlakyHandler.script = []
+    FlakyHandler.delay = 0.0
+    FlakyHandler.requests_seen = 0
+    FlakyHandler.client_ports = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+
+
+def test_reuses_one_pooled_connection(stand_in):
+    client = UpstreamClient()
+    for _ in range(10):
+        assert client.get(stand_in).status_code == 200
+    assert FlakyHandler.requests_seen == 10
+    assert len(FlakyHandler.client_ports) == 1
+
+
+def test_retries_server_errors_with_backoff(stand_in):
+    FlakyHandler.script = [503, 502]
+    client = UpstreamClient(retries=2, backoff_factor=0.01)
+    assert client.get(stand_in).status_code == 200
+    assert FlakyHandler.requests_seen == 3
+    assert client.breaker.state == "closed"
+
+
+def test_read_timeout_bounds_a_hung_upstream(stand_in):
+    FlakyHandler.delay = 1.0
+    client = UpstreamClient(timeout=(1, 0.2), retries=2)
+    started = time.monotonic()
+    with pytest.raises(requests.RequestException):
+        client.get(stand_in)
+    assert time.monotonic() - started < 0.9
+    assert FlakyHandler.requests_seen == 1
+
+
+def test_breaker_fails_fast_then_recovers(stand_in):
+    FlakyHandler.script = [500] * 3
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.2))
+    for _ in range(3):
+        assert client.get(stand_in).status_code == 500
+    assert client.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        client.get(stand_in)
+    assert FlakyHandler.requests_seen == 3
+
+    time.sleep(0.25)
+    assert client.get(stand_in).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_half_open_trial_is_cleared_by_any_exception(stand_in):
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    FlakyHandler.script = [500]
+    assert client.get(stand_in).status_code == 500
+    assert client.breaker.state == "open"
+
+    # 試探請求拋出非 requests 的例外（例如 TypeError）時，熔斷器應重新開啟而不是卡在試探中
+    time.sleep(0.15)
+    with pytest.raises(TypeError):
+        client.get(stand_in, unexpected=True)
+    assert client.breaker.state == "open"
+
+    time.sleep(0.15)
+    assert client.get(stand_in).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_history_cache_serves_last_good_page_while_circuit_is_open(stand_in):
+    client = UpstreamClient(retries=0, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    cache = HistoryPageCache(stand_in, lambda raw: {"page": raw}, ttl=0, stale_ttl=0, session=client)
+    assert cache.get() == {"page": b"ok"}
+
+    FlakyHandler.script = [503]
+    assert cache.get() == {"page": b"ok"}
+    assert client.breaker.state == "open"
+
+    seen = FlakyHandler.requests_seen
+    started = time.monotonic()
+    assert cache.get() == {"page": b"ok"}
+    assert time.monotonic() - started < 0.05
+    assert FlakyHandler.requests_seen == seen
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from webhook_dedup import CoalescedEvents, EventDeduplicator, coalesce
+
+
+def test_duplicate_event_ids_are_dropped_across_workers(tmp_path):
+    path = str(tmp_path / "subs.db")
+    worker_a, worker_b = EventDeduplicator(path), EventDeduplicator(path)
+    assert worker_a.add("01A")
+    assert not worker_b.add("01A")
+    assert worker_b.add("01B")
+    assert worker_a.add(None) and worker_a.add(None)
+    assert worker_b.duplicates == 1 and len(worker_a) == 2
+
+    worker_a.discard("01A")
+    assert worker_b.add("01A")
+
+
+def test_ids_expire_and_are_swept(tmp_path):
+    dedup = EventDeduplicator(str(tmp_path / "subs.db"), ttl=0.01, sweep_interval=0)
+    dedup.add("x")
+    time.sleep(0.02)
+    assert dedup.add("x")
+    time.sleep(0.02)
+    dedup.add("y")
+    assert len(dedup) == 1
+
+
+def test_coalesce_groups_same_key_and_keeps_order():
+    events = ["查油價#1", "訂閱油價#2", "查油價#3", "說明#4", "訂閱油價#5"]
+    shared = ("查油價", "說明")
+    items = coalesce(events, lambda e: e.split("#")[0] if e.split("#")[0] in shared else None)
+
+    assert isinstance(items[0], CoalescedEvents)
+    assert items[0].key == "查油價" and items[0].events == ["查油價#1", "查油價#3"]
+    assert items[1:] == ["訂閱油價#2", "說明#4", "訂閱油價#5"]
+
+
+# 在子程序中匯入機器人（與 test_gather 相同），以假 LINE API 回覆一組合併的「訂閱人數」指令
+COALESCED_SCRIPT = """
+import json
+from types import SimpleNamespace
+import line_bot_oil_v1 as bot
+from webhook_dedup import CoalescedEvents
+
+replied = []
+
+def reply_message(token, message):
+    if token == "expired":
+        raise RuntimeError("400 Invalid reply token")
+    replied.append(token)
+
+bot.line_bot_api = SimpleNamespace(reply_message=bot._instrument_line_call('reply_message', reply_message))
+events = [SimpleNamespace(reply_token=token, source=SimpleNamespace(user_id="U" + token))
+          for token in ("first", "expired", "last")]
+bot.handle_coalesced(CoalescedEvents("訂閱人數", events))
+print(json.dumps({"replied": replied, "errors": bot.UPSTREAM_ERRORS.value(upstream='line')}))
+"""
+
+
+def test_one_bad_reply_token_does_not_skip_the_rest_of_the_group(tmp_path):
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': root,
+        'LINE_CHANNEL_ACCESS_TOKEN': 'test-token',
+        'LINE_CHANNEL_SECRET': 'test-secret',
+        'SUBSCRIBERS_DB': str(tmp_path / 'subscribers.db'),
+        'PRICE_STORE_PATH': str(tmp_path / 'price_history.npy'),
+        'REPLY_VIEWS_PATH': str(tmp_path / 'reply_views.json'),
+        'LAZY_STARTUP': '1',
+        'WARMUP_DELAY': '60',
+    })
+    result = subprocess.run(
+        [sys.executable, '-c', COALESCED_SCRIPT], cwd=str(tmp_path), env=env, capture_output=True, text=True,
+        timeout=120
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    outcome = json.loads(result.stdout.strip().splitlines()[-1])
+    assert outcome == {"replied": ["first", "last"], "errors": 1}
@@ -0,0 +1,37 @@
+import threading
+
+from webhook_queue import EventDispatcher
+
+
+def test_events_are_processed_on_workers():
+    seen = []
+    dispatcher = EventDispatcher(seen.append, workers=2)
+    for i in range(10):
+        assert dispatcher.submit(i)
+    dispatcher.join()
+    assert sorted(seen) == list(range(10))
+    stats = dispatcher.stats()
+    assert stats["processed"] == 10 and stats["depth"] == 0
+
+
+def test_full_queue_rejects_new_events():
+    release = threading.Event()
+    dispatcher = EventDispatcher(lambda e: release.wait(), workers=1, maxsize=1, put_timeout=0.01)
+    results = [dispatcher.submit(i) for i in range(4)]
+    release.set()
+    dispatcher.join()
+    assert results.count(False) >= 2
+    assert dispatcher.stats()["rejected"] == results.count(False)
+
+
+def test_handler_errors_do_not_kill_workers():
+    def process(event):
+        if event == "bad":
+            raise ValueError("boom")
+
+    dispatcher = EventDispatcher(process, workers=1)
+    dispatcher.submit("bad")
+    dispatcher.submit("good")
+    dispatcher.join()
+    assert dispatcher.stats()["failed"] == 1
+    assert dispatcher.stats()["processed"] == 1
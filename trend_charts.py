@@ -0,0 +1,63 @@
+import math
+
+# 趨勢圖可選的油品（指令中的名稱 -> 歷史資料中的油品名稱）
+TREND_FUELS = {
+    "92": ("92無鉛汽油",),
+    "95": ("95無鉛汽油",),
+    "98": ("98無鉛汽油",),
+    "柴油": ("超級/高級柴油",),
+    "全部": ("92無鉛汽油", "95無鉛汽油", "98無鉛汽油", "超級/高級柴油"),
+}
+FUEL_ALIASES = {"92無鉛": "92", "95無鉛": "95", "98無鉛": "98", "超級柴油": "柴油", "所有": "全部"}
+
+# 圖例使用英數字標籤，避免預設字型缺少中文字形
+LEGEND_LABELS = {"92無鉛汽油": "92", "95無鉛汽油": "95", "98無鉛汽油": "98", "超級/高級柴油": "Diesel"}
+
+# 可選的資料區間（天）；7週為官網頁面的預設長度
+TREND_RANGES = {"4週": 28, "7週": 49, "6月": 183, "1年": 366}
+RANGE_ALIASES = {"1月": "4週", "一個月": "4週", "半年": "6月", "6個月": "6月", "一年": "1年", "12月": "1年"}
+
+DEFAULT_TREND_FUEL = "95"
+DEFAULT_TREND_RANGE = "7週"
+
+# 原圖與縮圖在同一次繪圖中產生；縮圖寬度約 240px，以 JPEG 高壓縮輸出
+TREND_RENDITIONS = ("png", "preview.jpg")
+
+# x 軸最多顯示的日期標籤數，區間較長時間隔顯示
+MAX_DATE_LABELS = 12
+
+
+def parse_trend_command(text):
+    """
+    解析「油價趨勢 [油品] [區間]」，例如「油價趨勢」、「油價趨勢 柴油 1年」、「油價趨勢 全部 6月」。
+    回傳 {"fuel": ..., "range": ...}；格式錯誤時回傳 None。
+    """
+    parts = text.split()
+    if not parts or parts[0] != "油價趨勢" or len(parts) > 3:
+        return None
+    fuel, range_key = DEFAULT_TREND_FUEL, DEFAULT_TREND_RANGE
+    for part in parts[1:]:
+        if part in TREND_FUELS or part in FUEL_ALIASES:
+            fuel = FUEL_ALIASES.get(part, part)
+        elif part in TREND_RANGES or part in RANGE_ALIASES:
+            range_key = RANGE_ALIASES.get(part, part)
+        else:
+            return None
+    return {"fuel": fuel, "range": range_key}
+
+
+def trend_view_name(fuel, range_key):
+    return f"trend:{fuel}:{range_key}"
+
+
+def trend_variants():
+    """所有 (油品, 區間) 組合。"""
+    return [(fuel, range_key) for fuel in TREND_FUELS for range_key in TREND_RANGES]
+
+
+def tick_positions(count, max_labels=MAX_DATE_LABELS):
+    """日期過多時間隔取樣要顯示標籤的位置（一定包含最新一筆）。"""
+    if count <= max_labels:
+        return list(range(count))
+    step = math.ceil(count / max_labels)
+    return list(range(count - 1, -1, -step))[::-1]
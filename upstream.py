@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.RequestException):
+    """熔斷器開啟中：不對上游送出請求，直接失敗。"""
+
+
+class CircuitBreaker:
+    """
+    Classic three-state circuit breaker.
+
+    After `failure_threshold` consecutive failures the circuit opens and every
+    call fails immediately for `reset_timeout` seconds. Then one trial call is
+    let through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """回傳是否允許這次呼叫；半開狀態同時只放行一個試探請求。"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("上游已恢復，熔斷器關閉")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+            if reopen or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logger.warning(f"上游連續失敗 {self._failures} 次，熔斷器開啟 {self.reset_timeout} 秒")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self._failures,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class UpstreamClient:
+    """
+    Shared HTTP client for one upstream site.
+
+    - One `requests.Session` with a pooled HTTPAdapter, so connections are kept alive.
+    - Every request gets (connect, read) timeouts unless the caller passes its own.
+    - Connection errors and 429/5xx are retried a bounded number of times with
+      exponential backoff. Read timeouts are not retried, so a hung server costs
+      at most one read timeout per call.
+    - A CircuitBreaker counts each call that still fails after retries; while it is
+      open, get() raises CircuitOpenError without touching the network.
+    """
+
+    def __init__(self, timeout=(3.05, 10), retries=2, backoff_factor=0.3, pool_maxsize=10,
+                 breaker=None, headers=None):
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        if headers:
+            self.session.headers.update(headers)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRYABLE_STATUS_CODES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, **kwargs):
+        """與 requests.get 相同的介面；上游持續失敗時改為立即拋出 CircuitOpenError。"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"熔斷器開啟中，暫停請求 {url}")
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.get(url, **kwargs)
+        except BaseException:
+            # 任何例外都要記為失敗，否則半開狀態的試探旗標不會清除，之後的請求會一直被擋下
+            self.breaker.record_failure()
+            raise
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def close(self):
+        self.session.close()
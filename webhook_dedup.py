@@ -0,0 +1,97 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    """
+    Set of webhookEventIds that have already been accepted, shared by every
+    worker through a table in the SQLite database.
+
+    LINE redelivers a webhook when it does not get a timely 200, and the retry
+    can land on any gunicorn worker or instance, so the same event can arrive
+    more than once. add() is a single INSERT OR IGNORE, so exactly one process
+    accepts each id. Ids are kept for `ttl` seconds; expired rows are swept at
+    most once every `sweep_interval` seconds.
+    """
+
+    def __init__(self, path, ttl=3600, sweep_interval=60):
+        self.path = path
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS webhook_events (event_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS webhook_events_expiry ON webhook_events (expires_at)")
+
+        self.duplicates = 0
+
+    def add(self, event_id):
+        """記錄事件 ID；第一次出現回傳 True，重複（尚未過期）回傳 False。沒有 ID 的事件一律視為新事件。"""
+        if not event_id:
+            return True
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._conn.execute("DELETE FROM webhook_events WHERE expires_at <= ?", (now,))
+                self._next_sweep = now + self.sweep_interval
+            # 已過期但尚未清除的舊紀錄視同不存在
+            added = self._conn.execute(
+                "INSERT INTO webhook_events (event_id, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(event_id) DO UPDATE SET expires_at = excluded.expires_at "
+                "WHERE webhook_events.expires_at <= ?",
+                (event_id, now + self.ttl, now)
+            ).rowcount == 1
+            if not added:
+                self.duplicates += 1
+            return added
+
+    def discard(self, event_id):
+        """移除事件 ID（例如事件未能放入佇列時），讓 LINE 重送時可以再次處理。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM webhook_events WHERE event_id = ?", (event_id,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM webhook_events WHERE expires_at > ?", (time.time(),)
+            ).fetchone()[0]
+
+
+class CoalescedEvents:
+    """同一批 webhook 中指令相同、回覆內容可以共用的多個事件。"""
+
+    def __init__(self, key, events):
+        self.key = key
+        self.events = list(events)
+
+    def __len__(self):
+        return len(self.events)
+
+
+def coalesce(events, key_of):
+    """
+    將一批事件分組：key_of(event) 回傳相同非 None key 的事件合併為一個 CoalescedEvents，
+    其餘事件維持單獨處理。回傳的工作項目保留每組第一個事件的原始順序。
+    """
+    items = []
+    groups = {}
+    for event in events:
+        key = key_of(event)
+        if key is None:
+            items.append(event)
+            continue
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = CoalescedEvents(key, [])
+            items.append(group)
+        group.events.append(event)
+    return [item.events[0] if isinstance(item, CoalescedEvents) and len(item) == 1 else item for item in items]
@@ -0,0 +1,98 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EventDispatcher:
+    """
+    Bounded in-process work queue drained by a fixed pool of worker threads.
+
+    The webhook only enqueues parsed events and returns; `process(event)` runs on
+    a worker. When the queue stays full for `put_timeout` seconds, submit()
+    returns False so the caller can push back (e.g. answer 503).
+    """
+
+    def __init__(self, process, workers=4, maxsize=1000, put_timeout=0.5):
+        self.process = process
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+            logger.info(f"已啟動 {self.workers} 個 webhook 工作執行緒")
+
+    def submit(self, event):
+        """將事件放入佇列，若佇列已滿則回傳 False。"""
+        self.start()
+        try:
+            self._queue.put((time.monotonic(), event), timeout=self.put_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            logger.warning(f"webhook 佇列已滿（{self._queue.qsize()} 筆），拒絕新事件")
+            return False
+        with self._stats_lock:
+            self.enqueued += 1
+        return True
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """等待佇列中的事件全部處理完畢（測試與關機時使用）。"""
+        self._queue.join()
+
+    def stats(self):
+        with self._stats_lock:
+            done = self.processed + self.failed
+            return {
+                "depth": self._queue.qsize(),
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / done if done else 0.0,
+                "max_wait": self.max_wait,
+            }
+
+    def _run(self):
+        while True:
+            enqueued_at, event = self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            try:
+                self.process(event)
+                ok = True
+            except Exception as e:
+                ok = False
+                logger.error(f"處理 webhook 事件時發生錯誤: {str(e)}")
+            finally:
+                with self._stats_lock:
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                    if ok:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                self._queue.task_done()